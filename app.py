@@ -1,5 +1,55 @@
+import io
+import tempfile
+import time
+
 import streamlit as st
 
+from batch import complete_records, iter_batch_prompts, select_card_ids, write_jsonl, write_zip
+from cache import cache_stats, content_hash
+from chunked import (
+    assemble_article,
+    merge_sections,
+    render_step8_stitch,
+    render_step9_merge,
+    step8_section_records,
+    step9_section_records,
+)
+from gkp import DEFAULT_TOP_K, GKP_MAX_CHARS, compact_gkp, gkp_clusters
+from history import SECTION_ADDED, SECTION_REMOVED
+from keywords import canonical, compact_keyword_text
+from llm import DEFAULT_BASE_URL, DEFAULT_CONCURRENCY, DEFAULT_MODEL, AsyncLLMClient, LLMConfig, LLMError, LoopThread
+from links import LinkIndex
+from overlap import KeywordIndex, format_overlaps
+from packet import ProjectPacket
+from prompts import (
+    ARTICLE_CARD,
+    PACKET_SCOPE_FULL,
+    PACKET_SCOPE_STEP,
+    PROJECT_PACKET_TEMPLATE,
+    PROMPT_LAYOUT_PREFIX,
+    PROMPT_LAYOUT_STEP,
+    STEP_PACKET_SECTIONS,
+    STEPS,
+    resolve_packet,
+)
+from qa import check_draft, format_report
+from responses import ResponseCache
+from revision import diff_revision, diff_text, summarize, update_revision_log
+from samples import DEFAULT_SAMPLE_BUDGET, SAMPLE_MODE_FULL, SAMPLE_MODE_REPRESENTATIVE, build_samples, read_upload
+from serp import KIND_SERP, capture_uploads, competitor_table
+from store import DEFAULT_PROJECT, DOC_PACKET, DOC_VOICE_BANK, ProjectStore
+from titles import TitleIndex, backlog_titles, compact_titles, near_duplicate_groups, replace_backlog
+from tokens import (
+    BUDGET_PLACEHOLDER,
+    BUDGET_TRUNCATE,
+    estimate_tokens,
+    format_token_report,
+    prefix_stability,
+    render_within_budget,
+)
+from voice import compact_voice_bank, voice_context_block
+from writeback import check_packet_block, extract_packet_block, merge_packet
+
 # ==========================================
 # 1. Page config
 # ==========================================
@@ -49,111 +99,167 @@ st.markdown(
 )
 
 # ==========================================
-# 3. Steps & Templates
+# 3. Navigation + Projects
 # ==========================================
-STEPS = [
-    "Step 1: 專案摘要 (Project Log) 建立",
-    "Step 1.5: Persona/Voice 建模（寫入封包，可選）",
-    "Step 2: SEO 任務目標 → 主題發想（寫入封包）",
-    "Step 3: 關鍵字候選清單 (Pre-GKP)",
-    "Step 4: GKP 數據決策 (Post-GKP)（寫入封包）",
-    "Step 5: 搜尋意圖 Deep Research（寫入封包）",
-    "Step 6: 文章標題生成（寫入封包：Backlog/文章卡）",
-    "Step 7: 文章大綱（更新指定文章卡）",
-    "Step 8: 文章撰寫 + 技術 SEO（更新指定文章卡）",
-    "Step 9: 改稿（Revision）+ 變更紀錄（寫入封包）",
-]
-
-PROJECT_PACKET_TEMPLATE = """【PROJECT PACKET v1 | LIGHT】
-
-=== [SOURCE NOTE | OPTIONAL] ===
-- 原始資料類型：LP / 產品說明 / 白皮書 / Notion / Google Doc（擇一或多）
-- 開新對話是否需要重貼原始資料：是（建議）
-- 備註：本封包只存「決策與狀態」。原始資料可在需要時於新對話重新貼上。
-=== [/SOURCE NOTE] ===
-
-=== [PROJECT LOG | EDITABLE] ===
-- 產品/計畫一句話總結：
-- 目標客群（Persona）：
-- 核心價值主張（3–5點）：
-- 痛點（3–5點）：
-- 內容缺口（Information Gaps）：
-- SEO 任務目標（必填）：
-- 品牌語氣/禁忌/限制條件（必填，未知可寫「未指定」）：
-=== [/PROJECT LOG] ===
-
-=== [VOICE CONTEXT | EDITABLE] ===
-[PERSONA LOG]
-- 作者世界觀一句話：
-- 對讀者的定位（上對下/並肩/挑釁/對話）：
-- 核心信念/價值觀（3–7條）：
-- 動機邊界（他為什麼寫、他不做什麼）：
-- 允許的模糊與留白（哪些可以不講死）：
-- 禁語/禁套路（含理由）：
-
-[VOICE SPEC]
-- tone_mix（%）：冷靜__ / 犀利__ / 幽默__ / 溫度__
-- sentence_rhythm：短句比例__%；每段__–__行；轉折頻率__
-- stance_rules：如何下結論/如何留白/如何反問
-- lexical_rules：常用詞/避免詞/禁詞
-- structure_rules：常用推理順序（例：現象→對照→推論→選項）
-- do_not：絕對禁止事項
-- sample_lines（<=5句，每句<=25字）：
-=== [/VOICE CONTEXT] ===
-
-=== [STRATEGY LOG | EDITABLE] ===
-- Primary Keyword（含GKP數據與理由）：
-- Secondary Keywords：
-- Supporting Keywords：
-- SERP/Intent 洞察摘要（Winning Angle）：
-- 差異化切入點（降維打擊角度）：
-- 排除與不做（Avoid List）：
-=== [/STRATEGY LOG] ===
-
-=== [CONTENT QUEUE | EDITABLE] ===
-[Backlog Titles | one per line]
-- （每行一個標題）
-
-[Article Cards]
-- 文章ID：A01
-  - 標題：
-  - Primary/Secondary/Supporting：
-  - Winning Angle：
-  - 大綱（H1/H2/H3）：
-  - 字數：
-  - CTA：
-  - Meta Title/Meta Desc/Schema：
-  - 產出備註/連結：
-=== [/CONTENT QUEUE] ===
-
-=== [REVISION LOG | EDITABLE] ===
-- 本次改稿文章ID：
-- 客戶回饋摘要（1–5點）：
-- 修改清單 Must / Should / Could：
-- 已採納（含理由摘要）：
-- 未採納（含理由摘要）：
-- 版本紀錄（v1→v2 差異一句話）：
-- 需要同步更新 VOICE CONTEXT 嗎？（是/否；若是，列出更新條款）：
-=== [/REVISION LOG] ===
-"""
-
-def get_value(input_val, placeholder_text):
-    if input_val is not None and str(input_val).strip():
-        return str(input_val).strip()
-    return f"[{placeholder_text}]"
+# Inputs saved per project. Their defaults are set in section 4 rather than
+# via value=, so values restored from the store never clash with them.
+INPUT_DEFAULTS = {
+    "s15_budget": DEFAULT_SAMPLE_BUDGET,
+    "s3_dedupe": False,
+    "s4_rank": True,
+    "s4_top_k": DEFAULT_TOP_K,
+    "s4_dedupe": True,
+    "s8_word": "1500 字",
+    "s8_cta": "免費試用：https://example.com",
+    "s8_chunked": False,
+    "r_chunked": False,
+    "voice_compact": False,
+    "llm_base_url": DEFAULT_BASE_URL,
+    "llm_model": DEFAULT_MODEL,
+    "llm_concurrency": DEFAULT_CONCURRENCY,
+    "llm_temperature": 0.7,
+}
+PERSISTED_INPUTS = (
+    "current_article_id", "current_title", "packet_scope", "prompt_layout", "voice_compact", "token_budget", "budget_strategy",
+    "s1_source", "s15_paste", "s15_notes", "s15_mode", "s15_budget", "s2_goal",
+    "s3_topics", "s3_dedupe", "s4_gkp", "s4_rank", "s4_top_k", "s4_dedupe", "s5_kw", "s6_hint",
+    "s7_source", "s8_word", "s8_cta", "s8_extra", "s8_source", "s8_chunked",
+    "r_original", "r_client", "r_editor", "r_constraints", "r_revised", "r_chunked",
+    "llm_base_url", "llm_model", "llm_concurrency", "llm_temperature",
+)
 
 def go_to_step(step_index: int):
     if 0 <= step_index < len(STEPS):
         st.session_state.nav_radio = STEPS[step_index]
 
+# One store per server process, shared by every session.
+@st.cache_resource
+def project_store() -> ProjectStore:
+    return ProjectStore()
+
+def load_project():
+    store = project_store()
+    project_id = st.session_state.project_id
+    for key in PERSISTED_INPUTS + ("packet_index", "history_version", "keyword_index", "link_index", "title_index"):
+        st.session_state.pop(key, None)
+    st.session_state.update(store.inputs(project_id))
+    st.session_state.project_packet = store.document(project_id, DOC_PACKET) or PROJECT_PACKET_TEMPLATE
+    st.session_state.voice_bank = store.document(project_id, DOC_VOICE_BANK) or ""
+
+def create_project():
+    project_id = (st.session_state.new_project_id or "").strip()
+    if project_id:
+        st.session_state.project_id = project_store().ensure_project(project_id)
+        load_project()
+
+def save_voice_bank():
+    project_store().save_document(st.session_state.project_id, DOC_VOICE_BANK, st.session_state.voice_bank)
+
+def save_step_inputs():
+    values = {key: st.session_state[key] for key in PERSISTED_INPUTS if key in st.session_state}
+    project_store().save_inputs(st.session_state.project_id, values)
+
+def clear_voice_bank():
+    st.session_state.voice_bank = ""
+    save_voice_bank()
+
+# The event loop and its pooled connections live for the whole process;
+# a client is kept per endpoint/key/model/concurrency setting, and all of
+# them share one on-disk response cache.
+@st.cache_resource
+def llm_loop() -> LoopThread:
+    return LoopThread()
+
+@st.cache_resource
+def response_cache() -> ResponseCache:
+    return ResponseCache()
+
+@st.cache_resource
+def llm_client(base_url: str, api_key: str, model: str, temperature: float, concurrency: int) -> AsyncLLMClient:
+    return AsyncLLMClient(LLMConfig(
+        base_url=base_url, api_key=api_key, model=model, temperature=temperature, concurrency=concurrency
+    ), response_cache())
+
+def session_llm_client() -> AsyncLLMClient:
+    return llm_client(
+        st.session_state.llm_base_url,
+        st.session_state.get("llm_api_key") or LLMConfig().api_key,
+        st.session_state.llm_model,
+        float(st.session_state.llm_temperature),
+        int(st.session_state.llm_concurrency)
+    )
+
+# Editing the shared article ID/title only reruns this fragment; steps pick
+# the new values up from session_state on their next run.
+@st.fragment
+def article_controls():
+    st.subheader("🧩 文章卡控制（跨步驟共用）")
+    st.text_input("目前要更新的文章ID（例：A01）", key="current_article_id")
+    st.text_input("目前文章標題（可選填，讓 Step7/8 更穩）", key="current_title")
+
+def restore_packet_version(number: int):
+    st.session_state.project_packet = project_store().history(st.session_state.project_id).checkout(number)
+    st.session_state.packet_note = f"回復至 v{number}"
+
+# Browsing versions and diffs reruns only this fragment; a rollback reruns
+# the whole app so the sidebar packet and every step pick it up.
+@st.fragment
+def packet_history_panel():
+    history = project_store().history(st.session_state.project_id)
+    stats = history.stats()
+    st.caption(
+        f"{stats['versions']} 個版本；以區塊差異壓縮儲存 {stats['stored_bytes']:,} bytes"
+        f"（完整複本約 {stats['raw_chars']:,} 字）"
+    )
+    head = history.head.number
+    number = st.selectbox(
+        "版本",
+        list(range(head, 0, -1)),
+        format_func=lambda n: f"v{n} · {time.strftime('%m/%d %H:%M', time.localtime(history.version(n).created))}"
+                              f" · {history.version(n).note}",
+        key="history_version"
+    )
+    # The head is compared with its predecessor, older versions with the head.
+    base = number - 1 if number == head else number
+    if base < 1:
+        st.caption("這是第一個版本。")
+    else:
+        diffs = history.diff(base, head)
+        st.caption(f"v{base} → v{head}：{len(diffs)} 個區塊有變動")
+        labels = {SECTION_ADDED: "新增", SECTION_REMOVED: "刪除"}
+        for d in diffs:
+            st.markdown(f"**{d.name}**（{labels.get(d.status, '修改')}）")
+            st.code(d.diff, language="diff")
+    if st.button(
+        "↩️ 回復到此版本",
+        on_click=restore_packet_version,
+        args=(number,),
+        key="history_restore",
+        disabled=number == head
+    ):
+        st.rerun()
+
 # ==========================================
 # 4. Init session defaults
 # ==========================================
+# The project (and everything saved with it) is loaded lazily: only the
+# project this session opens is read from the store.
+store = project_store()
+st.session_state.setdefault("project_id", store.ensure_project(st.query_params.get("project", DEFAULT_PROJECT)))
+project_id = st.session_state.project_id
+for key, value in store.inputs(project_id).items():
+    st.session_state.setdefault(key, value)
 st.session_state.setdefault("nav_radio", STEPS[0])
-st.session_state.setdefault("project_packet", PROJECT_PACKET_TEMPLATE)
+st.session_state.setdefault("project_packet", store.document(project_id, DOC_PACKET) or PROJECT_PACKET_TEMPLATE)
 st.session_state.setdefault("current_article_id", "A01")
 st.session_state.setdefault("current_title", "")
-st.session_state.setdefault("voice_bank", "")
+st.session_state.setdefault("voice_bank", store.document(project_id, DOC_VOICE_BANK) or "")
+st.session_state.setdefault("packet_scope", PACKET_SCOPE_FULL)
+st.session_state.setdefault("prompt_layout", PROMPT_LAYOUT_STEP)
+st.session_state.setdefault("token_budget", 0)
+st.session_state.setdefault("budget_strategy", BUDGET_TRUNCATE)
+for key, value in INPUT_DEFAULTS.items():
+    st.session_state.setdefault(key, value)
 
 # ==========================================
 # 5. Sidebar: Navigation + Packet + Voice Bank
@@ -161,6 +267,14 @@ st.session_state.setdefault("voice_bank", "")
 with st.sidebar:
     st.title("⚡ SEO 戰略中控")
 
+    st.subheader("🗂️ 專案")
+    st.selectbox("目前專案", store.projects(), key="project_id", on_change=load_project)
+    with st.form("new_project_form", border=False, clear_on_submit=True):
+        st.text_input("新專案 ID", key="new_project_id", placeholder="例：acme-blog")
+        st.form_submit_button("➕ 建立並切換", on_click=create_project)
+
+    st.divider()
+
     st.subheader("📍 步驟導覽")
     selected_step = st.radio(
         "選擇當前進度：",
@@ -174,93 +288,361 @@ with st.sidebar:
     st.subheader("🧳 Project Packet（輕封包）")
     st.info("封包只保存「決策與狀態」。原始資料需要時再貼；不要把原文硬塞進封包。")
 
-    project_packet = st.text_area(
-        "目前封包內容（建議保持為單一可複製區塊）",
-        height=360,
-        key="project_packet"
+    # Large text areas live in forms: typing does not rerun the page,
+    # the prompt is rebuilt only when the user presses "套用".
+    with st.form("packet_form", border=False):
+        st.text_area(
+            "目前封包內容（建議保持為單一可複製區塊）",
+            height=360,
+            key="project_packet"
+        )
+        st.form_submit_button("✅ 套用封包", type="primary")
+    project_packet = st.session_state.project_packet
+    packet_index = st.session_state.get("packet_index")
+    packet_version = None if packet_index is None else packet_index.version
+    if packet_index is None:
+        packet_index = st.session_state.packet_index = ProjectPacket(project_packet)
+    packet_index.update(project_packet)
+    st.caption(f"已索引 {len(packet_index.sections)} 個區塊、{len(packet_index.cards)} 張文章卡")
+    # Only a packet this session changed is recorded; other sessions on the
+    # same project keep their own edits until they apply them.
+    if packet_index.version != packet_version:
+        packet_history = store.history(project_id)
+        note = st.session_state.pop("packet_note", "套用封包" if packet_history.head else "初始封包")
+        if packet_history.commit(packet_index, note) is not None:
+            store.save_document(project_id, DOC_PACKET, packet_index.text)
+            store.save_history(project_id)
+    with st.expander("🕘 封包版本紀錄（可比較 / 回復）"):
+        packet_history_panel()
+    packet_scope = st.radio(
+        "Prompt 內嵌封包範圍",
+        [PACKET_SCOPE_FULL, PACKET_SCOPE_STEP],
+        format_func=lambda s: "完整封包" if s == PACKET_SCOPE_FULL else "只嵌入本步驟相關區塊/文章卡",
+        key="packet_scope",
+        horizontal=True
+    )
+    st.radio(
+        "Prompt 版面",
+        [PROMPT_LAYOUT_STEP, PROMPT_LAYOUT_PREFIX],
+        format_func=lambda s: "各步驟原始順序" if s == PROMPT_LAYOUT_STEP else "共用前綴（利於 LLM 端 Prompt 快取）",
+        key="prompt_layout",
+        horizontal=True,
+        help="共用前綴：Voice Bank 與封包固定放在最前面，步驟之間逐字相同；搭配「完整封包」效果最好。"
     )
-    project_packet_val = get_value(project_packet, "尚未建立封包")
+    token_budget = st.number_input("Token 預算（0 = 不限制）", min_value=0, step=1000, key="token_budget")
+    budget_strategy = st.radio(
+        "超出預算時",
+        [BUDGET_TRUNCATE, BUDGET_PLACEHOLDER],
+        format_func=lambda s: "截斷（保留頭尾）" if s == BUDGET_TRUNCATE else "以摘要佔位取代",
+        key="budget_strategy",
+        horizontal=True
+    )
+
+    with st.expander("🤖 LLM 端點（OpenAI 相容 API）"):
+        st.text_input("Base URL", key="llm_base_url")
+        st.text_input("Model", key="llm_model")
+        st.text_input("API Key（留空則用環境變數 OPENAI_API_KEY；不存檔）", type="password", key="llm_api_key")
+        st.number_input("最大並行數", min_value=1, max_value=64, key="llm_concurrency")
+        st.slider("Temperature", min_value=0.0, max_value=2.0, step=0.1, key="llm_temperature")
+        st.checkbox("略過回覆快取（重新產生，並覆寫快取）", key="llm_bypass_cache")
 
     st.divider()
 
     st.subheader("🎛️ Voice Bank（全流程外掛）")
     st.info("你已整理好的語感/價值觀/寫作規則可貼在這。只要這裡有內容，所有步驟都會優先採用。")
-    voice_bank = st.text_area(
-        "Voice Bank（PERSONA LOG / VOICE SPEC / 禁語 / 範例句等）",
-        height=260,
-        key="voice_bank",
-        placeholder="貼上你的語感規則（可長）。建議用條列/小標題，便於AI穩定引用。"
-    )
+    with st.form("voice_bank_form", border=False):
+        st.text_area(
+            "Voice Bank（PERSONA LOG / VOICE SPEC / 禁語 / 範例句等）",
+            height=260,
+            key="voice_bank",
+            placeholder="貼上你的語感規則（可長）。建議用條列/小標題，便於AI穩定引用。"
+        )
+        st.form_submit_button("✅ 套用 Voice Bank", type="primary", on_click=save_voice_bank)
 
     colvb1, colvb2 = st.columns([1, 1])
     with colvb1:
-        if st.button("清空 Voice Bank"):
-            st.session_state.voice_bank = ""
+        st.button("清空 Voice Bank", on_click=clear_voice_bank)
     with colvb2:
         st.caption("（此版本不自動改封包；由 AI 在輸出時寫回封包 VOICE CONTEXT）")
 
+    st.checkbox(
+        "本地精簡合併 Voice Bank（去重 + 與封包 VOICE CONTEXT 的衝突先處理）",
+        key="voice_compact",
+        help="Prompt 內改放合併後的語感規格；衝突以 VOICE BANK 為準並列在規格末尾，LLM 不必再逐次比對。"
+    )
+    if st.session_state.voice_compact and st.session_state.voice_bank.strip():
+        spec, merge = compact_voice_bank(st.session_state.voice_bank, voice_context_block(st.session_state.packet_index))
+        st.caption(
+            f"Voice Bank {merge.bank_rules} 條 + 封包 {merge.context_rules} 條 → {merge.merged_rules} 條"
+            f"（去重 {merge.duplicates}，衝突 {len(merge.conflicts)}，相反未合併 {len(merge.opposed)}）；"
+            f"≈ {estimate_tokens(st.session_state.voice_bank):,} → {estimate_tokens(spec):,} tokens"
+        )
+        with st.expander("合併後語感規格"):
+            st.code(spec, language="markdown")
+
     st.divider()
 
-    st.subheader("🧩 文章卡控制（跨步驟共用）")
-    current_article_id = st.text_input(
-        "目前要更新的文章ID（例：A01）",
-        value=st.session_state.get("current_article_id", "A01"),
-        key="current_article_id"
-    )
-    current_title = st.text_input(
-        "目前文章標題（可選填，讓 Step7/8 更穩）",
-        value=st.session_state.get("current_title", ""),
-        key="current_title"
-    )
+    article_controls()
+
+    st.divider()
+
+    with st.expander("🧮 快取狀態（跨 session 共用）"):
+        for cache_name, stats in cache_stats().items():
+            st.caption(
+                f"{cache_name}：命中率 {stats['hit_rate']:.0%}"
+                f"（{stats['hits']}/{stats['hits'] + stats['misses']}），{stats['entries']} 筆"
+            )
+        stats = response_cache().stats()
+        st.caption(
+            f"LLM 回覆（磁碟）：命中率 {stats['hit_rate']:.0%}"
+            f"（{stats['hits']}/{stats['hits'] + stats['misses']}），{stats['entries']} 筆，"
+            f"{stats['size'] / 1e6:.1f}/{stats['max_size'] / 1e6:.0f}M 字"
+        )
+        st.button("清空 LLM 回覆快取", on_click=response_cache().clear)
 
 # ==========================================
-# 6. Prompt building blocks
+# 6. Prompt rendering (packet scope + token budget)
 # ==========================================
-def state_reference_block(packet: str) -> str:
-    return f"""【狀態參考（非輸出對象）】
-以下內容僅供你理解目前狀態；本回合「主要產出」不是重寫這份文件：
-{packet}
-"""
-
-def voice_bank_block(voice_bank_text: str) -> str:
-    vb = (voice_bank_text or "").strip()
-    if not vb:
-        return "【VOICE BANK（外掛語感資產）】（未提供）"
-    return f"""【VOICE BANK（外掛語感資產｜優先於封包 VOICE CONTEXT）】
-{vb}
-"""
-
-def voice_priority_rules() -> str:
-    return """【語感優先規則（必讀）】
-- 若 VOICE BANK 有內容：視為最高優先語感規格（高於封包內 VOICE CONTEXT）。
-- 若 VOICE BANK 與封包 VOICE CONTEXT 衝突：先輸出「衝突點 + 合併策略」（<=8行），再進行主要任務。
-- 完成本回合後：若 VOICE BANK 有內容，請把「合併後最終版本」寫回封包 VOICE CONTEXT。
-"""
-
-def state_output_rules() -> str:
-    return """【狀態更新輸出規則（只針對 Project Packet）】
-- 請在「主要產出」完成後，再輸出一個獨立的 Markdown code block。
-- 該 code block 只能包含「完整最新版 PROJECT PACKET v1 | LIGHT」。
-- 禁止把正文/表格/清單塞進 code block。
-"""
-
-def no_codeblock_main_output_rules() -> str:
-    return """【主要產出輸出規則】
-- 主要產出請直接輸出（不要包在任何 code block）。
-- 可以使用一般 Markdown 標題/段落/表格，但不要用 ``` 包起來。
-"""
+# Read everything from session_state: step panels are fragments and may rerun
+# without the sidebar code above being executed again.
+def keyword_index() -> KeywordIndex:
+    # Re-indexes only the cards whose text changed since the last rerun.
+    index = st.session_state.setdefault("keyword_index", KeywordIndex())
+    index.sync(st.session_state.packet_index)
+    return index
+
+def link_index() -> LinkIndex:
+    # Only changed cards are re-vectorized; see links.py.
+    index = st.session_state.setdefault("link_index", LinkIndex())
+    index.sync(st.session_state.packet_index)
+    return index
+
+def title_index() -> TitleIndex:
+    # SimHash fingerprints of the Backlog titles; only new titles are hashed.
+    return st.session_state.setdefault("title_index", TitleIndex())
+
+def backlog_duplicates(packet) -> tuple:
+    titles = backlog_titles(packet)
+    return titles, near_duplicate_groups(titles, title_index())
+
+def format_title_group(titles: list, group: list) -> str:
+    return " ≈ ".join(f"「{titles[i]}」" for i in group)
+
+def compact_backlog():
+    titles, groups = backlog_duplicates(st.session_state.packet_index)
+    if groups:
+        st.session_state.project_packet = replace_backlog(st.session_state.packet_index, compact_titles(titles, groups))
+        st.session_state.packet_note = "精簡 Backlog 近似標題"
+
+def related_cards(article_id: str) -> str:
+    index = link_index()
+    related = index.format_related(index.related(article_id))
+    if related:
+        with st.expander("🔗 站內相關文章（內鏈候選，已附在 Prompt 中）"):
+            st.markdown(related)
+    return related
+
+def prompt_voice_bank() -> str:
+    if not st.session_state.get("voice_compact"):
+        return st.session_state.voice_bank
+    spec, _ = compact_voice_bank(st.session_state.voice_bank, voice_context_block(st.session_state.packet_index))
+    return spec
+
+def build_prompt(step_index: int, **inputs) -> str:
+    token_budget = int(st.session_state.get("token_budget") or 0)
+    prompt, report = render_within_budget(
+        step_index,
+        st.session_state.packet_index,
+        prompt_voice_bank(),
+        budget=token_budget,
+        strategy=st.session_state.budget_strategy,
+        packet_scope=st.session_state.packet_scope,
+        layout=st.session_state.prompt_layout,
+        **inputs
+    )
+    st.caption(format_token_report(report, token_budget))
+    prefix_report(step_index, prompt)
+    if token_budget and report["total"] > token_budget:
+        st.warning("已壓縮所有可壓縮區塊，Prompt 仍超出 token 預算。")
+    save_step_inputs()
+    st.session_state.setdefault("built_prompts", {})[step_index] = prompt
+    return prompt
+
+def prefix_report(step_index: int, prompt: str):
+    # Compare against the last *different* prompt built, so plain reruns keep the report.
+    last = st.session_state.get("last_prompt")
+    if last is None or last[1] != prompt:
+        if last is not None:
+            st.session_state.prefix_stability = (last[0], prefix_stability(last[1], prompt))
+        st.session_state.last_prompt = (step_index, prompt)
+    if "prefix_stability" not in st.session_state:
+        return
+    previous_step, stability = st.session_state.prefix_stability
+    st.caption(
+        f"前綴穩定度：與上一個 Prompt（{STEPS[previous_step].split(':')[0]}）逐字相同的開頭"
+        f" ≈ {stability['tokens']:,} / {stability['total_tokens']:,} tokens（{stability['ratio']:.0%}），"
+        "可被 LLM 端 Prompt 快取重用。"
+    )
+
+def batch_export(step_index: int, **shared_inputs):
+    with st.expander("📦 批次產生：每張文章卡各一份 Prompt（JSONL / ZIP）"):
+        card_filter = st.text_input(
+            "文章卡篩選（留空 = 全部；例：A01-A20, B*）",
+            key=f"batch{step_index}_filter"
+        )
+        fmt = st.radio("輸出格式", ["jsonl", "zip"], horizontal=True, key=f"batch{step_index}_fmt")
+        article_ids = select_card_ids(st.session_state.packet_index, card_filter)
+        st.caption(f"符合 {len(article_ids)} 張文章卡（標題/字數/CTA 依各卡內容帶入）")
+        col_export, col_execute = st.columns([1, 1])
+        with col_export:
+            export = st.button("產生批次檔", key=f"batch{step_index}_run", disabled=not article_ids)
+        with col_execute:
+            execute = st.button("▶️ 產生並並行送出到 LLM", key=f"batch{step_index}_execute", disabled=not article_ids)
+        if not (export or execute):
+            return
+        records = iter_batch_prompts(
+            step_index,
+            st.session_state.packet_index,
+            prompt_voice_bank(),
+            article_ids,
+            packet_scope=st.session_state.packet_scope,
+            budget=int(st.session_state.get("token_budget") or 0),
+            strategy=st.session_state.budget_strategy,
+            layout=st.session_state.prompt_layout,
+            **shared_inputs
+        )
+        if execute:
+            records = execute_batch(list(records))
+        # Stream prompts to disk one by one; only the finished file is read back.
+        with tempfile.TemporaryFile() as fp:
+            if fmt == "zip":
+                n = write_zip(records, fp)
+            else:
+                text = io.TextIOWrapper(fp, encoding="utf-8")
+                n = write_jsonl(records, text)
+                text.flush()
+                text.detach()
+            fp.seek(0)
+            st.download_button(
+                f"⬇️ 下載 {n} 份 Prompt" + ("與回覆" if execute else ""),
+                data=fp.read(),
+                file_name=f"step{step_index}_prompts.{fmt}",
+                mime="application/zip" if fmt == "zip" else "application/jsonl",
+                key=f"batch{step_index}_download"
+            )
+
+def execute_batch(records: list) -> list:
+    # Requests run on the background loop; this thread only polls for progress.
+    done = []
+    future = llm_loop().submit(
+        complete_records(
+            session_llm_client(),
+            records,
+            on_done=lambda i, result: done.append(i),
+            bypass_cache=bool(st.session_state.get("llm_bypass_cache"))
+        )
+    )
+    progress = st.progress(0.0, text=f"0 / {len(records)}")
+    while not future.done():
+        time.sleep(0.2)
+        progress.progress(len(done) / max(len(records), 1), text=f"{len(done)} / {len(records)}")
+    records = future.result()
+    failed = sum("error" in r for r in records)
+    progress.progress(1.0, text=f"完成 {len(records) - failed} / {len(records)}")
+    if failed:
+        st.warning(f"{failed} 張文章卡呼叫失敗（錯誤訊息寫在輸出檔的 error 欄位）。")
+    return records
+
+def run_step_prompt(step_index: int):
+    prompt = st.session_state.get("built_prompts", {}).get(step_index)
+    with st.expander("🤖 直接送出本步驟 Prompt 到 LLM（串流輸出）"):
+        if st.button("▶️ 送出", key="llm_run", disabled=not prompt):
+            try:
+                hits = response_cache().hits
+                stream = session_llm_client().stream(prompt, bool(st.session_state.get("llm_bypass_cache")))
+                response = st.write_stream(llm_loop().iterate(stream))
+            except LLMError as e:
+                st.error(f"LLM 呼叫失敗：{e}")
+                return
+            if response_cache().hits > hits:
+                st.caption("♻️ 相同 Prompt 與參數的回覆來自快取（側欄可勾選略過快取）。")
+            st.session_state.llm_response = (step_index, response)
+            # Hand the answer straight to the write-back form below.
+            st.session_state.writeback_response = response
+            if step_index == 8 and st.session_state.get("s8_chunk_result"):
+                # The stitched article is shown in the Step 8 panel above; rerun so it picks this answer up.
+                st.rerun()
+        elif st.session_state.get("llm_response", (None,))[0] == step_index:
+            st.markdown(st.session_state.llm_response[1])
+        else:
+            return
+        st.caption("回覆已帶入下方「回寫封包」，確認後按「解析並合併到封包」即可更新封包。")
+
+def show_clusters(clusters: list):
+    if not clusters:
+        return
+    variants = sum(len(c) - 1 for c in clusters)
+    with st.expander(f"🧩 已合併 {variants} 個近似變體（{len(clusters)} 組）"):
+        st.dataframe(
+            [{"代表": c.representative, "變體數": len(c) - 1, "成員": "、".join(c.members)} for c in clusters],
+            hide_index=True
+        )
+
+def apply_writeback(step_index: int):
+    partial = st.session_state.packet_scope == PACKET_SCOPE_STEP
+    block, truncated = extract_packet_block(st.session_state.get("writeback_response") or "")
+    check = check_packet_block(block, truncated, partial, step_index)
+    changed = []
+    if block is not None and (check.ok or st.session_state.get("writeback_force")):
+        # A step-scoped single-card step returns just that card; merge it card by card.
+        card_merge = partial and ARTICLE_CARD in STEP_PACKET_SECTIONS.get(step_index, ())
+        text, changed = merge_packet(st.session_state.packet_index, block, card_merge)
+        if changed:
+            before = {canonical(t) for t in backlog_titles(st.session_state.packet_index)}
+            titles, groups = backlog_duplicates(text)
+            for group in groups:
+                if any(canonical(titles[i]) not in before for i in group):
+                    check.warnings.append(f"新標題與 Backlog 既有標題近似：{format_title_group(titles, group)}")
+            st.session_state.project_packet = text
+            st.session_state.packet_note = f"LLM 回寫 · {STEPS[step_index]}"
+            st.session_state.writeback_response = ""
+    st.session_state.writeback_report = (check, changed)
+
+def packet_writeback(step_index: int):
+    with st.expander("📥 回寫封包：貼上 LLM 完整回覆，自動擷取封包 code block 並逐區塊合併"):
+        with st.form("writeback_form", border=False):
+            st.text_area(
+                "LLM 完整回覆",
+                height=200,
+                placeholder="整段貼上即可；只會取用最後一個含 === [區塊] === 標記的 code block。",
+                key="writeback_response"
+            )
+            st.checkbox("有錯誤時仍合併已完整的區塊", key="writeback_force")
+            st.form_submit_button("解析並合併到封包", on_click=apply_writeback, args=(step_index,))
+        report = st.session_state.pop("writeback_report", None)
+        if report is None:
+            return
+        check, changed = report
+        for error in check.errors:
+            st.error(error)
+        for warning in check.warnings:
+            st.warning(warning)
+        if changed:
+            st.success(f"已合併：{'、'.join(changed)}（可在側欄版本紀錄比較或回復）")
+        elif check.ok:
+            st.info("封包內容與目前版本相同，未變更。")
 
 # ==========================================
-# 7. Main
+# 7. Step panels
 # ==========================================
+# Each step's input/output columns is a fragment: typing in a step input
+# reruns only that panel, not the CSS, sidebar or navigation.
 
 # ------------------------------------------
-# Step 1
+# Step 1 panel
 # ------------------------------------------
-if selected_step == STEPS[0]:
-    st.markdown('<div class="main-header">✅ Step 1：專案摘要 (Project Log) 建立</div>', unsafe_allow_html=True)
-    st.caption("目標：用本回合原始資料萃取決策狀態，寫入封包（不保存原文）。")
-
+@st.fragment
+def step1_panel():
     col1, col2 = st.columns([1, 1])
 
     with col1:
@@ -275,52 +657,14 @@ if selected_step == STEPS[0]:
 
     with col2:
         st.markdown('<div class="sub-header">📤 複製 Prompt</div>', unsafe_allow_html=True)
-        source_val = get_value(p1_source, "內容貼在這裡")
-
-        prompt1 = f"""【本次主要產出】
-請先輸出「條列式解析結果」（不是封包、不是 code block）。
-
-{no_codeblock_main_output_rules()}
-
-【解析輸出格式】
-1. 一句話總結（What is it）
-2. 目標客群（Target User）
-3. 核心價值主張（Value Proposition）
-4. 使用者痛點（Pain Points）
-5. 目前內容缺口（Information Gaps）
-6. 推薦的 SEO 任務目標（若 Step2 會填，可先給建議版本）
-7. 品牌語氣/禁忌/限制條件（若未知寫「未指定」）
-
-────────────────────
-
-{state_reference_block(project_packet_val)}
-
-{voice_bank_block(st.session_state.voice_bank)}
-
-────────────────────
-
-【本回合原始資料（僅本回合參考，不要復誦原文，不要塞進封包）】
-{source_val}
-
-────────────────────
-
-【狀態更新任務】
-請把上述解析收斂後，更新封包 PROJECT LOG 對應欄位（只更新/補齊必要欄位）。
-
-{state_output_rules()}
-"""
+        prompt1 = build_prompt(0, source=p1_source)
         st.code(prompt1, language="markdown")
 
-    st.divider()
-    st.button("👉 前往下一步：Step 1.5", on_click=go_to_step, args=(1,), type="primary")
-
 # ------------------------------------------
-# Step 1.5（可選）
+# Step 1.5 panel
 # ------------------------------------------
-elif selected_step == STEPS[1]:
-    st.markdown('<div class="main-header">✅ Step 1.5：Persona/Voice 建模（寫入封包，可選）</div>', unsafe_allow_html=True)
-    st.caption("目標：同時使用『樣本文本』＋『你的筆記』建立語感。若你已在 Voice Bank 貼好語感，也可以跳過此步。")
-
+@st.fragment
+def step15_panel():
     col1, col2 = st.columns([1, 1])
 
     with col1:
@@ -347,89 +691,37 @@ elif selected_step == STEPS[1]:
             key="s15_notes"
         )
 
-        file_texts = []
-        if uploaded_files:
-            for f in uploaded_files:
-                try:
-                    content = f.read().decode("utf-8", errors="ignore")
-                except Exception:
-                    content = ""
-                if content.strip():
-                    file_texts.append(f"=== [FILE: {f.name}] ===\n{content.strip()}\n=== [/FILE] ===")
-        samples_combined = "\n\n".join(file_texts)
+        s15_mode = st.radio(
+            "上傳樣本嵌入方式",
+            [SAMPLE_MODE_FULL, SAMPLE_MODE_REPRESENTATIVE],
+            format_func=lambda m: "全文（每檔上限）" if m == SAMPLE_MODE_FULL else "代表性抽樣（跨檔挑段落）",
+            horizontal=True,
+            key="s15_mode"
+        )
+        s15_budget = st.number_input(
+            "抽樣字數上限",
+            min_value=1000,
+            step=1000,
+            key="s15_budget",
+            disabled=s15_mode != SAMPLE_MODE_REPRESENTATIVE
+        )
+        samples_combined = build_samples(uploaded_files, s15_mode, int(s15_budget or DEFAULT_SAMPLE_BUDGET))
 
     with col2:
         st.markdown('<div class="sub-header">📤 複製 Prompt</div>', unsafe_allow_html=True)
-
-        samples_val = get_value(samples_combined, "（未上傳）")
-        paste_val = get_value(s15_manual_text, "（未貼）")
-        notes_val = get_value(s15_notes, "（未填）")
-
-        prompt15 = f"""【本次主要產出】
-請先輸出「Persona Brief（可讀）」與「Voice Spec（可執行）」。（不是封包、不是 code block）
-
-{no_codeblock_main_output_rules()}
-
-【資料分層規則】
-- 「樣本文本」= 證據層，只能從這裡歸納語感特徵與慣用句法。
-- 「我的筆記」= 補充語境層，可校準 Persona；若與樣本衝突需指出並提出兩版。
-- 禁止把樣本文本原文塞進封包。
-
-{voice_priority_rules()}
-
-【主要產出格式】
-A) Persona Brief
-1. 作者世界觀一句話
-2. 對讀者的定位（上對下/並肩/挑釁/對話）
-3. 核心信念/價值觀（3–7條，句型化）
-4. 動機邊界（他為什麼寫、他不做什麼）
-5. 允許的模糊與留白
-6. 禁語/禁套路（含理由）
-
-B) Voice Spec（務必可操作）
-- tone_mix（%）：冷靜__ / 犀利__ / 幽默__ / 溫度__
-- sentence_rhythm：短句比例__%；每段__–__行；轉折頻率__
-- stance_rules：如何下結論/如何留白/如何反問
-- lexical_rules：常用詞/避免詞/禁詞
-- structure_rules：常用推理順序
-- do_not：絕對禁止事項
-- sample_lines：<=5句，每句<=25字（模仿用，非引用原文）
-
-────────────────────
-
-{state_reference_block(project_packet_val)}
-
-{voice_bank_block(st.session_state.voice_bank)}
-
-【樣本文本（證據層）｜上傳】
-{samples_val}
-
-【樣本文本（證據層）｜直接貼上】
-{paste_val}
-
-【我的筆記（補充語境層）】
-{notes_val}
-
-────────────────────
-
-【狀態更新任務】
-請把合併後的 PERSONA LOG + VOICE SPEC 寫回封包 VOICE CONTEXT。
-其他區塊不得更動。
-
-{state_output_rules()}
-"""
+        prompt15 = build_prompt(
+            1,
+            samples=samples_combined,
+            pasted=s15_manual_text,
+            notes=s15_notes,
+        )
         st.code(prompt15, language="markdown")
 
-    st.divider()
-    st.button("👉 前往下一步：Step 2", on_click=go_to_step, args=(2,), type="primary")
-
 # ------------------------------------------
-# Step 2
+# Step 2 panel
 # ------------------------------------------
-elif selected_step == STEPS[2]:
-    st.markdown('<div class="main-header">✅ Step 2：SEO 任務目標 → 主題發想（寫入封包）</div>', unsafe_allow_html=True)
-    st.caption("目標：先產出主題表格（主要產出），再把 SEO 任務目標寫回封包。Voice Bank 若有內容會自動納入。")
-
+@st.fragment
+def step2_panel():
     col1, col2 = st.columns([1, 1])
 
     with col1:
@@ -443,47 +735,14 @@ elif selected_step == STEPS[2]:
 
     with col2:
         st.markdown('<div class="sub-header">📤 複製 Prompt</div>', unsafe_allow_html=True)
-        goal_val = get_value(p2_goal, "任務目標")
-
-        prompt2 = f"""【本次主要產出】
-請先輸出「Topic Clusters 表格」（不是封包、不是 code block）。
-
-{no_codeblock_main_output_rules()}
-
-【表格格式】
-| 主題方向 | 關鍵字類型 | 搜尋意圖類型 | 註解 |
-
-{voice_priority_rules()}
-
-────────────────────
-
-{state_reference_block(project_packet_val)}
-
-{voice_bank_block(st.session_state.voice_bank)}
-
-────────────────────
-
-【任務】
-1) 以上述封包 PROJECT LOG +（依語感優先規則採用的）VOICE CONTEXT 為前提，根據我提供的 SEO 任務目標產出 10–20 個 Topic Clusters（用表格）。
-2) 把「SEO 任務目標」寫回封包 PROJECT LOG 對應欄位。
-3) 若 VOICE BANK 有內容，請把合併後 VOICE CONTEXT 寫回封包。
-
-SEO 任務目標：{goal_val}
-
-{state_output_rules()}
-"""
+        prompt2 = build_prompt(2, goal=p2_goal)
         st.code(prompt2, language="markdown")
 
-    st.divider()
-    st.button("👉 前往下一步：Step 3", on_click=go_to_step, args=(3,), type="primary")
-
 # ------------------------------------------
-# Step 3
+# Step 3 panel
 # ------------------------------------------
-elif selected_step == STEPS[3]:
-    st.markdown('<div class="main-header">✅ Step 3：關鍵字候選清單 (Pre-GKP)</div>', unsafe_allow_html=True)
-    st.caption("目標：輸出 GKP 可用的逗號清單（主要產出），不更新封包。")
-
+@st.fragment
+def step3_panel():
     col1, col2 = st.columns([1, 1])
 
     with col1:
@@ -494,43 +753,21 @@ elif selected_step == STEPS[3]:
             placeholder="貼上 Step2 的主題表格或清單...",
             key="s3_topics"
         )
+        s3_dedupe = st.checkbox("合併近似關鍵字（空白 / 簡繁 / 詞序變體只保留一筆）", key="s3_dedupe")
+        if s3_dedupe and p3_topics:
+            p3_topics, s3_clusters = compact_keyword_text(p3_topics)
+            show_clusters(s3_clusters)
 
     with col2:
         st.markdown('<div class="sub-header">📤 複製 Prompt</div>', unsafe_allow_html=True)
-        topics_val = get_value(p3_topics, "主題清單")
-
-        prompt3 = f"""【本次主要產出】
-請直接輸出「GKP 專用關鍵字清單」。（不要 code block）
-
-{no_codeblock_main_output_rules()}
-
-【GKP 專用輸出格式（嚴格）】
-1) 純文字清單，關鍵字之間用英文逗號 (,) 分隔
-2) 不要編號、不要項目符號
-3) 每 10 個關鍵字一組，組與組之間空一行
-4) 務必包含 Seed Keywords + 長尾詞
-
-────────────────────
-
-{state_reference_block(project_packet_val)}
-
-{voice_bank_block(st.session_state.voice_bank)}
-
-主題清單：
-{topics_val}
-"""
+        prompt3 = build_prompt(3, topics=p3_topics)
         st.code(prompt3, language="markdown")
 
-    st.divider()
-    st.button("👉 前往下一步：Step 4", on_click=go_to_step, args=(4,), type="primary")
-
 # ------------------------------------------
-# Step 4
+# Step 4 panel
 # ------------------------------------------
-elif selected_step == STEPS[4]:
-    st.markdown('<div class="main-header">✅ Step 4：GKP 數據決策 (Post-GKP)（寫入封包）</div>', unsafe_allow_html=True)
-    st.caption("目標：先輸出決策分析（主要產出），再更新封包 STRATEGY LOG。")
-
+@st.fragment
+def step4_panel():
     col1, col2 = st.columns([1, 1])
 
     with col1:
@@ -541,51 +778,37 @@ elif selected_step == STEPS[4]:
             placeholder="直接貼上 GKP 表格或 CSV 文字...",
             key="s4_gkp"
         )
+        s4_file = st.file_uploader(
+            "或上傳 GKP 匯出檔（CSV / TSV，支援 UTF-16；有上傳時優先使用）",
+            type=["csv", "tsv", "txt"],
+            key="s4_file"
+        )
+        s4_rank = st.checkbox("本地預排序：只嵌入分數 Top-K 與彙總統計（適合數百列以上）", key="s4_rank")
+        s4_top_k = st.number_input(
+            "Top-K",
+            min_value=10,
+            max_value=500,
+            step=10,
+            key="s4_top_k",
+            disabled=not s4_rank
+        )
+        s4_dedupe = st.checkbox("合併近似關鍵字後再排序", key="s4_dedupe", disabled=not s4_rank)
+        gkp_text = read_upload(s4_file, GKP_MAX_CHARS) if s4_file is not None else p4_gkp
+        if s4_rank:
+            if s4_dedupe:
+                show_clusters(gkp_clusters(gkp_text or ""))
+            gkp_text = compact_gkp(gkp_text or "", int(s4_top_k or DEFAULT_TOP_K), bool(s4_dedupe))
 
     with col2:
         st.markdown('<div class="sub-header">📤 複製 Prompt</div>', unsafe_allow_html=True)
-        gkp_val = get_value(p4_gkp, "GKP 輸出資料")
-
-        prompt4 = f"""【本次主要產出】
-請先輸出「關鍵字策略決策分析」（不是封包、不是 code block）。
-
-{no_codeblock_main_output_rules()}
-
-【主要產出內容】
-1) 核心關鍵字 (Primary) - 含數據與理由
-2) 次要關鍵字 (Secondary) - 含用途
-3) 補充關鍵字 (Supporting)
-4) 策略邏輯說明（流量 vs 競爭度取捨）
-5) 後續 SERP 分析建議
-
-────────────────────
-
-{state_reference_block(project_packet_val)}
-
-{voice_bank_block(st.session_state.voice_bank)}
-
-GKP 數據：
-{gkp_val}
-
-────────────────────
-
-【狀態更新任務】
-把上述決策寫回封包 STRATEGY LOG 對應欄位。
-
-{state_output_rules()}
-"""
+        prompt4 = build_prompt(4, gkp=gkp_text)
         st.code(prompt4, language="markdown")
 
-    st.divider()
-    st.button("👉 前往下一步：Step 5", on_click=go_to_step, args=(5,), type="primary")
-
 # ------------------------------------------
-# Step 5
+# Step 5 panel
 # ------------------------------------------
-elif selected_step == STEPS[5]:
-    st.markdown('<div class="main-header">✅ Step 5：搜尋意圖 Deep Research（寫入封包）</div>', unsafe_allow_html=True)
-    st.caption("目標：先輸出 SERP/Intent 洞察（主要產出），再把 Winning Angle 等收斂寫回封包。")
-
+@st.fragment
+def step5_panel():
     col1, col2 = st.columns([1, 1])
 
     with col1:
@@ -596,62 +819,34 @@ elif selected_step == STEPS[5]:
             placeholder="例如：\nB群 什麼時候吃\nB群 空腹\n上班族 疲勞 補充品",
             key="s5_kw"
         )
+        s5_files = st.file_uploader(
+            "（可選）上傳存下的 SERP 頁 / 競品文章（HTML / TXT / MD，可多檔）",
+            type=["html", "htm", "txt", "md"],
+            accept_multiple_files=True,
+            key="s5_files"
+        )
+        serp_table = ""
+        if s5_files:
+            captures = capture_uploads(s5_files)
+            serp_table = competitor_table(captures, (p5_keywords or "").splitlines())
+            serps = sum(c.kind == KIND_SERP for c in captures)
+            st.caption(
+                f"已解析 {len(captures)} 個檔案（SERP {serps}、競品 {len(captures) - serps}），"
+                "依關鍵字壓縮成競品摘要表嵌入 Prompt；檔案依標題/H1 對應到上方關鍵字。"
+            )
+            with st.expander("競品摘要表"):
+                st.markdown(serp_table)
 
     with col2:
         st.markdown('<div class="sub-header">📤 複製 Prompt</div>', unsafe_allow_html=True)
-        kw_val = get_value(p5_keywords, "核心關鍵字")
-
-        prompt5 = f"""【本次主要產出】
-請先輸出「SERP/Intent 洞察報告」（不是封包、不是 code block）。
-
-{no_codeblock_main_output_rules()}
-
-【重要指令：必須使用瀏覽/搜索工具】
-- 需實際搜索 SERP 前 10–20 名，基於真實結果做觀察。
-- 不要憑空模擬。
-
-{voice_priority_rules()}
-
-【主要產出區塊】
-A) SERP 真實戰況（Explicit Intent）
-B) 隱性意圖（Implicit Intent）
-C) 情境化意圖（Contextual Intent）
-D) Deep Research 洞察（缺口/風險/降維打擊角度）
-E) Demand-Gen Intent（教育市場的新觀點）
-F) Intent Panorama（5–7 主軸 + Winning Angle）
-
-────────────────────
-
-{state_reference_block(project_packet_val)}
-
-{voice_bank_block(st.session_state.voice_bank)}
-
-關鍵字：
-{kw_val}
-
-────────────────────
-
-【狀態更新任務】
-請將你的結論「收斂」寫回封包 STRATEGY LOG：
-- SERP/Intent 洞察摘要（Winning Angle）
-- 差異化切入點（降維打擊角度）
-- 排除與不做（Avoid List）
-- 若 VOICE BANK 有內容：請把合併後 VOICE CONTEXT 寫回封包。
-
-{state_output_rules()}
-"""
+        prompt5 = build_prompt(5, keywords=p5_keywords, serp=serp_table)
         st.code(prompt5, language="markdown")
 
-    st.divider()
-    st.button("👉 前往下一步：Step 6", on_click=go_to_step, args=(6,), type="primary")
-
 # ------------------------------------------
-# Step 6
+# Step 6 panel
 # ------------------------------------------
-elif selected_step == STEPS[6]:
-    st.markdown('<div class="main-header">✅ Step 6：文章標題生成（寫入封包：Backlog/文章卡）</div>', unsafe_allow_html=True)
-    st.caption("目標：先輸出標題清單+分群（主要產出），再把 Backlog+文章卡寫回封包。")
-
+@st.fragment
+def step6_panel():
     col1, col2 = st.columns([1, 1])
 
     with col1:
@@ -663,68 +858,42 @@ elif selected_step == STEPS[6]:
             key="s6_hint"
         )
 
-    with col2:
-        st.markdown('<div class="sub-header">📤 複製 Prompt</div>', unsafe_allow_html=True)
-        hint_val = get_value(p6_hint, "（無）")
-
-        prompt6 = f"""【本次主要產出】
-請先輸出「標題清單 + 分群 + 寫作順序建議」（不是封包、不是 code block）。
-
-{no_codeblock_main_output_rules()}
+        conflicts = keyword_index().conflicts()
+        if conflicts:
+            st.warning(f"⚠️ 現有文章卡之間有 {len(conflicts)} 組關鍵字重疊（可能互相搶排名），已附在 Prompt 中。")
+            with st.expander("關鍵字重疊清單"):
+                st.markdown(format_overlaps(conflicts, limit=200))
 
-{voice_priority_rules()}
+        titles, groups = backlog_duplicates(st.session_state.packet_index)
+        if groups:
+            extra = sum(len(g) - 1 for g in groups)
+            st.warning(f"⚠️ Backlog {len(titles)} 個標題中有 {len(groups)} 組近似重複（可精簡掉 {extra} 個）。")
+            with st.expander("近似標題清單（保留每組第一個）"):
+                st.markdown("\n".join(f"- {format_title_group(titles, g)}" for g in groups[:200]))
+            st.button("🧹 精簡 Backlog（移除近似重複標題）", on_click=compact_backlog)
 
-【主要產出要求】
-1) 產出 15–25 個標題，分為：資訊型 / 比較型 / 行動導向型
-2) 將標題分成 3–5 個 Cluster
-3) 提供建議寫作順序（先 pillar 後 supporting）
-4) 建議每篇對應的 Primary/Secondary/Supporting（可粗分）
-
-────────────────────
-
-{state_reference_block(project_packet_val)}
-
-{voice_bank_block(st.session_state.voice_bank)}
-
-補充偏好（可選）：{hint_val}
-
-────────────────────
-
-【狀態更新任務】
-- 把全部標題寫回封包 CONTENT QUEUE -> [Backlog Titles]（每行一個）
-- 在封包 [Article Cards] 中至少建立 3 張文章卡（A01/A02/A03 或延續編號），每張先填：
-  - 文章ID
-  - 標題
-  - Primary/Secondary/Supporting
-  - Winning Angle（從 STRATEGY LOG 套用到各卡）
-- 若 VOICE BANK 有內容：請把合併後 VOICE CONTEXT 寫回封包。
-
-{state_output_rules()}
-"""
+    with col2:
+        st.markdown('<div class="sub-header">📤 複製 Prompt</div>', unsafe_allow_html=True)
+        prompt6 = build_prompt(6, hint=p6_hint, overlaps=format_overlaps(conflicts))
         st.code(prompt6, language="markdown")
 
-    st.divider()
-    st.button("👉 前往下一步：Step 7", on_click=go_to_step, args=(7,), type="primary")
-
 # ------------------------------------------
-# Step 7
+# Step 7 panel
 # ------------------------------------------
-elif selected_step == STEPS[7]:
-    st.markdown('<div class="main-header">✅ Step 7：文章大綱（更新指定文章卡）</div>', unsafe_allow_html=True)
-    st.caption("目標：先輸出大綱（主要產出），再只更新指定文章卡的大綱欄位。")
-
+@st.fragment
+def step7_panel():
     col1, col2 = st.columns([1, 1])
 
     with col1:
         st.markdown('<div class="sub-header">📥 指定文章</div>', unsafe_allow_html=True)
         p7_article_id = st.text_input(
             "要更新的文章ID（建議與側欄一致）",
-            value=current_article_id,
+            value=st.session_state.current_article_id,
             key="s7_aid"
         )
         p7_title = st.text_input(
             "標題（可留空，若封包該文章卡已有標題）",
-            value=current_title,
+            value=st.session_state.current_title,
             key="s7_title"
         )
         p7_source = st.text_area(
@@ -733,71 +902,44 @@ elif selected_step == STEPS[7]:
             placeholder="若這篇需要特定資料支撐，你可以貼片段或要點...",
             key="s7_source"
         )
+        overlaps = keyword_index().overlaps(p7_article_id)
+        if overlaps:
+            st.warning(
+                f"⚠️ {p7_article_id} 有 {len(overlaps)} 個關鍵字也是其他文章卡的目標，已附在 Prompt 中：\n\n"
+                + format_overlaps(overlaps, limit=10)
+            )
+        related = related_cards(p7_article_id)
 
     with col2:
         st.markdown('<div class="sub-header">📤 複製 Prompt</div>', unsafe_allow_html=True)
-        aid_val = get_value(p7_article_id, "A01")
-        title_val = get_value(p7_title, "（若封包該卡已有標題可留空）")
-        s7_source_val = get_value(p7_source, "（無）")
-
-        prompt7 = f"""【本次主要產出】
-請先輸出「文章大綱」。（不是封包、不是 code block）
-
-{no_codeblock_main_output_rules()}
-
-{voice_priority_rules()}
-
-【大綱要求】
-- 文章ID：{aid_val}
-- 若我提供標題：{title_val}，以此為準；若未提供，請使用封包該文章卡的標題。
-- 結構：H1/H2/H3
-- 每個 H2 必須對應明確使用者問題（對齊 STRATEGY LOG 的意圖洞察）
-- 另外輸出一小段「大綱邏輯解說」（約 5–8 行）
-
-────────────────────
-
-{state_reference_block(project_packet_val)}
-
-{voice_bank_block(st.session_state.voice_bank)}
-
-【本回合補充原始資料/要點（可選，僅本回合參考，不要復誦原文，不要塞進封包）】
-{s7_source_val}
-
-────────────────────
-
-【狀態更新任務】
-請在主要產出後，只更新封包中「文章ID：{aid_val}」那張文章卡：
-- 大綱（H1/H2/H3）
-- 產出備註/連結（放入大綱邏輯解說摘要）
-- 若 VOICE BANK 有內容：請把合併後 VOICE CONTEXT 寫回封包（其他區塊不動）。
-
-其他文章卡不得更動。
-
-{state_output_rules()}
-"""
+        prompt7 = build_prompt(
+            7,
+            article_id=p7_article_id,
+            title=p7_title,
+            source=p7_source,
+            overlaps=format_overlaps(overlaps),
+            related=related,
+        )
         st.code(prompt7, language="markdown")
 
-    st.divider()
-    st.button("👉 前往下一步：Step 8", on_click=go_to_step, args=(8,), type="primary")
+    batch_export(7, source=p7_source)
 
 # ------------------------------------------
-# Step 8
+# Step 8 panel
 # ------------------------------------------
-elif selected_step == STEPS[8]:
-    st.markdown('<div class="main-header">✅ Step 8：文章撰寫 + 技術 SEO（更新指定文章卡）</div>', unsafe_allow_html=True)
-    st.caption("目標：先輸出正文（主要產出），封包只存 meta/schema/checklist/摘要與後續行動（不存正文）。")
-
+@st.fragment
+def step8_panel():
     col1, col2 = st.columns([1, 1])
 
     with col1:
         st.markdown('<div class="sub-header">📥 寫作參數</div>', unsafe_allow_html=True)
         p8_article_id = st.text_input(
             "要撰寫的文章ID（建議與側欄一致）",
-            value=current_article_id,
+            value=st.session_state.current_article_id,
             key="s8_aid"
         )
-        p8_word = st.text_input("字數需求", value="1500 字", key="s8_word")
-        p8_cta = st.text_input("CTA 文案", value="免費試用：https://example.com", key="s8_cta")
+        p8_word = st.text_input("字數需求", key="s8_word")
+        p8_cta = st.text_input("CTA 文案", key="s8_cta")
         p8_extra = st.text_area(
             "補充寫作指示（口吻/禁語/一定要提的點）",
             height=140,
@@ -810,81 +952,84 @@ elif selected_step == STEPS[8]:
             placeholder="若要更準確，可貼支撐點/數據/產品規格/限制條款等...",
             key="s8_source"
         )
+        related = related_cards(p8_article_id)
+        p8_chunked = st.checkbox("分段撰寫（長文）：依文章卡大綱每個 H2 一份 Prompt 並行寫，再組合", key="s8_chunked")
 
     with col2:
         st.markdown('<div class="sub-header">📤 複製 Prompt</div>', unsafe_allow_html=True)
-        aid_val = get_value(p8_article_id, "A01")
-        word_val = get_value(p8_word, "1500字")
-        cta_val = get_value(p8_cta, "CTA")
-        extra_val = get_value(p8_extra, "（無）")
-        p8_source_val = get_value(p8_source, "（無）")
-
-        prompt8 = f"""【本次主要產出】
-請先輸出「完整文章正文」+「Meta Title/Meta Description」+「Schema 建議」+「技術SEO檢查清單」。
-注意：正文是主要產出，不是封包內容。
-
-{no_codeblock_main_output_rules()}
-
-{voice_priority_rules()}
-
-【寫作任務】
-- 文章ID：{aid_val}
-- 字數：{word_val}
-- CTA：{cta_val}
-- 補充指示：{extra_val}
-
-【主要產出要求】
-1) 完整文章正文（可用 # ## ### 作標題）
-2) Meta Title（<60字元）
-3) Meta Description（<160字元）
-4) Schema Markup 建議（條列）
-5) 技術 SEO 檢查清單（條列：內鏈建議、段落結構、FAQ、表格/清單使用點）
-
-────────────────────
-
-{state_reference_block(project_packet_val)}
-
-{voice_bank_block(st.session_state.voice_bank)}
-
-【本回合原始資料/事實要點（可選，僅本回合參考，不要復誦原文，不要塞進封包）】
-{p8_source_val}
-
-────────────────────
-
-【狀態更新任務（極重要：正文禁止寫入封包）】
-請在主要產出後，只更新封包中「文章ID：{aid_val}」那張文章卡，填入：
-- 字數：{word_val}
-- CTA：{cta_val}
-- Meta Title/Meta Desc/Schema：請把你剛剛產出的內容「精簡貼回」
-- 產出備註/連結：只存「可續寫摘要」與「後續行動」，例如：
-  - 本文核心結論 3 點（短句）
-  - FAQ 題目列表（只存題目）
-  - 內鏈建議（只存 anchor/指向的文章ID或主題）
-  - 下一篇文章建議（引用 Backlog/Article Cards）
-
-【硬性禁止條款】
-- 你不得把任何「正文段落」寫入 Project Packet。
-- 若你誤把正文寫入封包，視為不合格輸出。
-
-- 若 VOICE BANK 有內容：請把合併後 VOICE CONTEXT 寫回封包（其他區塊不動）。
-
-其他文章卡不得更動。
-
-{state_output_rules()}
-"""
-        st.code(prompt8, language="markdown")
+        if p8_chunked:
+            writing_chunks(p8_article_id, word=p8_word, cta=p8_cta, extra=p8_extra, source=p8_source, related=related)
+        else:
+            prompt8 = build_prompt(
+                8,
+                article_id=p8_article_id,
+                word=p8_word,
+                cta=p8_cta,
+                extra=p8_extra,
+                source=p8_source,
+                related=related,
+            )
+            st.code(prompt8, language="markdown")
+
+    # Batch export writes one whole-article prompt per card in either mode.
+    batch_export(8, word=p8_word, cta=p8_cta, extra=p8_extra, source=p8_source)
+
+def writing_chunks(article_id: str, word: str = "", cta: str = "", extra: str = "", source: str = "", related: str = ""):
+    h1, sections, stitch_words, records = step8_section_records(
+        st.session_state.packet_index, prompt_voice_bank(), article_id, word, cta, extra, source
+    )
+    if not records:
+        st.info(f"文章卡 {article_id} 的大綱沒有 H2（請先完成 Step 7 的 H1/H2/H3 大綱）。")
+        return
+    st.caption(
+        f"{len(records)} 個 H2 各一份 Prompt（共用同一段精簡脈絡），組合階段預留 {stitch_words} 字；"
+        f"最長一段 ≈ {max(estimate_tokens(r['prompt']) for r in records):,} tokens。"
+    )
+    for record, section in zip(records, sections):
+        words = f"（約 {section.words} 字）" if section.words else ""
+        with st.expander(f"段 {record['section']}：{record['heading']}{words}"):
+            st.code(record["prompt"], language="markdown")
+
+    key = content_hash(article_id, *(r["prompt"] for r in records))
+    if st.button(f"▶️ 並行送出 {len(records)} 段撰寫 Prompt", key="s8_chunk_run"):
+        records = execute_batch(records)
+        st.session_state.s8_chunk_result = (key, [(r.get("response") or "").strip() for r in records])
+
+    result = st.session_state.get("s8_chunk_result")
+    drafts = result[1] if result is not None and result[0] == key else []
+    if drafts:
+        missing = sum(not d for d in drafts)
+        st.success(f"已取得 {len(drafts) - missing} / {len(drafts)} 段草稿，已帶入下方組合 Prompt。")
+    stitch_prompt = render_step8_stitch(
+        resolve_packet(st.session_state.packet_index, 8, st.session_state.packet_scope, article_id),
+        prompt_voice_bank(),
+        article_id,
+        h1,
+        sections,
+        drafts,
+        word=word,
+        cta=cta,
+        extra=extra,
+        stitch_words=stitch_words,
+        related=related,
+        packet_scope=st.session_state.packet_scope,
+    )
+    st.markdown("**組合 Prompt（H1/前言、結語/CTA、Meta 與技術 SEO + 文章卡更新）**")
+    st.caption(f"≈ {estimate_tokens(stitch_prompt):,} tokens；下方「直接送出本步驟 Prompt」會送出這份。")
+    st.code(stitch_prompt, language="markdown")
+    save_step_inputs()
+    st.session_state.setdefault("built_prompts", {})[8] = stitch_prompt
 
-    st.divider()
-    st.success("✅ Step 8：封包不存正文，只存 meta/schema/checklist/摘要與可續寫索引。")
-    st.button("👉 前往下一步：Step 9", on_click=go_to_step, args=(9,), type="primary")
+    response = st.session_state.get("llm_response")
+    if drafts and response is not None and response[0] == 8:
+        with st.expander("📄 組合後全文（前言 + 各段草稿 + 結語）"):
+            st.code(assemble_article(drafts, response[1]), language="markdown")
 
 # ------------------------------------------
-# Step 9
+# Step 9 panel
 # ------------------------------------------
-elif selected_step == STEPS[9]:
-    st.markdown('<div class="main-header">✅ Step 9：改稿（Revision）+ 變更紀錄（寫入封包）</div>', unsafe_allow_html=True)
-    st.caption("目標：輸出改後全文（主要產出），封包只存：變更決策/採納與拒絕/版本差異/必要時更新 VOICE CONTEXT（不存全文）。")
-
+@st.fragment
+def step9_panel():
     col1, col2 = st.columns([1, 1])
 
     with col1:
@@ -892,7 +1037,7 @@ elif selected_step == STEPS[9]:
 
         r_article_id = st.text_input(
             "改稿文章ID（建議與側欄一致）",
-            value=current_article_id,
+            value=st.session_state.current_article_id,
             key="r_aid"
         )
 
@@ -923,73 +1068,270 @@ elif selected_step == STEPS[9]:
             placeholder="例：不得涉及醫療宣稱；不得提到競品；保留原 H2；字數 1200–1500...",
             key="r_constraints"
         )
+        r_chunked = st.checkbox("分段改稿（長文）：依 H2/H3 切段並行改寫，再合併成 v2", key="r_chunked")
 
     with col2:
         st.markdown('<div class="sub-header">📤 複製 Prompt</div>', unsafe_allow_html=True)
+        if r_chunked:
+            revision_chunks(
+                r_article_id,
+                r_original,
+                client=r_client,
+                editor=r_editor,
+                constraints=r_constraints,
+            )
+            return
+
+        prompt9 = build_prompt(
+            9,
+            article_id=r_article_id,
+            original=r_original,
+            client=r_client,
+            editor=r_editor,
+            constraints=r_constraints,
+        )
+        st.code(prompt9, language="markdown")
 
-        aid_val = get_value(r_article_id, "A01")
-        original_val = get_value(r_original, "原文貼在這裡")
-        client_val = get_value(r_client, "（無）")
-        editor_val = get_value(r_editor, "（無）")
-        constraints_val = get_value(r_constraints, "（無）")
+def revision_chunks(article_id: str, original: str, **inputs):
+    if not (original or "").strip():
+        st.info("先在左側貼上原文（v1）。")
+        return
+    sections, records = step9_section_records(
+        st.session_state.packet_index, prompt_voice_bank(), article_id, original, **inputs
+    )
+    st.caption(
+        f"切成 {len(sections)} 段；各段 Prompt 共用同一段脈絡（節選封包 + Voice Bank + 大綱），"
+        f"最長一段 ≈ {max(estimate_tokens(r['prompt']) for r in records):,} tokens。"
+    )
+    for record in records:
+        with st.expander(f"段 {record['section']}：{record['heading']}"):
+            st.code(record["prompt"], language="markdown")
+
+    key = content_hash(article_id, original, *(r["prompt"] for r in records))
+    if st.button(f"▶️ 並行送出 {len(records)} 段改稿 Prompt", key="r_chunk_run"):
+        records = execute_batch(records)
+        text, summaries = merge_sections(sections, [r.get("response") for r in records])
+        st.session_state.r_chunk_result = (key, summaries, sum("error" in r for r in records))
+        # The v2 box lives in another fragment; rerun the app so it shows the merged text.
+        st.session_state.r_revised = text
+        st.rerun()
+
+    result = st.session_state.get("r_chunk_result")
+    summaries = []
+    if result is not None and result[0] == key:
+        _, summaries, failed = result
+        st.success(f"已合併 {len(summaries)} 段為 v2（見下方「本地改稿差異」）。" + (f"{failed} 段失敗，保留原文。" if failed else ""))
+    local_diff = summarize(diff_revision(original, st.session_state.get("r_revised") or "")) if summaries else ""
+    merge_prompt = render_step9_merge(
+        resolve_packet(st.session_state.packet_index, 9, st.session_state.packet_scope, article_id),
+        prompt_voice_bank(),
+        article_id,
+        summaries,
+        local_diff,
+        packet_scope=st.session_state.packet_scope,
+    )
+    st.markdown("**合併 Prompt（Diff Summary + REVISION LOG 更新）**")
+    st.caption(f"≈ {estimate_tokens(merge_prompt):,} tokens；下方「直接送出本步驟 Prompt」會送出這份。")
+    st.code(merge_prompt, language="markdown")
+    save_step_inputs()
+    st.session_state.setdefault("built_prompts", {})[9] = merge_prompt
+
+def apply_revision_log():
+    diff = diff_revision(st.session_state.get("r_original") or "", st.session_state.get("r_revised") or "")
+    article_id = st.session_state.get("r_aid") or st.session_state.current_article_id
+    text = update_revision_log(st.session_state.packet_index, article_id, diff)
+    if text != st.session_state.packet_index.text:
+        st.session_state.project_packet = text
+        st.session_state.packet_note = f"本地改稿差異 · REVISION LOG · {article_id}"
+
+# Diffed locally so Step 9 does not need a second LLM pass (or its guesses)
+# to say what changed between v1 and v2.
+@st.fragment
+def revision_diff_panel():
+    st.markdown('<div class="sub-header">🔍 本地改稿差異（v1 → v2）</div>', unsafe_allow_html=True)
+    st.text_area(
+        "改後全文（v2）",
+        height=180,
+        placeholder="貼上 LLM 產出的改後全文（v2）；v1 取自上方「原文」。",
+        key="r_revised"
+    )
+    v1 = st.session_state.get("r_original") or ""
+    v2 = st.session_state.get("r_revised") or ""
+    if not (v1.strip() and v2.strip()):
+        st.caption("貼上 v1 與 v2 後，這裡會逐段、逐句列出新增 / 刪除 / 修改 / 移動。")
+        return
+    diff = diff_revision(v1, v2)
+    st.markdown(f"**{summarize(diff)}**")
+    if diff.changes:
+        st.code(diff_text(diff), language="diff")
+    st.button(
+        "把差異摘要寫入封包 REVISION LOG（本次改稿文章ID / 版本紀錄）",
+        on_click=apply_revision_log,
+        disabled=not diff.changes
+    )
 
-        prompt9 = f"""【本次主要產出】
-請輸出「改後文章全文（v2）」+「變更摘要（Diff Summary）」+「未採納清單（含理由）」。（不是封包、不是 code block）
+# Checked locally so Step 8 drafts need no extra LLM pass for technical SEO;
+# `python qa.py <dir>` runs the same checks over a directory of drafts.
+@st.fragment
+def draft_qa_panel():
+    st.markdown('<div class="sub-header">🔎 本地 SEO/QA 檢查</div>', unsafe_allow_html=True)
+    st.text_area(
+        "要檢查的文章（正文 + Meta/Schema）",
+        height=180,
+        placeholder="貼上 Step 8 產出；留空則檢查上方「直接送出」取得的 Step 8 回覆。",
+        key="s8_qa_draft"
+    )
+    draft = st.session_state.get("s8_qa_draft") or ""
+    response = st.session_state.get("llm_response")
+    if not draft.strip() and response is not None and response[0] == 8:
+        draft = response[1]
+    if not draft.strip():
+        st.caption("檢查字數、主/次關鍵字出現與密度、H1/H2/H3 結構、Meta 長度與 JSON-LD。")
+        return
+    article_id = st.session_state.get("s8_aid") or st.session_state.current_article_id
+    report = check_draft(
+        draft,
+        st.session_state.packet_index.card(article_id) or "",
+        st.session_state.get("s8_word", ""),
+        article_id,
+    )
+    st.markdown(format_report(report))
+    if report.keywords:
+        st.dataframe(
+            [{"關鍵字": k.keyword, "角色": k.role, "次數": k.count, "密度": f"{k.density:.2%}"} for k in report.keywords],
+            hide_index=True
+        )
 
-{no_codeblock_main_output_rules()}
+# ==========================================
+# 8. Main
+# ==========================================
 
-{voice_priority_rules()}
+# ------------------------------------------
+# Step 1
+# ------------------------------------------
+if selected_step == STEPS[0]:
+    st.markdown('<div class="main-header">✅ Step 1：專案摘要 (Project Log) 建立</div>', unsafe_allow_html=True)
+    st.caption("目標：用本回合原始資料萃取決策狀態，寫入封包（不保存原文）。")
 
-【改稿任務】
-- 文章ID：{aid_val}
+    step1_panel()
 
-【你要輸出的結構】
-1) 改後全文（v2）
-2) Diff Summary（條列，分 Must / Should / Could）
-3) 未採納清單（條列：原因=與 Persona/Voice 衝突 / 不利於 SEO 目標 / 缺乏證據 / 風險等）
-4) 若你判斷需要更新 VOICE CONTEXT：請提出「更新條款草案」（只列規則，不要寫長文）
+    st.divider()
+    st.button("👉 前往下一步：Step 1.5", on_click=go_to_step, args=(1,), type="primary")
 
-────────────────────
+# ------------------------------------------
+# Step 1.5（可選）
+# ------------------------------------------
+elif selected_step == STEPS[1]:
+    st.markdown('<div class="main-header">✅ Step 1.5：Persona/Voice 建模（寫入封包，可選）</div>', unsafe_allow_html=True)
+    st.caption("目標：同時使用『樣本文本』＋『你的筆記』建立語感。若你已在 Voice Bank 貼好語感，也可以跳過此步。")
 
-{state_reference_block(project_packet_val)}
+    step15_panel()
 
-{voice_bank_block(st.session_state.voice_bank)}
+    st.divider()
+    st.button("👉 前往下一步：Step 2", on_click=go_to_step, args=(2,), type="primary")
 
-【原文（v1｜本回合輸入，不要復誦原文，不要塞進封包）】
-{original_val}
+# ------------------------------------------
+# Step 2
+# ------------------------------------------
+elif selected_step == STEPS[2]:
+    st.markdown('<div class="main-header">✅ Step 2：SEO 任務目標 → 主題發想（寫入封包）</div>', unsafe_allow_html=True)
+    st.caption("目標：先產出主題表格（主要產出），再把 SEO 任務目標寫回封包。Voice Bank 若有內容會自動納入。")
 
-【客戶回饋（本回合輸入）】
-{client_val}
+    step2_panel()
 
-【總編輯指令（本回合輸入）】
-{editor_val}
+    st.divider()
+    st.button("👉 前往下一步：Step 3", on_click=go_to_step, args=(3,), type="primary")
 
-【額外限制（可選）】
-{constraints_val}
+# ------------------------------------------
+# Step 3
+# ------------------------------------------
+elif selected_step == STEPS[3]:
+    st.markdown('<div class="main-header">✅ Step 3：關鍵字候選清單 (Pre-GKP)</div>', unsafe_allow_html=True)
+    st.caption("目標：輸出 GKP 可用的逗號清單（主要產出），不更新封包。")
 
-────────────────────
+    step3_panel()
 
-【狀態更新任務（極重要：不得把全文寫入封包）】
-請只更新封包的：
-=== [REVISION LOG | EDITABLE] ===
+    st.divider()
+    st.button("👉 前往下一步：Step 4", on_click=go_to_step, args=(4,), type="primary")
 
-填入：
-- 本次改稿文章ID：{aid_val}
-- 客戶回饋摘要（1–5點）
-- 修改清單 Must / Should / Could
-- 已採納（含理由摘要）
-- 未採納（含理由摘要）
-- 版本紀錄（v1→v2 差異一句話）
-- 需要同步更新 VOICE CONTEXT 嗎？（是/否；若是，列出更新條款）
+# ------------------------------------------
+# Step 4
+# ------------------------------------------
+elif selected_step == STEPS[4]:
+    st.markdown('<div class="main-header">✅ Step 4：GKP 數據決策 (Post-GKP)（寫入封包）</div>', unsafe_allow_html=True)
+    st.caption("目標：先輸出決策分析（主要產出），再更新封包 STRATEGY LOG。")
 
-【硬性禁止條款】
-- 你不得把任何「改後全文段落」寫入 Project Packet。
+    step4_panel()
 
-- 若 VOICE BANK 有內容：請把合併後 VOICE CONTEXT 寫回封包（其他區塊不動）。
+    st.divider()
+    st.button("👉 前往下一步：Step 5", on_click=go_to_step, args=(5,), type="primary")
 
-{state_output_rules()}
-"""
-        st.code(prompt9, language="markdown")
+# ------------------------------------------
+# Step 5
+# ------------------------------------------
+elif selected_step == STEPS[5]:
+    st.markdown('<div class="main-header">✅ Step 5：搜尋意圖 Deep Research（寫入封包）</div>', unsafe_allow_html=True)
+    st.caption("目標：先輸出 SERP/Intent 洞察（主要產出），再把 Winning Angle 等收斂寫回封包。")
+
+    step5_panel()
+
+    st.divider()
+    st.button("👉 前往下一步：Step 6", on_click=go_to_step, args=(6,), type="primary")
+
+# ------------------------------------------
+# Step 6
+# ------------------------------------------
+elif selected_step == STEPS[6]:
+    st.markdown('<div class="main-header">✅ Step 6：文章標題生成（寫入封包：Backlog/文章卡）</div>', unsafe_allow_html=True)
+    st.caption("目標：先輸出標題清單+分群（主要產出），再把 Backlog+文章卡寫回封包。")
+
+    step6_panel()
+
+    st.divider()
+    st.button("👉 前往下一步：Step 7", on_click=go_to_step, args=(7,), type="primary")
+
+# ------------------------------------------
+# Step 7
+# ------------------------------------------
+elif selected_step == STEPS[7]:
+    st.markdown('<div class="main-header">✅ Step 7：文章大綱（更新指定文章卡）</div>', unsafe_allow_html=True)
+    st.caption("目標：先輸出大綱（主要產出），再只更新指定文章卡的大綱欄位。")
+
+    step7_panel()
+
+    st.divider()
+    st.button("👉 前往下一步：Step 8", on_click=go_to_step, args=(8,), type="primary")
+
+# ------------------------------------------
+# Step 8
+# ------------------------------------------
+elif selected_step == STEPS[8]:
+    st.markdown('<div class="main-header">✅ Step 8：文章撰寫 + 技術 SEO（更新指定文章卡）</div>', unsafe_allow_html=True)
+    st.caption("目標：先輸出正文（主要產出），封包只存 meta/schema/checklist/摘要與後續行動（不存正文）。")
+
+    step8_panel()
+    draft_qa_panel()
+
+    st.divider()
+    st.success("✅ Step 8：封包不存正文，只存 meta/schema/checklist/摘要與可續寫索引。")
+    st.button("👉 前往下一步：Step 9", on_click=go_to_step, args=(9,), type="primary")
+
+# ------------------------------------------
+# Step 9
+# ------------------------------------------
+elif selected_step == STEPS[9]:
+    st.markdown('<div class="main-header">✅ Step 9：改稿（Revision）+ 變更紀錄（寫入封包）</div>', unsafe_allow_html=True)
+    st.caption("目標：輸出改後全文（主要產出），封包只存：變更決策/採納與拒絕/版本差異/必要時更新 VOICE CONTEXT（不存全文）。")
+
+    step9_panel()
+    revision_diff_panel()
 
     st.divider()
     st.success("✅ Step 9：改稿全文只在主要產出；封包只存變更決策與必要的語感規則更新。")
+
+# ------------------------------------------
+# LLM execution + packet write-back (every step)
+# ------------------------------------------
+st.divider()
+run_step_prompt(STEPS.index(selected_step))
+packet_writeback(STEPS.index(selected_step))
@@ -0,0 +1,200 @@
+import argparse
+import asyncio
+import fnmatch
+import json
+import re
+import sys
+import zipfile
+
+from links import LinkIndex
+from llm import DEFAULT_BASE_URL, DEFAULT_CONCURRENCY, DEFAULT_MODEL, AsyncLLMClient, LLMConfig, LLMError
+from overlap import KeywordIndex, format_overlaps
+from packet import ProjectPacket, card_fields
+from prompts import PACKET_SCOPE_FULL, PACKET_SCOPE_STEP, PROMPT_LAYOUT_PREFIX, PROMPT_LAYOUT_STEP
+from responses import DEFAULT_CACHE_PATH, ResponseCache
+from tokens import BUDGET_TRUNCATE, render_within_budget
+from voice import compact_voice_bank, voice_context_block
+
+# ==========================================
+# Batch Step 7/8 prompt generation
+# ==========================================
+# Prompts are produced lazily, one card at a time, and written straight to
+# the output stream, so a 300-card project never holds more than one prompt.
+BATCH_STEPS = (7, 8)
+RANGE_RE = re.compile(r"^([A-Za-z_-]*)(\d+)\s*[-~]\s*\1(\d+)$")
+
+def select_card_ids(index: ProjectPacket, spec: str = "") -> list:
+    """Filter card IDs by a comma separated spec of IDs, globs (A1*) or ranges (A01-A20)."""
+    ids = index.card_ids()
+    tokens = [t.strip() for t in re.split(r"[,\s，、]+", spec or "") if t.strip()]
+    if not tokens:
+        return ids
+    selected = []
+    for aid in ids:
+        for token in tokens:
+            m = RANGE_RE.match(token)
+            if m:
+                prefix, lo, hi = m.group(1), int(m.group(2)), int(m.group(3))
+                tail = aid[len(prefix):]
+                if aid.startswith(prefix) and tail.isdigit() and lo <= int(tail) <= hi:
+                    selected.append(aid)
+                    break
+            elif fnmatch.fnmatchcase(aid, token):
+                selected.append(aid)
+                break
+    return selected
+
+def _card_inputs(step_index: int, fields: dict, shared: dict) -> dict:
+    inputs = dict(shared)
+    if step_index == 7:
+        # Each card carries its own title; never reuse one title for every card.
+        inputs["title"] = fields.get("標題", "")
+    elif step_index == 8:
+        for key, field_name in (("word", "字數"), ("cta", "CTA")):
+            if fields.get(field_name):
+                inputs[key] = fields[field_name]
+    return inputs
+
+def iter_batch_prompts(
+    step_index: int,
+    packet,
+    voice_bank: str,
+    article_ids=None,
+    packet_scope: str = PACKET_SCOPE_STEP,
+    budget: int = 0,
+    strategy: str = BUDGET_TRUNCATE,
+    layout: str = PROMPT_LAYOUT_STEP,
+    **shared_inputs,
+):
+    if step_index not in BATCH_STEPS:
+        raise ValueError(f"batch mode only supports steps {BATCH_STEPS}, got {step_index}")
+    index = packet if isinstance(packet, ProjectPacket) else ProjectPacket(packet or "")
+    keyword_index = None
+    if step_index == 7:
+        keyword_index = KeywordIndex()
+        keyword_index.sync(index)
+    # Related cards for every card at once, from one pass over the similarity matrix.
+    link_index = LinkIndex()
+    link_index.sync(index)
+    related = link_index.related_all()
+    for aid in (index.card_ids() if article_ids is None else article_ids):
+        inputs = _card_inputs(step_index, card_fields(index.card(aid) or ""), shared_inputs)
+        inputs["article_id"] = aid
+        if keyword_index is not None:
+            inputs["overlaps"] = format_overlaps(keyword_index.overlaps(aid))
+        inputs["related"] = link_index.format_related(related.get(aid, []))
+        prompt, report = render_within_budget(
+            step_index,
+            index,
+            voice_bank,
+            budget=budget,
+            strategy=strategy,
+            packet_scope=packet_scope,
+            layout=layout,
+            use_cache=False,
+            **inputs,
+        )
+        yield {"article_id": aid, "step": step_index, "tokens": report["total"], "prompt": prompt}
+
+async def complete_records(client: AsyncLLMClient, records: list, on_done=None, bypass_cache: bool = False) -> list:
+    """Send every record's prompt concurrently; adds ``response`` or ``error`` to each record."""
+    responses = await client.complete_many([r["prompt"] for r in records], on_done=on_done, bypass_cache=bypass_cache)
+    for record, response in zip(records, responses):
+        if isinstance(response, LLMError):
+            record["error"] = str(response)
+        else:
+            record["response"] = response
+    return records
+
+def write_jsonl(records, fp) -> int:
+    n = 0
+    for record in records:
+        fp.write(json.dumps(record, ensure_ascii=False) + "\n")
+        n += 1
+    return n
+
+def write_zip(records, fp) -> int:
+    n = 0
+    with zipfile.ZipFile(fp, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for record in records:
+            name = f"step{record['step']}_{record['article_id']}"
+            zf.writestr(f"{name}.md", record["prompt"])
+            if "response" in record:
+                zf.writestr(f"{name}.response.md", record["response"])
+            n += 1
+    return n
+
+# ==========================================
+# CLI
+# ==========================================
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Render Step 7/8 prompts for every article card in a packet.")
+    parser.add_argument("packet", help="PROJECT PACKET text file")
+    parser.add_argument("--step", type=int, choices=BATCH_STEPS, required=True)
+    parser.add_argument("--voice-bank", help="Voice Bank text file")
+    parser.add_argument("--compact-voice", action="store_true",
+                        help="merge the voice bank with the packet's VOICE CONTEXT locally (dedupe + conflicts)")
+    parser.add_argument("--cards", default="", help="card filter, e.g. 'A01-A20,B*'")
+    parser.add_argument("--scope", choices=(PACKET_SCOPE_STEP, PACKET_SCOPE_FULL), default=PACKET_SCOPE_STEP)
+    parser.add_argument("--budget", type=int, default=0)
+    parser.add_argument("--layout", choices=(PROMPT_LAYOUT_STEP, PROMPT_LAYOUT_PREFIX), default=PROMPT_LAYOUT_STEP,
+                        help="'prefix' puts the shared voice bank/packet first so cards share a cacheable prefix")
+    parser.add_argument("--input", action="append", default=[], metavar="KEY=VALUE",
+                        help="shared step input, e.g. --input word='2000 字'")
+    parser.add_argument("--out", default="-", help="output path (.jsonl or .zip); '-' writes JSONL to stdout")
+    parser.add_argument("--execute", action="store_true", help="also send every prompt to the LLM endpoint")
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--cache-db", default=DEFAULT_CACHE_PATH, help="response cache; '' disables it")
+    parser.add_argument("--refresh", action="store_true", help="ignore cached responses (fresh ones are still stored)")
+    args = parser.parse_args(argv)
+
+    with open(args.packet, encoding="utf-8") as f:
+        index = ProjectPacket(f.read())
+    voice_bank = ""
+    if args.voice_bank:
+        with open(args.voice_bank, encoding="utf-8") as f:
+            voice_bank = f.read()
+    if args.compact_voice:
+        voice_bank, _ = compact_voice_bank(voice_bank, voice_context_block(index))
+    shared = dict(item.split("=", 1) for item in args.input)
+    records = iter_batch_prompts(
+        args.step,
+        index,
+        voice_bank,
+        select_card_ids(index, args.cards),
+        packet_scope=args.scope,
+        budget=args.budget,
+        layout=args.layout,
+        **shared,
+    )
+    if args.execute:
+        async def execute(records):
+            cache = ResponseCache(args.cache_db) if args.cache_db else None
+            client = AsyncLLMClient(
+                LLMConfig(base_url=args.base_url, model=args.model, concurrency=args.concurrency), cache
+            )
+            try:
+                return await complete_records(client, records, bypass_cache=args.refresh)
+            finally:
+                client.close()
+                if cache is not None:
+                    stats = cache.stats()
+                    print(f"response cache: {stats['hits']} hits, {stats['misses']} misses", file=sys.stderr)
+                    cache.close()
+        # Executing needs every prompt in flight at once, so the records are materialized here.
+        records = asyncio.run(execute(list(records)))
+    if args.out == "-":
+        n = write_jsonl(records, sys.stdout)
+    elif args.out.endswith(".zip"):
+        with open(args.out, "wb") as fp:
+            n = write_zip(records, fp)
+    else:
+        with open(args.out, "w", encoding="utf-8") as fp:
+            n = write_jsonl(records, fp)
+    print(f"{n} prompts written", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
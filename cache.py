@@ -0,0 +1,116 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+# ==========================================
+# Content-hash keyed LRU caches (process-wide)
+# ==========================================
+# Module globals are shared by every Streamlit session in the process, so a
+# block or prompt rendered for one editor is reused by the next rerun of any
+# session with the same content.
+
+def content_hash(*parts) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        data = (part if isinstance(part, str) else repr(part)).encode("utf-8")
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return h.hexdigest()
+
+def _default_sizeof(value) -> int:
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, tuple):
+        return sum(len(v) for v in value if isinstance(v, str)) or 1
+    return 1
+
+class LRUCache:
+    def __init__(self, max_size: int, sizeof=_default_sizeof):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            if size > self.max_size:
+                return value
+            self._data[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted) = self._data.popitem(last=False)
+                self.size -= evicted
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._data),
+            "size": self.size,
+            "max_size": self.max_size,
+        }
+
+def memoize(cache: LRUCache):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args):
+            key = content_hash(fn.__qualname__, *args)
+            value = cache.get(key)
+            if value is None:
+                value = cache.put(key, fn(*args))
+            return value
+        return wrapper
+    return decorator
+
+# Sizes are in characters of cached text.
+BLOCK_CACHE = LRUCache(max_size=8_000_000)
+PROMPT_CACHE = LRUCache(max_size=32_000_000)
+# Decoded Step 1.5 uploads, keyed by file content hash.
+SAMPLE_CACHE = LRUCache(max_size=16_000_000)
+# Decoded packet history segments, keyed by segment content hash.
+HISTORY_CACHE = LRUCache(max_size=4_000_000)
+# Parsed Step 5 SERP/competitor captures, keyed by file content hash; one unit per page.
+CAPTURE_CACHE = LRUCache(max_size=20_000, sizeof=lambda value: 1)
+# Token counts: one unit per entry.
+TOKEN_CACHE = LRUCache(max_size=20_000, sizeof=lambda value: 1)
+
+def cache_stats() -> dict:
+    return {
+        "blocks": BLOCK_CACHE.stats(),
+        "prompts": PROMPT_CACHE.stats(),
+        "samples": SAMPLE_CACHE.stats(),
+        "tokens": TOKEN_CACHE.stats(),
+        "history": HISTORY_CACHE.stats(),
+        "captures": CAPTURE_CACHE.stats(),
+    }
@@ -0,0 +1,512 @@
+import re
+from dataclasses import dataclass, field
+
+from packet import ProjectPacket, card_fields
+from prompts import (
+    PACKET_SCOPE_FULL,
+    PACKET_SCOPE_STEP,
+    get_value,
+    no_codeblock_main_output_rules,
+    related_links_block,
+    resolve_packet,
+    state_output_rules,
+    state_reference_block,
+    voice_bank_block,
+    voice_priority_rules,
+)
+
+# ==========================================
+# Section-chunked long-article prompts
+# ==========================================
+# A long article is split at its Markdown H2 headings (H3 too when an H2
+# section is still too long) and every section gets its own prompt. The
+# shared context (step-scoped packet, voice bank, outline, feedback) comes
+# first and is identical for all sections, so the prompts can run
+# concurrently and share a cacheable prefix. Section answers are reassembled
+# locally; only their short summaries go into the final merge prompt.
+# Step 8 works the same way from the article card's outline: one writing
+# prompt per H2 and a stitch pass that adds the lead, ending and SEO items.
+HEADING_RE = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t#]*$")
+DEFAULT_SECTION_CHARS = 2500
+LEAD = "（前言）"
+
+SECTION_TEXT_MARK = "【改後段落】"
+SECTION_SUMMARY_MARK = "【段落變更摘要】"
+
+@dataclass
+class ArticleSection:
+    heading: str  # heading text without the #'s; LEAD for text before the first H2
+    level: int    # 2 or 3; 0 for the lead
+    text: str     # heading line + body, as written
+
+    @property
+    def title(self) -> str:
+        return self.heading if self.level else LEAD
+
+def _split_at(text: str, level: int) -> list:
+    pieces = []
+    heading, heading_level, lines = LEAD, 0, []
+    for line in text.splitlines(keepends=True):
+        m = HEADING_RE.match(line.rstrip("\r\n"))
+        if m and len(m.group(1)) == level:
+            if "".join(lines).strip():
+                pieces.append(ArticleSection(heading, heading_level, "".join(lines)))
+            heading, heading_level, lines = m.group(2).strip(), level, []
+        lines.append(line)
+    if "".join(lines).strip():
+        pieces.append(ArticleSection(heading, heading_level, "".join(lines)))
+    return pieces
+
+def split_sections(text: str, max_chars: int = DEFAULT_SECTION_CHARS) -> list:
+    """Split at H2 headings; H2 sections longer than ``max_chars`` are split again at H3."""
+    sections = []
+    for section in _split_at(text or "", 2):
+        if len(section.text) <= max_chars:
+            sections.append(section)
+            continue
+        parts = _split_at(section.text, 3)
+        # The H2 line and its intro stay together as the first part.
+        if parts and not parts[0].level:
+            parts[0] = ArticleSection(section.heading, section.level, parts[0].text)
+        sections += parts
+    return sections
+
+def outline(sections: list) -> str:
+    return "\n".join(("  " if s.level == 3 else "") + f"{i}. {s.title}" for i, s in enumerate(sections, 1))
+
+def parse_section_response(response: str) -> tuple:
+    """``(section text, summary)`` from a section answer; unmarked answers are all text."""
+    body, summary = response or "", ""
+    if SECTION_SUMMARY_MARK in body:
+        body, summary = body.split(SECTION_SUMMARY_MARK, 1)
+    if SECTION_TEXT_MARK in body:
+        body = body.split(SECTION_TEXT_MARK, 1)[1]
+    return body.strip(), summary.strip()
+
+def merge_sections(sections: list, responses: list) -> tuple:
+    """Reassemble v2 in section order. A section without an answer keeps its original text.
+
+    Returns ``(text, [(title, summary), ...])``.
+    """
+    texts, summaries = [], []
+    for section, response in zip(sections, responses):
+        if response:
+            text, summary = parse_section_response(response)
+        else:
+            text, summary = "", ""
+        if not text:
+            text, summary = section.text.strip(), "（本段未取得改寫結果，保留原文）"
+        texts.append(text)
+        summaries.append((section.title, summary or "（未提供摘要）"))
+    return "\n\n".join(texts) + "\n", summaries
+
+def shared_context(packet, voice_bank: str, step_index: int, article_id: str, sections: list) -> str:
+    # Always the step-scoped packet: every section prompt repeats this block.
+    packet_val = get_value(resolve_packet(packet, step_index, PACKET_SCOPE_STEP, article_id), "尚未建立封包")
+    return f"""{state_reference_block(packet_val)}
+{voice_bank_block(voice_bank)}
+
+【全文大綱（只供定位，不要改寫其他段落）】
+{outline(sections)}
+"""
+
+# ------------------------------------------
+# Step 9: per-section revision + merge
+# ------------------------------------------
+def render_step9_section(
+    context: str,
+    section: ArticleSection,
+    number: int,
+    total: int,
+    article_id: str = "",
+    client: str = "",
+    editor: str = "",
+    constraints: str = "",
+) -> str:
+    aid_val = get_value(article_id, "A01")
+    client_val = get_value(client, "（無）")
+    editor_val = get_value(editor, "（無）")
+    constraints_val = get_value(constraints, "（無）")
+
+    return f"""【分段改稿｜共用脈絡（各段相同）】
+{context}
+【客戶回饋（本回合輸入）】
+{client_val}
+
+【總編輯指令（本回合輸入）】
+{editor_val}
+
+【額外限制（可選）】
+{constraints_val}
+
+────────────────────
+
+【本次主要產出：分段改稿 {number}/{total}】
+- 文章ID：{aid_val}
+- 本段：{section.title}
+- 只改寫下方「本段原文」，保留本段的標題層級；不要補寫其他段落的內容，也不要另寫前言或結語。
+- 若 VOICE BANK 有內容：視為最高優先語感規格（高於封包 VOICE CONTEXT）。
+- 本回合不輸出封包、不使用 code block（合併階段才更新封包）。
+
+【輸出格式（嚴格，供程式自動合併）】
+{SECTION_TEXT_MARK}
+（改後本段全文，含標題行）
+{SECTION_SUMMARY_MARK}
+- Must：
+- Should：
+- Could：
+- 未採納（含理由；沒有寫「無」）：
+
+【本段原文（v1｜不要復誦，不要塞進封包）】
+{section.text.strip()}
+"""
+
+def render_step9_merge(
+    packet: str,
+    voice_bank: str,
+    article_id: str = "",
+    summaries: list = (),
+    local_diff: str = "",
+    packet_scope: str = PACKET_SCOPE_FULL,
+) -> str:
+    packet_val = get_value(packet, "尚未建立封包")
+    aid_val = get_value(article_id, "A01")
+    summaries_val = get_value(
+        "\n\n".join(f"### {i}. {title}\n{summary}" for i, (title, summary) in enumerate(summaries, 1)),
+        "各段變更摘要（分段改稿完成後自動帶入）",
+    )
+    local_diff_val = get_value(local_diff, "（無）")
+
+    return f"""【本次主要產出】
+請輸出「變更摘要（Diff Summary）」+「未採納清單（含理由）」。改後全文（v2）已由各段改稿在本地組合完成，不要重寫全文。（不是封包、不是 code block）
+
+{no_codeblock_main_output_rules()}
+
+{voice_priority_rules(voice_bank)}
+
+【合併任務】
+- 文章ID：{aid_val}
+- 分段數：{len(summaries)}
+
+【你要輸出的結構】
+1) Diff Summary（合併各段摘要、去除重複，分 Must / Should / Could）
+2) 未採納清單（條列：原因=與 Persona/Voice 衝突 / 不利於 SEO 目標 / 缺乏證據 / 風險等）
+3) 若你判斷需要更新 VOICE CONTEXT：請提出「更新條款草案」（只列規則，不要寫長文）
+
+────────────────────
+
+{state_reference_block(packet_val)}
+
+{voice_bank_block(voice_bank)}
+
+【各段變更摘要（分段改稿結果）】
+{summaries_val}
+
+【本地比對（v1→v2，程式計算）】
+{local_diff_val}
+
+────────────────────
+
+【狀態更新任務（極重要：不得把全文寫入封包）】
+請只更新封包的：
+=== [REVISION LOG | EDITABLE] ===
+
+填入：
+- 本次改稿文章ID：{aid_val}
+- 客戶回饋摘要（1–5點）
+- 修改清單 Must / Should / Could
+- 已採納（含理由摘要）
+- 未採納（含理由摘要）
+- 版本紀錄（v1→v2 差異一句話；可直接採用上方本地比對）
+- 需要同步更新 VOICE CONTEXT 嗎？（是/否；若是，列出更新條款）
+
+- 若 VOICE BANK 有內容：請把合併後 VOICE CONTEXT 寫回封包（其他區塊不動）。
+
+{state_output_rules(packet_scope)}
+"""
+
+def step9_section_records(packet, voice_bank: str, article_id: str, original: str, **inputs) -> tuple:
+    """``(sections, records)``; records carry ``prompt`` like batch records, one per section."""
+    sections = split_sections(original)
+    context = shared_context(packet, voice_bank, 9, article_id, sections)
+    records = [
+        {
+            "article_id": article_id,
+            "step": 9,
+            "section": i,
+            "heading": section.title,
+            "prompt": render_step9_section(context, section, i, len(sections), article_id, **inputs),
+        }
+        for i, section in enumerate(sections, 1)
+    ]
+    return sections, records
+
+# ------------------------------------------
+# Step 8: per-H2 writing from the card outline + stitch
+# ------------------------------------------
+OUTLINE_FIELD_RE = re.compile(r"^([ \t]*)- 大綱[^：:\n]*[：:][ \t]*(.*)$", re.M)
+# "H2：…" / "H2 …" / "## …", one per line or several on one line separated by ｜ / ;
+OUTLINE_MARK_RE = re.compile(r"(?:^|(?<=[\s｜|/；;、]))(?:[Hh]([1-3])(?=[\s：:.、)）-])|(#{1,3})(?=\s))[ \t]*[：:.、)）-]?[ \t]*")
+WORDS_RE = re.compile(r"\d[\d,]*")
+# "3000–5000字" / "3000 字至 5000 字" / "3000~5000"; group 3 is set when the range is counted in 字.
+WORD_RANGE_RE = re.compile(r"(\d[\d,]*)[ \t]*字?[ \t]*(?:-|–|—|~|～|至|到)[ \t]*(\d[\d,]*)[ \t]*(字)?")
+WORD_COUNT_RE = re.compile(r"(\d[\d,]*)[ \t]*字")
+# Share of the word budget left to the stitch pass (H1 lead, conclusion, CTA).
+STITCH_SHARE = 0.12
+MIN_SECTION_WORDS = 50
+
+STITCH_LEAD_MARK = "【H1與前言】"
+STITCH_END_MARK = "【結語與CTA】"
+STITCH_SEO_MARK = "【Meta 與技術 SEO】"
+
+@dataclass
+class WritingSection:
+    title: str
+    subheadings: list = field(default_factory=list)
+    words: int = 0
+
+def outline_field(card_text: str) -> str:
+    """The card's 大綱 value plus its more-indented continuation lines."""
+    m = OUTLINE_FIELD_RE.search(card_text or "")
+    if m is None:
+        return ""
+    indent = len(m.group(1).expandtabs())
+    lines = [m.group(2)]
+    for line in card_text[m.end():].splitlines()[1:]:
+        if not line.strip():
+            continue
+        if len(line.expandtabs()) - len(line.expandtabs().lstrip()) <= indent:
+            break
+        lines.append(line.strip())
+    return "\n".join(line for line in lines if line.strip())
+
+def parse_outline(text: str) -> tuple:
+    """``(h1, [WritingSection, ...])`` from an H1/H2/H3 outline; H3s attach to the H2 above them."""
+    marks = list(OUTLINE_MARK_RE.finditer(text or ""))
+    h1, sections = "", []
+    for k, m in enumerate(marks):
+        end = marks[k + 1].start() if k + 1 < len(marks) else len(text)
+        title = text[m.end():end].strip().strip("｜|/；;、-").strip()
+        level = int(m.group(1)) if m.group(1) else len(m.group(2))
+        if not title:
+            continue
+        if level == 1 and not h1:
+            h1 = title
+        elif level == 2:
+            sections.append(WritingSection(title))
+        elif level == 3 and sections:
+            sections[-1].subheadings.append(title)
+    return h1, sections
+
+def parse_word_target(text: str) -> int:
+    """``"1500 字"`` -> 1500; a range such as ``"3000–5000字"`` -> its midpoint; 0 if none.
+
+    Other numbers in the field (``"2000 字，含 5 個 FAQ"``) are ignored: a range counted in 字
+    wins, then a number followed by 字, then a bare range, then the first number.
+    """
+    text = text or ""
+    ranges = list(WORD_RANGE_RE.finditer(text))
+    m = next((r for r in ranges if r.group(3)), None)
+    if m is None:
+        count = WORD_COUNT_RE.search(text)
+        if count is not None:
+            return int(count.group(1).replace(",", ""))
+        m = ranges[0] if ranges else None
+    if m is not None:
+        return (int(m.group(1).replace(",", "")) + int(m.group(2).replace(",", ""))) // 2
+    numbers = WORDS_RE.findall(text)
+    return int(numbers[0].replace(",", "")) if numbers else 0
+
+def allocate_words(total: int, sections: list) -> int:
+    """Split ``total`` over the sections by size (1 + 0.5 per H3); returns what is left for the stitch pass."""
+    if total <= 0 or not sections:
+        return 0
+    weights = [1 + 0.5 * len(s.subheadings) for s in sections]
+    body = total * (1 - STITCH_SHARE)
+    for section, weight in zip(sections, weights):
+        section.words = max(int(round(body * weight / sum(weights), -1)), MIN_SECTION_WORDS)
+    return max(total - sum(s.words for s in sections), 0)
+
+def writing_outline(h1: str, sections: list) -> str:
+    lines = [f"H1：{h1 or '（依文章卡標題）'}"]
+    for i, section in enumerate(sections, 1):
+        words = f"（約 {section.words} 字）" if section.words else ""
+        lines.append(f"{i}. H2：{section.title}{words}")
+        lines += [f"   - H3：{sub}" for sub in section.subheadings]
+    return "\n".join(lines)
+
+def writing_context(
+    packet,
+    voice_bank: str,
+    article_id: str,
+    h1: str,
+    sections: list,
+    cta: str = "",
+    extra: str = "",
+    source: str = "",
+) -> str:
+    index = packet if isinstance(packet, ProjectPacket) else ProjectPacket(packet or "")
+    fields = card_fields(index.card(article_id) or "")
+    blocks = [
+        f"""【文章卡摘要】
+- 文章ID：{get_value(article_id, "A01")}
+- 標題（H1）：{get_value(h1 or fields.get("標題"), "未指定")}
+- Primary/Secondary/Supporting：{get_value(fields.get("Primary/Secondary/Supporting"), "見 STRATEGY LOG")}
+- Winning Angle：{get_value(fields.get("Winning Angle"), "見 STRATEGY LOG")}
+- CTA：{get_value(cta, "CTA")}""",
+    ]
+    # Only the sections that steer the writing, not the whole packet.
+    for name in ("STRATEGY LOG", "VOICE CONTEXT"):
+        block = index.section_block(name)
+        if block:
+            blocks.append(block.rstrip("\n"))
+    blocks.append(voice_bank_block(voice_bank).rstrip("\n"))
+    blocks.append(f"【全文大綱與字數分配】\n{writing_outline(h1, sections)}")
+    blocks.append(f"【補充寫作指示】\n{get_value(extra, '（無）')}")
+    blocks.append(f"【本回合原始資料/事實要點（僅參考，不要復誦原文，不要塞進封包）】\n{get_value(source, '（無）')}")
+    return "\n\n".join(blocks) + "\n"
+
+def render_step8_section(context: str, sections: list, number: int, article_id: str = "") -> str:
+    section = sections[number - 1]
+    aid_val = get_value(article_id, "A01")
+    subheadings = "\n".join(f"  - H3：{sub}" for sub in section.subheadings) or "  -（無 H3，可自行分段）"
+    before = sections[number - 2].title if number > 1 else "（前言，由組合階段撰寫）"
+    after = sections[number].title if number < len(sections) else "（結語與 CTA，由組合階段撰寫）"
+    words = f"約 {section.words} 字" if section.words else "依全文字數比例"
+
+    return f"""【分段撰寫｜共用脈絡（各段相同）】
+{context}
+────────────────────
+
+【本次主要產出：分段撰寫 {number}/{len(sections)}】
+- 文章ID：{aid_val}
+- 本段 H2：{section.title}
+{subheadings}
+- 字數：{words}
+- 上一段：{before}
+- 下一段：{after}
+
+【寫作規則】
+- 只寫本段：以「## {section.title}」開頭，H3 用「###」。
+- 不要寫 H1、前言、結語、CTA 或 Meta；不要重述其他段落的內容，銜接句點到為止即可。
+- 若 VOICE BANK 有內容：視為最高優先語感規格（高於封包 VOICE CONTEXT）。
+- 直接輸出本段 Markdown 正文；不要 code block、不要輸出封包。
+"""
+
+def render_step8_stitch(
+    packet: str,
+    voice_bank: str,
+    article_id: str = "",
+    h1: str = "",
+    sections: list = (),
+    drafts: list = (),
+    word: str = "",
+    cta: str = "",
+    extra: str = "",
+    stitch_words: int = 0,
+    related: str = "",
+    packet_scope: str = PACKET_SCOPE_FULL,
+) -> str:
+    packet_val = get_value(packet, "尚未建立封包")
+    aid_val = get_value(article_id, "A01")
+    word_val = get_value(word, "1500字")
+    cta_val = get_value(cta, "CTA")
+    extra_val = get_value(extra, "（無）")
+    drafts_val = get_value("\n\n".join(d for d in drafts if d), "各段草稿（分段撰寫完成後自動帶入）")
+    lead_words = f"前言＋結語合計約 {stitch_words} 字" if stitch_words else "前言與結語各 1–2 段"
+    related_block = related_links_block(related, "內鏈建議請優先從上列文章挑選（寫出 anchor、放在哪一段、文章ID）。")
+
+    return f"""【本次主要產出】
+下方各段（H2）正文已分段寫好。請只補上組合所需的部分，不要重寫各段正文：
+{STITCH_LEAD_MARK}
+H1（# 開頭）＋前言（帶出搜尋意圖與本文價值）
+{STITCH_END_MARK}
+結語＋CTA（{cta_val}）
+{STITCH_SEO_MARK}
+1) Meta Title（<60字元）
+2) Meta Description（<160字元）
+3) Schema Markup 建議（條列）
+4) 技術 SEO 檢查清單（條列：內鏈建議、段落結構、FAQ、表格/清單使用點；並指出各段之間需要調整的銜接句）
+
+請依序輸出以上三個標記（標記原樣保留，供程式組合全文）。
+
+{no_codeblock_main_output_rules()}
+
+{voice_priority_rules(voice_bank)}
+
+【組合任務】
+- 文章ID：{aid_val}
+- H1：{get_value(h1, "依文章卡標題")}
+- 全文字數：{word_val}（{lead_words}）
+- 補充指示：{extra_val}
+
+────────────────────
+
+{state_reference_block(packet_val)}
+
+{voice_bank_block(voice_bank)}
+
+【全文大綱】
+{writing_outline(h1, list(sections))}
+
+【各段草稿（本回合產出，不要塞進封包）】
+{drafts_val}
+{related_block}
+────────────────────
+
+【狀態更新任務（極重要：正文禁止寫入封包）】
+請在主要產出後，只更新封包中「文章ID：{aid_val}」那張文章卡，填入：
+- 字數：{word_val}
+- CTA：{cta_val}
+- Meta Title/Meta Desc/Schema：請把你剛剛產出的內容「精簡貼回」
+- 產出備註/連結：只存「可續寫摘要」與「後續行動」（核心結論 3 點、FAQ 題目、內鏈建議、下一篇建議）
+
+【硬性禁止條款】
+- 你不得把任何「正文段落」寫入 Project Packet。
+
+- 若 VOICE BANK 有內容：請把合併後 VOICE CONTEXT 寫回封包（其他區塊不動）。
+
+其他文章卡不得更動。
+
+{state_output_rules(packet_scope)}
+"""
+
+def step8_section_records(
+    packet,
+    voice_bank: str,
+    article_id: str,
+    word: str = "",
+    cta: str = "",
+    extra: str = "",
+    source: str = "",
+) -> tuple:
+    """``(h1, sections, stitch_words, records)`` from the card outline; no records when it has no H2."""
+    index = packet if isinstance(packet, ProjectPacket) else ProjectPacket(packet or "")
+    h1, sections = parse_outline(outline_field(index.card(article_id) or ""))
+    stitch_words = allocate_words(parse_word_target(word), sections)
+    context = writing_context(index, voice_bank, article_id, h1, sections, cta, extra, source)
+    records = [
+        {
+            "article_id": article_id,
+            "step": 8,
+            "section": i,
+            "heading": section.title,
+            "prompt": render_step8_section(context, sections, i, article_id),
+        }
+        for i, section in enumerate(sections, 1)
+    ]
+    return h1, sections, stitch_words, records
+
+def _between(text: str, start_mark: str, stop_marks: tuple) -> str:
+    start = text.find(start_mark)
+    if start < 0:
+        return ""
+    start += len(start_mark)
+    stops = [i for i in (text.find(m, start) for m in stop_marks + ("```",)) if i >= 0]
+    return text[start:min(stops) if stops else len(text)].strip()
+
+def assemble_article(drafts: list, stitch_response: str = "") -> str:
+    """H1 + lead from the stitch answer, the section drafts in order, then its conclusion."""
+    lead = _between(stitch_response or "", STITCH_LEAD_MARK, (STITCH_END_MARK, STITCH_SEO_MARK))
+    ending = _between(stitch_response or "", STITCH_END_MARK, (STITCH_SEO_MARK,))
+    return "\n\n".join(part.strip() for part in [lead, *drafts, ending] if part and part.strip()) + "\n"
@@ -0,0 +1,250 @@
+import csv
+import io
+import re
+from dataclasses import dataclass
+
+import numpy as np
+
+from cache import BLOCK_CACHE, memoize
+from keywords import cluster_keywords
+
+# ==========================================
+# Google Keyword Planner export ingestion (Step 4)
+# ==========================================
+# GKP exports (UTF-16 TSV from the UI, CSV from Sheets, or a pasted table)
+# are parsed into a columnar table, scored with vectorized NumPy ops, and only
+# the top-k rows plus aggregate stats are embedded in prompt4.
+DEFAULT_TOP_K = 60
+GKP_MAX_CHARS = 5_000_000
+
+# Normalized header fragment -> column. First match wins, so the more
+# specific fragments (indexed competition, bid ranges) come first.
+COLUMN_ALIASES = (
+    ("competition_index", ("competition(indexedvalue)", "競爭程度(索引值)", "竞争指数", "競爭指數", "竞争程度(索引值)")),
+    ("bid_low", ("topofpagebid(lowrange)", "首頁頂端出價(低價範圍)", "页首出价(低位范围)", "首頁頂端出價(低)", "页首出价(低)")),
+    ("bid_high", ("topofpagebid(highrange)", "首頁頂端出價(高價範圍)", "页首出价(高位范围)", "首頁頂端出價(高)", "页首出价(高)")),
+    ("volume", ("avg.monthlysearches", "平均每月搜尋量", "平均每月搜索量", "平均每月搜寻量")),
+    ("competition", ("competition", "競爭程度", "竞争程度", "競爭", "竞争")),
+    ("keyword", ("keyword", "關鍵字", "关键字", "關鍵詞", "关键词")),
+)
+COMPETITION_LEVELS = {
+    "low": 20.0, "低": 20.0,
+    "medium": 50.0, "中": 50.0, "中等": 50.0,
+    "high": 80.0, "高": 80.0,
+}
+SUFFIX_MULTIPLIER = {"": 1, "k": 1e3, "千": 1e3, "萬": 1e4, "万": 1e4, "m": 1e6, "百萬": 1e6, "百万": 1e6}
+NUMBER_RE = re.compile(r"(\d+(?:[.,]\d+)*)\s*(百萬|百万|k|m|千|萬|万)?", re.I)
+
+# Score weights: search demand and commercial value up, competition down.
+WEIGHT_VOLUME = 0.6
+WEIGHT_BID = 0.2
+WEIGHT_COMPETITION = 0.2
+
+def _normalize_header(h: str) -> str:
+    return re.sub(r"\s+", "", (h or "").strip().lower()).replace("（", "(").replace("）", ")")
+
+def _map_columns(header: list) -> dict:
+    mapping = {}
+    for i, raw in enumerate(header):
+        h = _normalize_header(raw)
+        for column, aliases in COLUMN_ALIASES:
+            if column not in mapping and any(h.startswith(a) for a in aliases):
+                mapping[column] = i
+                break
+    return mapping
+
+def _parse_number(token: str) -> float:
+    m = NUMBER_RE.search(token or "")
+    if m is None:
+        return float("nan")
+    value = float(m.group(1).replace(",", ""))
+    return value * SUFFIX_MULTIPLIER[(m.group(2) or "").lower()]
+
+def parse_range(cell: str):
+    """'1K – 10K' -> (1000, 10000); '1,300' -> (1300, 1300); '' -> (nan, nan)."""
+    parts = re.split(r"\s*[–—~-]\s*", (cell or "").strip())
+    values = [_parse_number(p) for p in parts if p]
+    if not values:
+        return float("nan"), float("nan")
+    return values[0], values[-1]
+
+@dataclass
+class GkpTable:
+    keywords: np.ndarray
+    volume_low: np.ndarray
+    volume_high: np.ndarray
+    competition: np.ndarray  # 0-100; indexed value if present, else mapped from Low/Medium/High
+    bid_low: np.ndarray
+    bid_high: np.ndarray
+
+    def __len__(self):
+        return len(self.keywords)
+
+    @property
+    def volume(self) -> np.ndarray:
+        # Geometric midpoint of the bucket, so "1K–10K" ranks between 1K and 10K.
+        return np.sqrt(np.maximum(self.volume_low, 0) * np.maximum(self.volume_high, 0))
+
+def _sniff_rows(text: str):
+    lines = text.splitlines()
+    for start, line in enumerate(lines):
+        delimiter = "\t" if "\t" in line else ","
+        header = next(csv.reader([line], delimiter=delimiter))
+        mapping = _map_columns(header)
+        if "keyword" in mapping and len(mapping) > 1:
+            body = io.StringIO("\n".join(lines[start + 1:]))
+            return mapping, csv.reader(body, delimiter=delimiter)
+    return None, None
+
+def _column(rows: list, mapping: dict, name: str) -> list:
+    j = mapping.get(name)
+    if j is None:
+        return [""] * len(rows)
+    return [r[j].strip() if j < len(r) else "" for r in rows]
+
+def _to_floats(cells: list) -> np.ndarray:
+    # Exports repeat the same few values (buckets, levels), so parse each distinct cell once.
+    parsed = {}
+    for c in set(cells):
+        try:
+            parsed[c] = float(c)
+        except ValueError:
+            parsed[c] = _parse_number(c)
+    return np.fromiter((parsed[c] for c in cells), dtype=np.float64, count=len(cells))
+
+def parse_gkp(text: str):
+    """Parse a GKP export or pasted table. Returns ``None`` when no header row is found."""
+    mapping, reader = _sniff_rows(text or "")
+    if mapping is None:
+        return None
+    kw_i = mapping["keyword"]
+    rows = [r for r in reader if len(r) > kw_i and r[kw_i].strip()]
+
+    volume_cells = _column(rows, mapping, "volume")
+    ranges = {c: parse_range(c) for c in set(volume_cells)}
+    competition = _to_floats(_column(rows, mapping, "competition_index"))
+    levels = _column(rows, mapping, "competition")
+    level_values = np.fromiter(
+        (COMPETITION_LEVELS.get(c.lower(), np.nan) for c in levels), dtype=np.float64, count=len(levels)
+    )
+    return GkpTable(
+        keywords=np.array(_column(rows, mapping, "keyword"), dtype=object),
+        volume_low=np.fromiter((ranges[c][0] for c in volume_cells), dtype=np.float64, count=len(rows)),
+        volume_high=np.fromiter((ranges[c][1] for c in volume_cells), dtype=np.float64, count=len(rows)),
+        competition=np.where(np.isnan(competition), level_values, competition),
+        bid_low=_to_floats(_column(rows, mapping, "bid_low")),
+        bid_high=_to_floats(_column(rows, mapping, "bid_high")),
+    )
+
+# ==========================================
+# Vectorized scoring
+# ==========================================
+def _unit_scale(x: np.ndarray) -> np.ndarray:
+    x = np.nan_to_num(x, nan=0.0)
+    top = x.max() if x.size else 0.0
+    return x / top if top > 0 else np.zeros_like(x)
+
+def score_keywords(table: GkpTable) -> np.ndarray:
+    volume = _unit_scale(np.log10(np.nan_to_num(table.volume, nan=0.0) + 1))
+    bid = _unit_scale(np.log1p(np.nan_to_num(np.fmax(table.bid_low, table.bid_high), nan=0.0)))
+    # Unknown competition counts as medium rather than as free traffic.
+    competition = np.nan_to_num(table.competition, nan=50.0) / 100.0
+    return WEIGHT_VOLUME * volume + WEIGHT_BID * bid - WEIGHT_COMPETITION * competition
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    if k >= scores.size:
+        return np.argsort(-scores, kind="stable")
+    idx = np.argpartition(-scores, k)[:k]
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+def aggregate_stats(table: GkpTable) -> dict:
+    volume = table.volume
+    known = ~np.isnan(volume)
+    comp = table.competition
+    return {
+        "rows": len(table),
+        "volume_total": float(np.nansum(volume)),
+        "volume_median": float(np.median(volume[known])) if known.any() else float("nan"),
+        "competition_low": int(np.sum(comp < 34)),
+        "competition_medium": int(np.sum((comp >= 34) & (comp < 67))),
+        "competition_high": int(np.sum(comp >= 67)),
+        "competition_unknown": int(np.sum(np.isnan(comp))),
+        "bid_high_median": float(np.nanmedian(table.bid_high)) if np.any(~np.isnan(table.bid_high)) else float("nan"),
+    }
+
+# ==========================================
+# Prompt embedding
+# ==========================================
+def _fmt(x: float, digits: int = 0) -> str:
+    if x != x:
+        return "-"
+    return f"{x:,.{digits}f}"
+
+def _fmt_range(lo: float, hi: float, digits: int = 0) -> str:
+    if lo != lo and hi != hi:
+        return "-"
+    if lo == hi or hi != hi:
+        return _fmt(lo, digits)
+    return f"{_fmt(lo, digits)}–{_fmt(hi, digits)}"
+
+def _representatives(table: GkpTable, scores: np.ndarray):
+    # Collapse near-duplicate keywords onto their best-scoring spelling;
+    # the others are kept out of the ranking but counted as variants.
+    clusters = cluster_keywords(table.keywords.tolist(), weights=scores)
+    reps = np.fromiter((max(c.indices, key=lambda i: scores[i]) for c in clusters), dtype=np.intp, count=len(clusters))
+    variants = np.zeros(len(table), dtype=np.intp)
+    variants[reps] = [len(c) - 1 for c in clusters]
+    return reps, variants
+
+@memoize(BLOCK_CACHE)
+def gkp_clusters(text: str) -> list:
+    """Near-duplicate keyword clusters of a GKP table (only those with variants)."""
+    table = parse_gkp(text)
+    if table is None or len(table) == 0:
+        return []
+    clusters = cluster_keywords(table.keywords.tolist(), weights=score_keywords(table))
+    return [c for c in clusters if len(c) > 1]
+
+@memoize(BLOCK_CACHE)
+def compact_gkp(text: str, k: int = DEFAULT_TOP_K, dedupe: bool = True) -> str:
+    """Return a pre-ranked top-k table plus aggregate stats, or ``text`` unchanged if it isn't a GKP table.
+
+    With ``dedupe`` near-duplicate keywords (spacing, simplified/traditional,
+    reordered tokens) are ranked once, under their best-scoring spelling.
+    """
+    table = parse_gkp(text)
+    if table is None or len(table) == 0:
+        return text
+    scores = score_keywords(table)
+    stats = aggregate_stats(table)
+    if dedupe:
+        reps, variants = _representatives(table, scores)
+        order = reps[top_k(scores[reps], k)]
+    else:
+        variants = None
+        order = top_k(scores, k)
+    lines = [
+        f"【GKP 本地預排序｜共 {stats['rows']:,} 列，以下為分數前 {len(order)} 名】",
+    ]
+    if dedupe:
+        lines.append(f"- 近似變體合併後共 {len(reps):,} 組關鍵字（表中「變體」為併入該列的寫法數）")
+    lines += [
+        f"- 總月搜尋量（區間中位估計）：{_fmt(stats['volume_total'])}；中位數：{_fmt(stats['volume_median'])}",
+        f"- 競爭程度分布：低 {stats['competition_low']} / 中 {stats['competition_medium']}"
+        f" / 高 {stats['competition_high']} / 未知 {stats['competition_unknown']}",
+        f"- 首頁頂端出價（高）中位數：{_fmt(stats['bid_high_median'], 2)}",
+        f"- 分數 = {WEIGHT_VOLUME}×搜尋量(log) + {WEIGHT_BID}×出價(log) − {WEIGHT_COMPETITION}×競爭度（皆正規化）",
+        "",
+    ]
+    if dedupe:
+        lines += ["| # | 關鍵字 | 變體 | 月搜尋量 | 競爭(0–100) | 出價區間 | 分數 |", "|---|---|---|---|---|---|---|"]
+    else:
+        lines += ["| # | 關鍵字 | 月搜尋量 | 競爭(0–100) | 出價區間 | 分數 |", "|---|---|---|---|---|---|"]
+    for rank, i in enumerate(order, 1):
+        variant_cell = f" | {variants[i]}" if dedupe else ""
+        lines.append(
+            f"| {rank} | {table.keywords[i]}{variant_cell} | {_fmt_range(table.volume_low[i], table.volume_high[i])}"
+            f" | {_fmt(table.competition[i])} | {_fmt_range(table.bid_low[i], table.bid_high[i], 2)}"
+            f" | {scores[i]:.3f} |"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,178 @@
+import difflib
+import json
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+
+from cache import HISTORY_CACHE, content_hash
+from packet import ProjectPacket
+
+# ==========================================
+# Section-level packet history
+# ==========================================
+# Every applied packet is split into segments, one per section (marker to the
+# next section's marker), plus the preamble before the first section.
+# Segments are content-addressed: a version is a list of (section, hash),
+# so an unchanged section costs nothing. A changed section is stored as a
+# zlib-compressed line delta against that section's previous content, with
+# a full keyframe every KEYFRAME_EVERY deltas to keep checkout chains short.
+KEYFRAME_EVERY = 8
+PREAMBLE = ""
+
+SECTION_ADDED = "added"
+SECTION_REMOVED = "removed"
+SECTION_CHANGED = "changed"
+
+def split_segments(packet) -> list:
+    """``[(section name, text), ...]`` whose texts concatenate back to the packet."""
+    index = packet if isinstance(packet, ProjectPacket) else ProjectPacket(packet or "")
+    text = index.text
+    starts = sorted((s.start, name) for name, s in index.sections.items())
+    cuts = [0] + [start for start, _ in starts] + [len(text)]
+    names = [PREAMBLE] + [name for _, name in starts]
+    return [(names[i], text[cuts[i]:cuts[i + 1]]) for i in range(len(names)) if cuts[i] < cuts[i + 1] or i]
+
+def _encode_delta(base: str, new: str) -> list:
+    # ["=", i1, i2] copies base lines i1:i2; a plain string is inserted as-is.
+    base_lines = base.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(["=", i1, i2])
+        elif j1 < j2:
+            ops.append("".join(new_lines[j1:j2]))
+    return ops
+
+def _apply_delta(base: str, ops: list) -> str:
+    base_lines = base.splitlines(keepends=True)
+    return "".join(op if isinstance(op, str) else "".join(base_lines[op[1]:op[2]]) for op in ops)
+
+@dataclass
+class Blob:
+    base: str     # hash of the segment this one is a delta against; "" for a keyframe
+    depth: int    # deltas between this blob and its keyframe
+    payload: bytes
+
+@dataclass
+class Version:
+    number: int
+    digest: str
+    segments: tuple  # ((section name, blob hash), ...)
+    note: str = ""
+    created: float = field(default_factory=time.time)
+    size: int = 0  # packet length in chars
+
+@dataclass
+class SectionDiff:
+    name: str
+    status: str
+    diff: str
+
+class PacketHistory:
+    def __init__(self, keyframe_every: int = KEYFRAME_EVERY):
+        self.keyframe_every = keyframe_every
+        self.blobs = {}
+        self.versions = []
+        # One history can be shared by every session editing the same project.
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.versions)
+
+    @property
+    def head(self):
+        return self.versions[-1] if self.versions else None
+
+    # ---------- write ----------
+    def commit(self, packet, note: str = ""):
+        """Record ``packet`` as a new version; returns it, or ``None`` if nothing changed."""
+        text = packet.text if isinstance(packet, ProjectPacket) else packet or ""
+        digest = packet.digest if isinstance(packet, ProjectPacket) else content_hash(text)
+        segments = [(name, segment, content_hash(segment)) for name, segment in split_segments(packet)]
+        with self._lock:
+            return self._commit(text, digest, segments, note)
+
+    def _commit(self, text: str, digest: str, segments: list, note: str):
+        head = self.head
+        if head is not None and head.digest == digest:
+            return None
+        previous = dict(head.segments) if head is not None else {}
+        for name, segment, h in segments:
+            if h not in self.blobs:
+                self.blobs[h] = self._encode(segment, previous.get(name, ""))
+                HISTORY_CACHE.put(h, segment)
+        segments = tuple((name, h) for name, _, h in segments)
+        version = Version(len(self.versions) + 1, digest, segments, note, size=len(text))
+        self.versions.append(version)
+        return version
+
+    def _encode(self, segment: str, base_hash: str) -> Blob:
+        base = self.blobs.get(base_hash)
+        if base is not None and base.depth + 1 < self.keyframe_every:
+            delta = Blob(base_hash, base.depth + 1, zlib.compress(
+                json.dumps(_encode_delta(self.segment(base_hash), segment), ensure_ascii=False).encode("utf-8")
+            ))
+            full = zlib.compress(segment.encode("utf-8"))
+            # Rewritten sections can delta worse than they compress.
+            if len(delta.payload) < len(full):
+                return delta
+            return Blob("", 0, full)
+        return Blob("", 0, zlib.compress(segment.encode("utf-8")))
+
+    # ---------- read ----------
+    def segment(self, h: str) -> str:
+        # Walk down to the nearest decoded segment or keyframe, then replay the deltas upwards.
+        chain = []
+        while True:
+            text = HISTORY_CACHE.get(h)
+            if text is not None:
+                break
+            blob = self.blobs[h]
+            if not blob.base:
+                text = HISTORY_CACHE.put(h, zlib.decompress(blob.payload).decode("utf-8"))
+                break
+            chain.append((h, blob))
+            h = blob.base
+        for h, blob in reversed(chain):
+            ops = json.loads(zlib.decompress(blob.payload).decode("utf-8"))
+            text = HISTORY_CACHE.put(h, _apply_delta(text, ops))
+        return text
+
+    def version(self, number: int) -> Version:
+        if not 1 <= number <= len(self.versions):
+            raise KeyError(f"no packet version {number}")
+        return self.versions[number - 1]
+
+    def checkout(self, number: int) -> str:
+        return "".join(self.segment(h) for _, h in self.version(number).segments)
+
+    def diff(self, old: int, new: int, context: int = 2) -> list:
+        """Per-section unified diffs between two versions; unchanged sections are skipped."""
+        a = dict(self.version(old).segments)
+        b = dict(self.version(new).segments)
+        out = []
+        for name in list(b) + [n for n in a if n not in b]:
+            ha, hb = a.get(name), b.get(name)
+            if ha == hb:
+                continue
+            status = SECTION_ADDED if ha is None else SECTION_REMOVED if hb is None else SECTION_CHANGED
+            lines = difflib.unified_diff(
+                self.segment(ha).splitlines(keepends=True) if ha else [],
+                self.segment(hb).splitlines(keepends=True) if hb else [],
+                fromfile=f"v{old}", tofile=f"v{new}", n=context,
+            )
+            out.append(SectionDiff(name or "(封包開頭)", status, "".join(lines)))
+        return out
+
+    def stats(self) -> dict:
+        stored = sum(len(b.payload) for b in self.blobs.values())
+        return {
+            "versions": len(self.versions),
+            "blobs": len(self.blobs),
+            "stored_bytes": stored,
+            # What full copies of every version would have cost.
+            "raw_chars": sum(v.size for v in self.versions),
+        }
@@ -0,0 +1,192 @@
+import re
+import unicodedata
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from cache import BLOCK_CACHE, memoize
+
+# ==========================================
+# Near-duplicate keyword clustering
+# ==========================================
+# Two passes, both sub-quadratic:
+#   1) exact grouping on a canonical key (NFKC, lowercase, simplified ->
+#      traditional, punctuation/spacing removed), plus a separate word-order
+#      key (the same tokens, sorted) so "推薦 益生菌" meets "益生菌 推薦";
+#   2) MinHash + LSH banding over character bigrams of the canonical keys,
+#      with candidates confirmed by estimated Jaccard similarity. Keys whose
+#      digit or Latin tokens differ are never merged here: "iphone 15" vs
+#      "iphone 16" or "維他命c" vs "維他命d" are separately searched keywords.
+DEFAULT_THRESHOLD = 0.7
+NUM_PERM = 32
+BANDS = 8  # 8 bands x 4 rows: candidates from ~0.6 similarity, confirmed against the threshold
+_RNG = np.random.default_rng(20240601)
+# Multiply-shift hashing: (a*x + b) mod 2^64 with odd a, keeping the high 32 bits.
+_PERM_A = _RNG.integers(1, 1 << 63, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _RNG.integers(0, 1 << 63, size=NUM_PERM, dtype=np.uint64)
+
+# Common simplified -> traditional pairs in SEO keyword lists. Not exhaustive;
+# it only has to make the usual variants collide.
+_S2T_PAIRS = (
+    "么麼 为為 习習 书書 买買 乱亂 争爭 于於 亚亞 产產 亲親 价價 优優 会會 传傳 体體 佣傭 儿兒 关關 兴興 养養 减減 几幾 "
+    "凤鳳 击擊 划劃 则則 刚剛 创創 删刪 办辦 务務 动動 劳勞 势勢 区區 医醫 华華 单單 卖賣 卫衛 历歷 压壓 厅廳 发發 变變 "
+    "号號 吗嗎 听聽 启啟 员員 问問 国國 图圖 园園 场場 块塊 坏壞 声聲 处處 备備 复復 头頭 夹夾 奋奮 妈媽 学學 宝寶 实實 "
+    "宠寵 对對 导導 将將 岁歲 币幣 师師 带帶 帮幫 广廣 应應 庆慶 库庫 开開 张張 录錄 彻徹 征徵 忆憶 怀懷 态態 总總 恋戀 "
+    "护護 报報 担擔 挤擠 损損 换換 据據 摄攝 数數 断斷 无無 旧舊 时時 显顯 机機 杂雜 权權 来來 极極 构構 标標 样樣 检檢 "
+    "气氣 汉漢 没沒 测測 济濟 浏瀏 点點 热熱 爱愛 牵牽 状狀 独獨 环環 现現 电電 疗療 监監 盖蓋 码碼 础礎 种種 积積 "
+    "称稱 稳穩 竞競 笔筆 类類 粮糧 纪紀 约約 级級 纯純 线線 练練 组組 经經 结結 绍紹 给給 统統 维維 综綜 网網 罗羅 职職 "
+    "联聯 肤膚 脑腦 节節 药藥 营營 虑慮 补補 装裝 见見 观觀 规規 视視 览覽 计計 订訂 认認 让讓 训訓 议議 记記 讲講 设設 "
+    "访訪 证證 评評 识識 诉訴 词詞 试試 询詢 该該 说說 请請 读讀 课課 谁誰 调調 谈談 质質 购購 费費 资資 赛賽 软軟 轻輕 "
+    "较較 输輸 边邊 过過 运運 还還 这這 进進 选選 递遞 邮郵 钱錢 铁鐵 银銀 错錯 长長 门門 间間 队隊 阶階 际際 "
+    "陈陳 险險 随隨 难難 预預 题題 风風 饮飲 饭飯 马馬 验驗 鱼魚 鸡雞 齿齒 肠腸 里裡 荐薦"
+)
+_S2T = str.maketrans({p[0]: p[1] for p in _S2T_PAIRS.split()})
+
+_PUNCT_RE = re.compile(r"[\s\-_/\\|,.，。、！？!?：:；;'\"“”‘’()（）\[\]【】「」『』<>《》+·•]+")
+_TOKEN_SPLIT_RE = re.compile(r"[\s,，、/|]+")
+_MARK_RE = re.compile(r"\d+|[a-z]+")
+
+def _normalize(keyword: str) -> str:
+    return unicodedata.normalize("NFKC", keyword or "").lower().translate(_S2T)
+
+def canonical(keyword: str) -> str:
+    """Spacing/punctuation-free key: "益生菌 推薦" == "益生菌推薦", "維他命 C" == "維他命c"."""
+    return _PUNCT_RE.sub("", _normalize(keyword))
+
+def reorder_key(keyword: str) -> str:
+    """Word-order-free key: the space separated tokens, sorted. Empty for one-token keywords."""
+    tokens = [t for t in (_PUNCT_RE.sub("", t) for t in _TOKEN_SPLIT_RE.split(_normalize(keyword))) if t]
+    return " ".join(sorted(tokens)) if len(tokens) > 1 else ""
+
+def token_marks(key: str) -> tuple:
+    """The digit and Latin tokens of a canonical key, sorted; similar keys must agree on these to merge."""
+    return tuple(sorted(_MARK_RE.findall(key)))
+
+def _shingles(key: str) -> set:
+    if len(key) < 3:
+        return {key}
+    return {key[i:i + 2] for i in range(len(key) - 1)}
+
+@dataclass
+class Cluster:
+    representative: str
+    members: list = field(default_factory=list)
+    indices: list = field(default_factory=list)  # positions in the input list
+
+    def __len__(self):
+        return len(self.members)
+
+class _DisjointSet:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, a: int, b: int):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+def minhash_signatures(keys: list) -> np.ndarray:
+    """One row of NUM_PERM minhash values per (non-empty) key, computed for all keys at once."""
+    # Shingles are interned to small ints first; the hash family does the mixing.
+    vocab = {}
+    starts = []
+    ids = []
+    for key in keys:
+        starts.append(len(ids))
+        # Sorted, so shingle ids (and the signatures) do not depend on the string hash seed.
+        ids.extend(vocab.setdefault(s, len(vocab)) for s in sorted(_shingles(key)))
+    x = np.asarray(ids, dtype=np.uint64)[:, None]
+    with np.errstate(over="ignore"):
+        permuted = (_PERM_A * x + _PERM_B) >> np.uint64(32)
+    # Shingles of one key are contiguous, so a segmented min gives the signature.
+    return np.minimum.reduceat(permuted, np.asarray(starts, dtype=np.intp), axis=0)
+
+def cluster_keywords(keywords: list, threshold: float = DEFAULT_THRESHOLD, weights=None) -> list:
+    """Group near-duplicate keywords.
+
+    ``weights`` (e.g. search volume or score) picks the representative of each
+    cluster; without it the first occurrence wins. Clusters come back in
+    first-seen order. Keywords that normalize to nothing are left out.
+    """
+    order = {}
+    groups = []
+    for i, kw in enumerate(keywords):
+        key = canonical(kw)
+        if not key:
+            continue
+        g = order.get(key)
+        if g is None:
+            order[key] = g = len(groups)
+            groups.append([])
+        groups[g].append(i)
+
+    ds = _DisjointSet(len(groups))
+    # Word-order variants only: compared on their own key, never mixed into canonical().
+    reordered = {}
+    for key, g in order.items():
+        rkey = reorder_key(keywords[groups[g][0]])
+        if rkey:
+            ds.union(reordered.setdefault(rkey, g), g)
+    if len(groups) > 1:
+        keys = list(order)
+        key_marks = [token_marks(key) for key in keys]
+        sig = minhash_signatures(keys)
+        rows = NUM_PERM // BANDS
+        mix = _PERM_A[:rows]
+        for band in range(BANDS):
+            with np.errstate(over="ignore"):
+                band_keys = (sig[:, band * rows:(band + 1) * rows] * mix).sum(axis=1)
+            # Compare every key with the first key that landed in its bucket.
+            _, first_of, bucket = np.unique(band_keys, return_index=True, return_inverse=True)
+            first = first_of[bucket.ravel()]
+            cand = np.flatnonzero(first != np.arange(len(groups)))
+            agree = np.count_nonzero(sig[first[cand]] == sig[cand], axis=1) >= threshold * NUM_PERM
+            for a, b in zip(first[cand[agree]].tolist(), cand[agree].tolist()):
+                if key_marks[a] == key_marks[b]:
+                    ds.union(a, b)
+
+    merged = {}
+    for g in range(len(groups)):
+        merged.setdefault(ds.find(g), []).extend(groups[g])
+    clusters = []
+    for members in merged.values():
+        members.sort()
+        best = members[0] if weights is None else max(members, key=lambda i: (weights[i], -i))
+        clusters.append(Cluster(keywords[best].strip(), [keywords[i].strip() for i in members], members))
+    clusters.sort(key=lambda c: c.indices[0])
+    return clusters
+
+def line_keyword(line: str) -> str:
+    """The keyword of a list line, or the first non-empty cell of a table row."""
+    if "|" not in line:
+        return line
+    return next((cell.strip() for cell in line.strip().strip("|").split("|") if cell.strip()), "")
+
+def dedupe_lines(text: str, threshold: float = DEFAULT_THRESHOLD):
+    """Drop lines whose keyword is a near-duplicate of an earlier line's.
+
+    Works on keyword lists and on table rows alike; rows are compared on
+    their keyword (first) cell only, never on the whole row. The first line
+    of each cluster is kept where it was, the rest are dropped, and lines
+    with no keyword content (blank lines, table rules) pass through untouched.
+    Returns ``(compact_text, clusters)``; only clusters with variants are returned.
+    """
+    lines = (text or "").splitlines()
+    clusters = [c for c in cluster_keywords([line_keyword(line) for line in lines], threshold) if len(c) > 1]
+    if not clusters:
+        return text, []
+    dropped = {i for c in clusters for i in c.indices[1:]}
+    kept = [line for i, line in enumerate(lines) if i not in dropped]
+    kept.append(f"（本地已合併 {len(dropped)} 個近似變體，保留各組首次出現的寫法）")
+    return "\n".join(kept), clusters
+
+@memoize(BLOCK_CACHE)
+def compact_keyword_text(text: str) -> tuple:
+    return dedupe_lines(text)
@@ -0,0 +1,166 @@
+import math
+import re
+import unicodedata
+import zlib
+
+import numpy as np
+
+from chunked import outline_field
+from overlap import KEYWORD_FIELD
+from packet import ProjectPacket, card_fields
+
+# ==========================================
+# Internal-link candidates from card similarity
+# ==========================================
+# Each article card (title, keywords, Winning Angle, outline) becomes a TF-IDF
+# vector over hashed tokens: character bigrams for CJK runs, whole words for
+# Latin/digits. Hashing keeps the feature space fixed, so a changed or new
+# card only rewrites its own row and its row/column of the cosine similarity
+# matrix. IDF is refreshed together with the full matrix once enough rows
+# have changed since the last rebuild.
+DIM = 1 << 12
+DEFAULT_LINKS = 5
+MIN_SIMILARITY = 0.08
+# Full rebuild (fresh IDF) once this share of the rows changed incrementally.
+REFRESH_FRACTION = 0.25
+
+FIELD_WEIGHTS = (("標題", 2.0), (KEYWORD_FIELD, 2.0), ("Winning Angle", 1.0))
+OUTLINE_WEIGHT = 1.0
+TOKEN_RE = re.compile(r"[a-z0-9]+|[\u3400-\u9fff\uf900-\ufaff]+")
+
+def tokens(text: str) -> list:
+    out = []
+    for run in TOKEN_RE.findall(unicodedata.normalize("NFKC", text or "").lower()):
+        if run.isascii() or len(run) == 1:
+            out.append(run)
+        else:
+            out += [run[i:i + 2] for i in range(len(run) - 1)]
+    return out
+
+def card_features(card_text: str, dim: int = DIM) -> np.ndarray:
+    """Log-scaled, field-weighted term frequencies of one card over ``dim`` hashed buckets."""
+    fields = card_fields(card_text)
+    parts = [(fields.get(name, ""), weight) for name, weight in FIELD_WEIGHTS]
+    parts.append((outline_field(card_text), OUTLINE_WEIGHT))
+    counts = {}
+    for text, weight in parts:
+        for token in tokens(text):
+            bucket = zlib.crc32(token.encode("utf-8")) & (dim - 1)
+            counts[bucket] = counts.get(bucket, 0.0) + weight
+    row = np.zeros(dim, np.float32)
+    for bucket, count in counts.items():
+        row[bucket] = 1.0 + math.log(count)
+    return row
+
+def _normalize(rows: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(rows, axis=-1, keepdims=True)
+    return rows / np.maximum(norms, 1e-12)
+
+class LinkIndex:
+    def __init__(self, dim: int = DIM):
+        self.dim = dim
+        self.ids = []      # row -> article_id
+        self.rows = {}     # article_id -> row
+        self.texts = {}    # article_id -> card text the row was built from
+        self.titles = {}
+        self.tf = np.zeros((0, dim), np.float32)
+        self.df = np.zeros(dim, np.int32)
+        self.idf = np.ones(dim, np.float32)
+        self.vectors = np.zeros((0, dim), np.float32)  # tf * idf, L2-normalized
+        self.similarity = np.zeros((0, 0), np.float32)
+        self.changes = 0  # rows rewritten since the IDF was last refreshed
+        self._digest = None
+
+    def sync(self, packet) -> set:
+        """Bring the index up to date with ``packet``; returns the IDs of re-vectorized cards."""
+        index = packet if isinstance(packet, ProjectPacket) else ProjectPacket(packet or "")
+        if index.digest == self._digest:
+            return set()
+        self._digest = index.digest
+        ids = index.card_ids()
+        texts = {aid: index.card(aid) for aid in ids}
+        changed = [aid for aid in ids if self.texts.get(aid) != texts[aid]]
+        removed = set(self.rows) - set(texts)
+        if removed or self.changes + len(changed) > REFRESH_FRACTION * len(ids):
+            self.rebuild(ids, texts)
+            return set(changed) | removed
+        for aid in changed:
+            self._set_row(aid, texts[aid])
+        self.changes += len(changed)
+        return set(changed)
+
+    def rebuild(self, ids: list, texts: dict):
+        self.ids = list(ids)
+        self.rows = {aid: i for i, aid in enumerate(self.ids)}
+        self.texts = dict(texts)
+        self.titles = {aid: card_fields(texts[aid]).get("標題", "") for aid in self.ids}
+        self.tf = np.zeros((len(self.ids), self.dim), np.float32)
+        for i, aid in enumerate(self.ids):
+            self.tf[i] = card_features(texts[aid], self.dim)
+        self.df = np.count_nonzero(self.tf, axis=0).astype(np.int32)
+        n = len(self.ids)
+        self.idf = (np.log((1.0 + n) / (1.0 + self.df)) + 1.0).astype(np.float32)
+        self.vectors = _normalize(self.tf * self.idf)
+        self.similarity = self.vectors @ self.vectors.T
+        self.changes = 0
+
+    def _set_row(self, aid: str, text: str):
+        row = card_features(text, self.dim)
+        vector = _normalize(row * self.idf)
+        i = self.rows.get(aid)
+        if i is None:
+            i = self.rows[aid] = len(self.ids)
+            self.ids.append(aid)
+            self.tf = np.vstack([self.tf, row])
+            self.vectors = np.vstack([self.vectors, vector])
+            self.similarity = np.pad(self.similarity, ((0, 1), (0, 1)))
+        else:
+            self.df -= self.tf[i] > 0
+            self.tf[i] = row
+            self.vectors[i] = vector
+        self.df += row > 0
+        self.texts[aid] = text
+        self.titles[aid] = card_fields(text).get("標題", "")
+        sims = self.vectors @ vector
+        self.similarity[i, :] = sims
+        self.similarity[:, i] = sims
+
+    def related(self, article_id: str, k: int = DEFAULT_LINKS, min_similarity: float = MIN_SIMILARITY) -> list:
+        """``[(article_id, similarity), ...]`` of the ``k`` most similar other cards."""
+        i = self.rows.get((article_id or "").strip())
+        if i is None or k <= 0:
+            return []
+        scores = self.similarity[i].copy()
+        scores[i] = -1.0
+        return self._top(scores, k, min_similarity)
+
+    def related_all(self, k: int = DEFAULT_LINKS, min_similarity: float = MIN_SIMILARITY) -> dict:
+        """Top-``k`` related cards of every card, from one partition over the whole matrix."""
+        n = len(self.ids)
+        if n < 2 or k <= 0:
+            return {aid: [] for aid in self.ids}
+        scores = self.similarity.copy()
+        np.fill_diagonal(scores, -1.0)
+        k = min(k, n - 1)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        picked = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-picked, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        picked = np.take_along_axis(picked, order, axis=1)
+        return {
+            aid: [(self.ids[j], float(s)) for j, s in zip(top[i].tolist(), picked[i].tolist()) if s >= min_similarity]
+            for i, aid in enumerate(self.ids)
+        }
+
+    def _top(self, scores: np.ndarray, k: int, min_similarity: float) -> list:
+        k = min(k, len(scores) - 1)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[j], float(scores[j])) for j in top.tolist() if scores[j] >= min_similarity]
+
+    def format_related(self, related: list) -> str:
+        return "\n".join(
+            f"- {aid}｜{self.titles.get(aid) or '（未命名）'}（相似度 {score:.2f}）" for aid, score in related
+        )
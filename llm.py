@@ -0,0 +1,462 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import ssl
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+from responses import ResponseCache, response_key
+
+# ==========================================
+# OpenAI-compatible LLM execution (asyncio, stdlib only)
+# ==========================================
+# A small HTTP/1.1 client over asyncio streams: keep-alive connections are
+# pooled per host, a semaphore bounds concurrent requests, retryable failures
+# back off exponentially (honouring Retry-After), and chat completions are
+# streamed as server-sent events. `python llm.py serve` starts a local
+# stand-in server for trying all of this without a real endpoint.
+DEFAULT_BASE_URL = os.environ.get("OPENAI_BASE_URL", "http://127.0.0.1:8765/v1")
+DEFAULT_MODEL = os.environ.get("LLM_MODEL", "gpt-4o-mini")
+DEFAULT_CONCURRENCY = 8
+RETRY_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+class LLMError(Exception):
+    def __init__(self, message: str, status: int = 0, retry_after: float = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status == 0 or self.status in RETRY_STATUSES
+
+@dataclass
+class LLMConfig:
+    base_url: str = DEFAULT_BASE_URL
+    api_key: str = os.environ.get("OPENAI_API_KEY", "")
+    model: str = DEFAULT_MODEL
+    temperature: float = 0.7
+    max_tokens: int = 0  # 0 = let the server decide
+    concurrency: int = DEFAULT_CONCURRENCY
+    max_retries: int = 4
+    backoff: float = 0.5      # first retry waits up to this many seconds
+    max_backoff: float = 20.0
+    timeout: float = 120.0    # per read, so long streams are fine as long as tokens keep coming
+
+# ==========================================
+# Connection pool + HTTP/1.1
+# ==========================================
+class _Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @property
+    def usable(self) -> bool:
+        return not self.writer.is_closing() and not self.reader.at_eof()
+
+    def close(self):
+        self.writer.close()
+
+class ConnectionPool:
+    def __init__(self, max_idle: int = DEFAULT_CONCURRENCY):
+        self.max_idle = max_idle
+        self.opened = 0
+        self.reused = 0
+        self._idle = {}
+
+    async def acquire(self, scheme: str, host: str, port: int, timeout: float) -> _Connection:
+        idle = self._idle.get((scheme, host, port), [])
+        while idle:
+            conn = idle.pop()
+            if conn.usable:
+                self.reused += 1
+                return conn
+            conn.close()
+        context = ssl.create_default_context() if scheme == "https" else None
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=context, limit=1 << 20), timeout
+        )
+        self.opened += 1
+        return _Connection(reader, writer)
+
+    def release(self, key: tuple, conn: _Connection, reusable: bool):
+        idle = self._idle.setdefault(key, [])
+        if reusable and conn.usable and len(idle) < self.max_idle:
+            idle.append(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        for idle in self._idle.values():
+            for conn in idle:
+                conn.close()
+        self._idle.clear()
+
+async def _read_line(conn: _Connection, timeout: float) -> bytes:
+    line = await asyncio.wait_for(conn.reader.readline(), timeout)
+    if not line:
+        raise LLMError("connection closed by server")
+    return line
+
+async def _read_head(conn: _Connection, timeout: float):
+    status_line = (await _read_line(conn, timeout)).decode("latin-1")
+    try:
+        status = int(status_line.split(" ", 2)[1])
+    except (IndexError, ValueError):
+        raise LLMError(f"malformed status line: {status_line.strip()[:200]!r}") from None
+    headers = {}
+    while True:
+        line = (await _read_line(conn, timeout)).decode("latin-1").strip()
+        if not line:
+            return status, headers
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+async def _iter_body(conn: _Connection, headers: dict, timeout: float):
+    reader = conn.reader
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        while True:
+            line = await _read_line(conn, timeout)
+            try:
+                size = int(line.split(b";")[0], 16)
+            except ValueError:
+                raise LLMError(f"malformed chunk size: {line.strip()[:200]!r}") from None
+            if size == 0:
+                while (await _read_line(conn, timeout)).strip():
+                    pass  # trailers
+                return
+            yield await asyncio.wait_for(reader.readexactly(size), timeout)
+            await asyncio.wait_for(reader.readexactly(2), timeout)
+    elif "content-length" in headers:
+        remaining = int(headers["content-length"])
+        while remaining:
+            chunk = await asyncio.wait_for(reader.read(min(remaining, 65536)), timeout)
+            if not chunk:
+                raise LLMError("connection closed mid-body")
+            remaining -= len(chunk)
+            yield chunk
+    else:
+        while chunk := await asyncio.wait_for(reader.read(65536), timeout):
+            yield chunk
+
+def _retry_after(headers: dict):
+    try:
+        return float(headers.get("retry-after", ""))
+    except ValueError:
+        return None
+
+# ==========================================
+# Client
+# ==========================================
+class AsyncLLMClient:
+    def __init__(self, config: LLMConfig = None, cache: ResponseCache = None):
+        self.config = config or LLMConfig()
+        self.cache = cache
+        url = urlsplit(self.config.base_url.rstrip("/"))
+        self._scheme = url.scheme or "http"
+        self._host = url.hostname or "127.0.0.1"
+        default_port = 443 if self._scheme == "https" else 80
+        self._port = url.port or default_port
+        # Virtual-hosted proxies route on Host, so a non-default port has to be in it.
+        host = f"[{self._host}]" if ":" in self._host else self._host
+        self._host_header = host if self._port == default_port else f"{host}:{self._port}"
+        self._path = (url.path or "") + "/chat/completions"
+        self.pool = ConnectionPool(max_idle=self.config.concurrency)
+        self._semaphore = None
+        self.requests = 0
+        self.retries = 0
+
+    def _payload(self, prompt: str, params: dict) -> bytes:
+        body = {
+            "model": params.get("model", self.config.model),
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": params.get("temperature", self.config.temperature),
+            "stream": True,
+        }
+        max_tokens = params.get("max_tokens", self.config.max_tokens)
+        if max_tokens:
+            body["max_tokens"] = max_tokens
+        return json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+    def _backoff(self, attempt: int, retry_after) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.config.max_backoff)
+        # Full jitter keeps a burst of 429s from retrying in lockstep.
+        return random.uniform(0, min(self.config.max_backoff, self.config.backoff * 2 ** attempt))
+
+    async def _stream_once(self, payload: bytes, outcome: dict):
+        """Yield the deltas of one request. ``outcome`` gets ``done`` (``data: [DONE]`` seen) and
+        ``finish_reason`` (the last one reported), so the caller can tell a complete answer from a cut one."""
+        timeout = self.config.timeout
+        key = (self._scheme, self._host, self._port)
+        conn = None
+        reusable = False
+        try:
+            conn = await self.pool.acquire(*key, timeout)
+            head = (
+                f"POST {self._path} HTTP/1.1\r\n"
+                f"Host: {self._host_header}\r\n"
+                "Content-Type: application/json\r\n"
+                "Accept: text/event-stream\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                "Connection: keep-alive\r\n"
+            )
+            if self.config.api_key:
+                head += f"Authorization: Bearer {self.config.api_key}\r\n"
+            conn.writer.write(head.encode("latin-1") + b"\r\n" + payload)
+            await conn.writer.drain()
+            self.requests += 1
+            status, headers = await _read_head(conn, timeout)
+            if status >= 400:
+                body = b"".join([chunk async for chunk in _iter_body(conn, headers, timeout)])
+                reusable = headers.get("connection", "").lower() != "close"
+                raise LLMError(
+                    f"HTTP {status}: {body[:500].decode('utf-8', 'replace')}", status, _retry_after(headers)
+                )
+            buffer = b""
+            done = False
+            async for chunk in _iter_body(conn, headers, timeout):
+                buffer += chunk
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    line = line.strip()
+                    if not line.startswith(b"data:") or done:
+                        continue
+                    data = line[5:].strip()
+                    if data == b"[DONE]":
+                        done = True
+                        continue
+                    try:
+                        event = json.loads(data)
+                        choices = event.get("choices") or []
+                        deltas = [
+                            (choice.get("delta") or {}).get("content") or (choice.get("message") or {}).get("content")
+                            for choice in choices
+                        ]
+                        outcome["finish_reason"] = next(
+                            (c["finish_reason"] for c in choices if c.get("finish_reason")), outcome.get("finish_reason")
+                        )
+                    except (ValueError, AttributeError, TypeError):
+                        # status 0: retried like a dropped connection, as long as nothing was yielded yet.
+                        raise LLMError(f"malformed stream event: {data[:200].decode('utf-8', 'replace')!r}") from None
+                    for delta in deltas:
+                        if delta:
+                            yield delta
+            outcome["done"] = done
+            reusable = headers.get("connection", "").lower() != "close" and (
+                "content-length" in headers or "chunked" in headers.get("transfer-encoding", "").lower()
+            )
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            raise LLMError(f"{type(e).__name__}: {e}") from e
+        finally:
+            if conn is not None:
+                self.pool.release(key, conn, reusable)
+
+    def cache_key(self, prompt: str, params: dict) -> str:
+        return response_key(
+            prompt,
+            self.config.base_url,
+            params.get("model", self.config.model),
+            params.get("temperature", self.config.temperature),
+            params.get("max_tokens", self.config.max_tokens),
+        )
+
+    async def stream(self, prompt: str, bypass_cache: bool = False, **params):
+        """Yield response text deltas. Retries only before the first delta has been yielded.
+
+        With a response cache, a cached answer is yielded as a single delta;
+        ``bypass_cache`` skips the lookup but still stores the fresh answer.
+        """
+        key = None
+        if self.cache is not None:
+            key = self.cache_key(prompt, params)
+            if bypass_cache:
+                self.cache.bypassed += 1
+            else:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    yield cached
+                    return
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.config.concurrency)
+        payload = self._payload(prompt, params)
+        async with self._semaphore:
+            for attempt in range(self.config.max_retries + 1):
+                emitted, outcome = [], {}
+                try:
+                    async for delta in self._stream_once(payload, outcome):
+                        emitted.append(delta)
+                        yield delta
+                    if not outcome.get("done"):
+                        # status 0: retried like a dropped connection, as long as nothing was yielded yet.
+                        raise LLMError("stream ended before data: [DONE]")
+                    # Only complete answers are cached, never a stream cut short or stopped at max_tokens.
+                    if key is not None and outcome.get("finish_reason") != "length":
+                        self.cache.put(key, "".join(emitted), params.get("model", self.config.model))
+                    return
+                except LLMError as e:
+                    if emitted or not e.retryable or attempt == self.config.max_retries:
+                        raise
+                    self.retries += 1
+                    await asyncio.sleep(self._backoff(attempt, e.retry_after))
+
+    async def complete(self, prompt: str, bypass_cache: bool = False, **params) -> str:
+        return "".join([delta async for delta in self.stream(prompt, bypass_cache, **params)])
+
+    async def complete_many(self, prompts: list, on_done=None, bypass_cache: bool = False, **params) -> list:
+        """Run prompts concurrently (bounded by ``config.concurrency``).
+
+        Returns responses in input order; a failed prompt yields its LLMError
+        instead of cancelling the rest. ``on_done(i, result)`` fires as each finishes.
+        """
+        async def one(i, prompt):
+            try:
+                result = await self.complete(prompt, bypass_cache, **params)
+            except LLMError as e:
+                result = e
+            if on_done is not None:
+                on_done(i, result)
+            return result
+        return await asyncio.gather(*(one(i, p) for i, p in enumerate(prompts)))
+
+    def stats(self) -> dict:
+        return {
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "requests": self.requests,
+            "retries": self.retries,
+            "connections_opened": self.pool.opened,
+            "connections_reused": self.pool.reused,
+        }
+
+    def close(self):
+        self.pool.close()
+
+# ==========================================
+# Sync bridge (Streamlit scripts are synchronous)
+# ==========================================
+class LoopThread:
+    """An event loop on a daemon thread, so pooled connections outlive a script rerun."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="llm-loop", daemon=True).start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        return self.submit(coro).result()
+
+    def iterate(self, agen):
+        """Drive an async generator from synchronous code, one item at a time."""
+        try:
+            while True:
+                try:
+                    yield self.run(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run(agen.aclose())
+
+# ==========================================
+# Local stand-in server
+# ==========================================
+async def _serve_connection(reader, writer, delay: float, fail_every: int, counter: list):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            headers = {}
+            while (line := (await reader.readline()).decode("latin-1").strip()):
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = json.loads(await reader.readexactly(int(headers.get("content-length", "0"))) or b"{}")
+            counter[0] += 1
+            if fail_every and counter[0] % fail_every == 0:
+                message = b'{"error": "rate limited"}'
+                writer.write(
+                    b"HTTP/1.1 429 Too Many Requests\r\nRetry-After: 0\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(message)}\r\n\r\n".encode() + message
+                )
+                await writer.drain()
+                continue
+            prompt = "".join(m.get("content", "") for m in body.get("messages", []))
+            words = f"[stand-in {body.get('model', '')}] 收到 {len(prompt)} 字的 prompt：{prompt[:40]}".split(" ")
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n"
+            )
+            for i, word in enumerate(words):
+                event = {"choices": [{"index": 0, "delta": {"content": word + (" " if i < len(words) - 1 else "")}}]}
+                data = f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8")
+                writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                await writer.drain()
+                await asyncio.sleep(delay)
+            done = b"data: [DONE]\n\n"
+            writer.write(f"{len(done):x}\r\n".encode() + done + b"\r\n0\r\n\r\n")
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+async def serve_stub(host: str = "127.0.0.1", port: int = 8765, delay: float = 0.02, fail_every: int = 0):
+    counter = [0]
+    server = await asyncio.start_server(
+        lambda r, w: _serve_connection(r, w, delay, fail_every, counter), host, port
+    )
+    return server
+
+# ==========================================
+# CLI
+# ==========================================
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="OpenAI-compatible LLM client and local stand-in server.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="run the local stand-in server")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--delay", type=float, default=0.02, help="seconds between streamed tokens")
+    serve.add_argument("--fail-every", type=int, default=0, help="answer every Nth request with 429")
+    ask = sub.add_parser("ask", help="send one prompt (file or stdin) and stream the answer")
+    ask.add_argument("prompt", nargs="?", help="prompt file; stdin when omitted")
+    ask.add_argument("--base-url", default=DEFAULT_BASE_URL)
+    ask.add_argument("--model", default=DEFAULT_MODEL)
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        async def run():
+            server = await serve_stub(args.host, args.port, args.delay, args.fail_every)
+            print(f"stand-in server on http://{args.host}:{args.port}/v1", file=sys.stderr)
+            async with server:
+                await server.serve_forever()
+        asyncio.run(run())
+        return 0
+
+    if args.prompt:
+        with open(args.prompt, encoding="utf-8") as f:
+            prompt = f.read()
+    else:
+        prompt = sys.stdin.read()
+
+    async def run():
+        client = AsyncLLMClient(LLMConfig(base_url=args.base_url, model=args.model))
+        started = time.perf_counter()
+        try:
+            async for delta in client.stream(prompt):
+                sys.stdout.write(delta)
+                sys.stdout.flush()
+        finally:
+            client.close()
+        print(f"\n({time.perf_counter() - started:.1f}s)", file=sys.stderr)
+    asyncio.run(run())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
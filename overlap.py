@@ -0,0 +1,173 @@
+import re
+from dataclasses import dataclass, field
+
+from keywords import canonical
+from packet import ProjectPacket, card_fields
+
+# ==========================================
+# Cross-card keyword cannibalization index
+# ==========================================
+# Inverted index from canonical keyword (see keywords.canonical) to the
+# article cards that target it, with the role the keyword plays on each card.
+# sync() only re-parses cards whose text changed since the last packet
+# version, so the check is cheap enough to run on every rerun; lookups are
+# dict hits.
+KEYWORD_FIELD = "Primary/Secondary/Supporting"
+
+ROLE_PRIMARY = "Primary"
+ROLE_SECONDARY = "Secondary"
+ROLE_SUPPORTING = "Supporting"
+ROLES = (ROLE_PRIMARY, ROLE_SECONDARY, ROLE_SUPPORTING)  # strongest first
+
+SEVERITY_HIGH = "高"    # two or more cards with the same Primary
+SEVERITY_MEDIUM = "中"  # one card's Primary is another card's Secondary/Supporting
+SEVERITY_LOW = "低"     # shared Secondary/Supporting only
+SEVERITY_ORDER = {SEVERITY_HIGH: 0, SEVERITY_MEDIUM: 1, SEVERITY_LOW: 2}
+MAX_LISTED_CARDS = 8
+
+ROLE_SPLIT_RE = re.compile(r"\s*[/／]\s*")
+LABELLED_RE = re.compile(r"(Primary|Secondary|Supporting)[ \t]*(?:Keywords?)?[ \t]*[：:=]", re.I)
+KEYWORD_SPLIT_RE = re.compile(r"[、,，;；|｜]+")
+PLACEHOLDER_RE = re.compile(r"^\s*[\[（(【]?\s*(?:無|未定|未指定|待定|n/?a|-+)?\s*[\]）)】]?\s*$", re.I)
+
+def parse_card_keywords(value: str) -> list:
+    """``[(keyword, role), ...]`` from a ``Primary/Secondary/Supporting`` value.
+
+    Accepts "p / s1、s2 / t" as well as "Primary：p；Secondary：s1、s2".
+    """
+    value = value or ""
+    labelled = list(LABELLED_RE.finditer(value))
+    if labelled:
+        groups = []
+        for k, m in enumerate(labelled):
+            end = labelled[k + 1].start() if k + 1 < len(labelled) else len(value)
+            role = next(r for r in ROLES if r.lower() == m.group(1).lower())
+            groups.append((role, value[m.end():end]))
+    else:
+        groups = list(zip(ROLES, ROLE_SPLIT_RE.split(value)))
+    keywords = []
+    for role, text in groups:
+        for kw in KEYWORD_SPLIT_RE.split(text):
+            kw = kw.strip(" \t（）()「」")
+            if kw and not PLACEHOLDER_RE.match(kw):
+                keywords.append((kw, role))
+    return keywords
+
+def _strongest(a: str, b: str) -> str:
+    return a if ROLES.index(a) <= ROLES.index(b) else b
+
+@dataclass
+class Overlap:
+    keyword: str                                # as written on the first card
+    cards: list = field(default_factory=list)   # [(article_id, role), ...] in card order
+
+    @property
+    def severity(self) -> str:
+        primaries = sum(role == ROLE_PRIMARY for _, role in self.cards)
+        if primaries >= 2:
+            return SEVERITY_HIGH
+        return SEVERITY_MEDIUM if primaries else SEVERITY_LOW
+
+    def __str__(self):
+        # Primary cards first: they are the ones that compete for the keyword.
+        ranked = sorted(self.cards, key=lambda card: ROLES.index(card[1]))
+        cards = "、".join(f"{aid}（{role}）" for aid, role in ranked[:MAX_LISTED_CARDS])
+        if len(ranked) > MAX_LISTED_CARDS:
+            cards += f" 等 {len(ranked)} 張"
+        return f"「{self.keyword}」：{cards}｜重疊程度 {self.severity}"
+
+class KeywordIndex:
+    def __init__(self):
+        self.postings = {}   # canonical keyword -> {article_id: role}
+        self.cards = {}      # article_id -> (card text, {canonical keyword: (keyword, role)})
+        self.order = {}      # article_id -> position in the packet
+        self.shared = set()  # canonical keywords targeted by more than one card
+        self._digest = None
+
+    def sync(self, packet) -> set:
+        """Bring the index up to date with ``packet``; returns the IDs of re-indexed cards."""
+        index = packet if isinstance(packet, ProjectPacket) else ProjectPacket(packet or "")
+        if index.digest == self._digest:
+            return set()
+        self._digest = index.digest
+        ids = index.card_ids()
+        self.order = {aid: i for i, aid in enumerate(ids)}
+        changed = set()
+        for aid in ids:
+            text = index.card(aid)
+            old = self.cards.get(aid)
+            if old is not None and old[0] == text:
+                continue
+            self._remove(aid)
+            self._add(aid, text)
+            changed.add(aid)
+        for aid in set(self.cards) - set(self.order):
+            self._remove(aid)
+            changed.add(aid)
+        return changed
+
+    def _add(self, aid: str, text: str):
+        keys = {}
+        for kw, role in parse_card_keywords(card_fields(text).get(KEYWORD_FIELD, "")):
+            key = canonical(kw)
+            if not key:
+                continue
+            keys[key] = (keys[key][0], _strongest(keys[key][1], role)) if key in keys else (kw, role)
+        self.cards[aid] = (text, keys)
+        for key, (_, role) in keys.items():
+            posting = self.postings.setdefault(key, {})
+            posting[aid] = role
+            if len(posting) > 1:
+                self.shared.add(key)
+
+    def _remove(self, aid: str):
+        old = self.cards.pop(aid, None)
+        if old is None:
+            return
+        for key in old[1]:
+            posting = self.postings.get(key, {})
+            posting.pop(aid, None)
+            if len(posting) < 2:
+                self.shared.discard(key)
+            if not posting:
+                self.postings.pop(key, None)
+
+    def _overlap(self, key: str, keyword: str = "") -> Overlap:
+        posting = self.postings[key]
+        cards = sorted(posting.items(), key=lambda item: self.order.get(item[0], len(self.order)))
+        if not keyword:
+            keyword = self.cards[cards[0][0]][1][key][0]
+        return Overlap(keyword, cards)
+
+    def lookup(self, keyword: str) -> dict:
+        """``{article_id: role}`` of the cards targeting ``keyword``."""
+        return dict(self.postings.get(canonical(keyword), {}))
+
+    def overlaps(self, article_id: str) -> list:
+        """Keywords of one card that other cards also target, most severe first."""
+        entry = self.cards.get((article_id or "").strip())
+        if entry is None:
+            return []
+        found = [(self._overlap(key, kw), role) for key, (kw, role) in entry[1].items() if key in self.shared]
+        found.sort(key=lambda item: (SEVERITY_ORDER[item[0].severity], ROLES.index(item[1])))
+        return [o for o, _ in found]
+
+    def check(self, keywords: list) -> list:
+        """Existing cards already targeting any of ``keywords`` (e.g. a card not written yet)."""
+        found = []
+        for kw in keywords:
+            key = canonical(kw)
+            if key in self.postings:
+                found.append(self._overlap(key, kw.strip()))
+        return found
+
+    def conflicts(self) -> list:
+        """Every keyword shared by two or more cards, most severe first."""
+        found = [self._overlap(key) for key in self.shared]
+        return sorted(found, key=lambda o: (SEVERITY_ORDER[o.severity], self.order.get(o.cards[0][0], 0), o.keyword))
+
+def format_overlaps(overlaps: list, limit: int = 30) -> str:
+    lines = [f"- {o}" for o in overlaps[:limit]]
+    if len(overlaps) > limit:
+        lines.append(f"- …另有 {len(overlaps) - limit} 組重疊未列出")
+    return "\n".join(lines)
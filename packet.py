@@ -0,0 +1,229 @@
+import re
+from dataclasses import dataclass, field
+
+from cache import content_hash
+
+# ==========================================
+# Indexed PROJECT PACKET parser
+# ==========================================
+# Sections follow PROJECT_PACKET_TEMPLATE:
+#   === [NAME | TAGS] ===
+#   ...
+#   === [/NAME] ===
+# Article cards live in CONTENT QUEUE after the "[Article Cards]" line and
+# start with "- 文章ID：<id>". Offsets are kept per section/card so lookups
+# are O(1) dict hits, and edits only re-scan the region that changed.
+
+SECTION_OPEN_RE = re.compile(r"^=== \[(?!/)([^\]|]+?)\s*(?:\|[^\]]*)?\] ===[ \t]*$", re.M)
+SECTION_CLOSE_FMT = r"^=== \[/{name}\] ===[ \t]*$"
+MARKER_HINT = "=== ["
+
+CONTENT_QUEUE = "CONTENT QUEUE"
+ARTICLE_CARDS_HEADER = "[Article Cards]"
+CARD_START_RE = re.compile(r"^- 文章ID[：:][ \t]*(\S+)[ \t]*$", re.M)
+CARD_FIELD_RE = re.compile(r"^[ \t]+- ([^：:\n]+)[：:][ \t]*(.*)$", re.M)
+
+
+@dataclass
+class Section:
+    name: str
+    start: int       # start of the opening marker line
+    body_start: int  # first char after the opening marker line
+    body_end: int    # start of the closing marker line
+    end: int         # first char after the closing marker line
+
+    def shift(self, delta: int):
+        self.start += delta
+        self.body_start += delta
+        self.body_end += delta
+        self.end += delta
+
+
+@dataclass
+class Card:
+    article_id: str
+    start: int
+    end: int
+
+    def shift(self, delta: int):
+        self.start += delta
+        self.end += delta
+
+
+@dataclass
+class ProjectPacket:
+    text: str = ""
+    sections: dict = field(default_factory=dict)
+    cards: dict = field(default_factory=dict)
+    card_list: list = field(default_factory=list)  # document order, duplicates kept
+    cards_start: int = -1  # first char after the "[Article Cards]" line
+    version: int = 0
+    _digest: tuple = field(default=(-1, ""), repr=False)
+
+    def __post_init__(self):
+        self._reparse_all()
+
+    @property
+    def digest(self) -> str:
+        # Hashed once per version; used as the cache key for the whole text.
+        if self._digest[0] != self.version:
+            self._digest = (self.version, content_hash(self.text))
+        return self._digest[1]
+
+    # ---------- lookups ----------
+    def section(self, name: str):
+        s = self.sections.get(name)
+        return None if s is None else self.text[s.body_start:s.body_end]
+
+    def section_block(self, name: str):
+        s = self.sections.get(name)
+        return None if s is None else self.text[s.start:s.end]
+
+    def card(self, article_id: str):
+        c = self.cards.get((article_id or "").strip())
+        return None if c is None else self.text[c.start:c.end]
+
+    def card_ids(self) -> list:
+        return list(self.cards)
+
+    # ---------- full parse ----------
+    def _reparse_all(self):
+        self.sections = {}
+        for m in SECTION_OPEN_RE.finditer(self.text):
+            name = m.group(1).strip()
+            if name in self.sections:
+                continue
+            body_start = _line_end(self.text, m.end())
+            close = re.compile(SECTION_CLOSE_FMT.format(name=re.escape(name)), re.M).search(self.text, body_start)
+            if close is None:
+                continue
+            self.sections[name] = Section(name, m.start(), body_start, close.start(), _line_end(self.text, close.end()))
+        self._reparse_cards()
+
+    def _reparse_cards(self):
+        self._set_cards([])
+        self.cards_start = -1
+        queue = self.sections.get(CONTENT_QUEUE)
+        if queue is None:
+            return
+        header = self.text.find(ARTICLE_CARDS_HEADER, queue.body_start, queue.body_end)
+        if header < 0:
+            return
+        self.cards_start = _line_end(self.text, header + len(ARTICLE_CARDS_HEADER))
+        self._set_cards(self._scan_cards(self.cards_start, queue.body_end))
+
+    def _scan_cards(self, lo: int, hi: int) -> list:
+        found = []
+        for m in CARD_START_RE.finditer(self.text, lo, hi):
+            if found:
+                found[-1].end = m.start()
+            found.append(Card(m.group(1), m.start(), hi))
+        return found
+
+    # ---------- incremental update ----------
+    def update(self, new_text: str) -> set:
+        """Apply an edit and return the names of the sections it touched."""
+        new_text = new_text or ""
+        old_text = self.text
+        if new_text == old_text:
+            return set()
+        self.version += 1
+        a, old_b, new_b = _changed_span(old_text, new_text)
+        delta = len(new_text) - len(old_text)
+        self.text = new_text
+
+        target = None
+        for s in self.sections.values():
+            if s.body_start <= a and old_b <= s.body_end:
+                target = s
+                break
+        if target is None or MARKER_HINT in new_text[a:new_b] or _touches_marker(old_text, a, old_b):
+            self._reparse_all()
+            return set(self.sections)
+
+        for s in self.sections.values():
+            if s is target:
+                s.body_end += delta
+                s.end += delta
+            elif s.start >= old_b:
+                s.shift(delta)
+
+        if target.name == CONTENT_QUEUE:
+            self._update_cards(old_text, a, old_b, new_b, delta)
+        else:
+            for c in self.card_list:
+                if c.start >= old_b:
+                    c.shift(delta)
+            if self.cards_start >= old_b:
+                self.cards_start += delta
+        return {target.name}
+
+    def _update_cards(self, old_text: str, a: int, old_b: int, new_b: int, delta: int):
+        if (
+            self.cards_start < 0
+            or a < self.cards_start
+            or ARTICLE_CARDS_HEADER in self.text[a:new_b]
+            or ARTICLE_CARDS_HEADER in old_text[a:old_b]
+        ):
+            self._reparse_cards()
+            return
+        # Re-scan from the card before the edit (its header may have been
+        # removed) through the card following the end of the edit.
+        cards = self.card_list
+        i = next((k for k, c in enumerate(cards) if c.end >= a), len(cards))
+        # A card starting right at old_b may have lost its line-start anchor.
+        j = next((k for k in range(i, len(cards)) if cards[k].end > old_b), len(cards) - 1 if cards else None)
+        first = max(i - 1, 0)
+        lo = cards[first].start if i > 0 else self.cards_start
+        hi = cards[j].end + delta if j is not None else self.sections[CONTENT_QUEUE].body_end
+        tail = cards[j + 1:] if j is not None else []
+        for c in tail:
+            c.shift(delta)
+        self._set_cards(cards[:first] + self._scan_cards(lo, hi) + tail)
+
+    def _set_cards(self, cards: list):
+        self.card_list = cards
+        self.cards = {}
+        for c in cards:
+            self.cards.setdefault(c.article_id, c)
+
+
+def card_fields(card_text: str) -> dict:
+    return {m.group(1).strip(): m.group(2).strip() for m in CARD_FIELD_RE.finditer(card_text or "")}
+
+
+def _line_end(text: str, pos: int) -> int:
+    nl = text.find("\n", pos)
+    return len(text) if nl < 0 else nl + 1
+
+
+def _line_start(text: str, pos: int) -> int:
+    return text.rfind("\n", 0, pos) + 1
+
+
+def _touches_marker(text: str, a: int, b: int) -> bool:
+    # Edits that extend onto a marker line (e.g. deleting its newline) invalidate the index.
+    lo = _line_start(text, a)
+    hi = _line_end(text, b)
+    return MARKER_HINT in text[lo:hi]
+
+
+def _changed_span(old: str, new: str):
+    # Common prefix/suffix by bisecting slice comparisons (done in C).
+    n = min(len(old), len(new))
+    lo, hi = 0, n
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if old[:mid] == new[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    prefix = lo
+    lo, hi = 0, n - prefix
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if old[len(old) - mid:] == new[len(new) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return prefix, len(old) - lo, len(new) - lo
@@ -0,0 +1,873 @@
+from cache import BLOCK_CACHE, content_hash, memoize
+from packet import ProjectPacket
+
+# ==========================================
+# Headless prompt renderers (no Streamlit dependency)
+# ==========================================
+# app.py is a thin UI over this module; batch jobs and services can import
+# it directly and render prompts without a Streamlit script run.
+
+# ==========================================
+# 1. Steps & Templates
+# ==========================================
+STEPS = [
+    "Step 1: 專案摘要 (Project Log) 建立",
+    "Step 1.5: Persona/Voice 建模（寫入封包，可選）",
+    "Step 2: SEO 任務目標 → 主題發想（寫入封包）",
+    "Step 3: 關鍵字候選清單 (Pre-GKP)",
+    "Step 4: GKP 數據決策 (Post-GKP)（寫入封包）",
+    "Step 5: 搜尋意圖 Deep Research（寫入封包）",
+    "Step 6: 文章標題生成（寫入封包：Backlog/文章卡）",
+    "Step 7: 文章大綱（更新指定文章卡）",
+    "Step 8: 文章撰寫 + 技術 SEO（更新指定文章卡）",
+    "Step 9: 改稿（Revision）+ 變更紀錄（寫入封包）",
+]
+
+PROJECT_PACKET_TEMPLATE = """【PROJECT PACKET v1 | LIGHT】
+
+=== [SOURCE NOTE | OPTIONAL] ===
+- 原始資料類型：LP / 產品說明 / 白皮書 / Notion / Google Doc（擇一或多）
+- 開新對話是否需要重貼原始資料：是（建議）
+- 備註：本封包只存「決策與狀態」。原始資料可在需要時於新對話重新貼上。
+=== [/SOURCE NOTE] ===
+
+=== [PROJECT LOG | EDITABLE] ===
+- 產品/計畫一句話總結：
+- 目標客群（Persona）：
+- 核心價值主張（3–5點）：
+- 痛點（3–5點）：
+- 內容缺口（Information Gaps）：
+- SEO 任務目標（必填）：
+- 品牌語氣/禁忌/限制條件（必填，未知可寫「未指定」）：
+=== [/PROJECT LOG] ===
+
+=== [VOICE CONTEXT | EDITABLE] ===
+[PERSONA LOG]
+- 作者世界觀一句話：
+- 對讀者的定位（上對下/並肩/挑釁/對話）：
+- 核心信念/價值觀（3–7條）：
+- 動機邊界（他為什麼寫、他不做什麼）：
+- 允許的模糊與留白（哪些可以不講死）：
+- 禁語/禁套路（含理由）：
+
+[VOICE SPEC]
+- tone_mix（%）：冷靜__ / 犀利__ / 幽默__ / 溫度__
+- sentence_rhythm：短句比例__%；每段__–__行；轉折頻率__
+- stance_rules：如何下結論/如何留白/如何反問
+- lexical_rules：常用詞/避免詞/禁詞
+- structure_rules：常用推理順序（例：現象→對照→推論→選項）
+- do_not：絕對禁止事項
+- sample_lines（<=5句，每句<=25字）：
+=== [/VOICE CONTEXT] ===
+
+=== [STRATEGY LOG | EDITABLE] ===
+- Primary Keyword（含GKP數據與理由）：
+- Secondary Keywords：
+- Supporting Keywords：
+- SERP/Intent 洞察摘要（Winning Angle）：
+- 差異化切入點（降維打擊角度）：
+- 排除與不做（Avoid List）：
+=== [/STRATEGY LOG] ===
+
+=== [CONTENT QUEUE | EDITABLE] ===
+[Backlog Titles | one per line]
+- （每行一個標題）
+
+[Article Cards]
+- 文章ID：A01
+  - 標題：
+  - Primary/Secondary/Supporting：
+  - Winning Angle：
+  - 大綱（H1/H2/H3）：
+  - 字數：
+  - CTA：
+  - Meta Title/Meta Desc/Schema：
+  - 產出備註/連結：
+=== [/CONTENT QUEUE] ===
+
+=== [REVISION LOG | EDITABLE] ===
+- 本次改稿文章ID：
+- 客戶回饋摘要（1–5點）：
+- 修改清單 Must / Should / Could：
+- 已採納（含理由摘要）：
+- 未採納（含理由摘要）：
+- 版本紀錄（v1→v2 差異一句話）：
+- 需要同步更新 VOICE CONTEXT 嗎？（是/否；若是，列出更新條款）：
+=== [/REVISION LOG] ===
+"""
+
+# "full" embeds the whole packet; "step" embeds only what STEP_PACKET_SECTIONS lists.
+PACKET_SCOPE_FULL = "full"
+PACKET_SCOPE_STEP = "step"
+
+PROMPT_LAYOUT_STEP = "step"      # each step's own block order
+PROMPT_LAYOUT_PREFIX = "prefix"  # shared reference prefix first, step-specific tail after
+
+def get_value(input_val, placeholder_text):
+    if input_val is not None and str(input_val).strip():
+        return str(input_val).strip()
+    return f"[{placeholder_text}]"
+
+# ==========================================
+# 2. Prompt building blocks
+# ==========================================
+# Rule blocks below are constant literals; the two content blocks are memoized
+# by content hash because voice banks and packets can be hundreds of KB.
+@memoize(BLOCK_CACHE)
+def state_reference_block(packet: str) -> str:
+    return f"""【狀態參考（非輸出對象）】
+以下內容僅供你理解目前狀態；本回合「主要產出」不是重寫這份文件：
+{packet}
+"""
+
+# First line of a Voice Bank that voice.compact_voice_bank already merged with VOICE CONTEXT.
+MERGED_VOICE_HEADER = "（本地合併：VOICE BANK 優先；已與封包 VOICE CONTEXT 去重，衝突已處理，不需再比對）"
+
+@memoize(BLOCK_CACHE)
+def voice_bank_block(voice_bank_text: str) -> str:
+    vb = (voice_bank_text or "").strip()
+    if not vb:
+        return "【VOICE BANK（外掛語感資產）】（未提供）"
+    return f"""【VOICE BANK（外掛語感資產｜優先於封包 VOICE CONTEXT）】
+{vb}
+"""
+
+def voice_priority_rules(voice_bank_text: str = "") -> str:
+    if (voice_bank_text or "").lstrip().startswith(MERGED_VOICE_HEADER):
+        # Merged locally (voice.compact_voice_bank): conflicts are already listed in the spec.
+        return """【語感優先規則（必讀）】
+- VOICE BANK 已在本地與封包 VOICE CONTEXT 合併；規格末尾列出的衝突已處理，不需再輸出「衝突點 + 合併策略」。
+- 完成本回合後：請把上方合併後規格寫回封包 VOICE CONTEXT。
+"""
+    return """【語感優先規則（必讀）】
+- 若 VOICE BANK 有內容：視為最高優先語感規格（高於封包內 VOICE CONTEXT）。
+- 若 VOICE BANK 與封包 VOICE CONTEXT 衝突：先輸出「衝突點 + 合併策略」（<=8行），再進行主要任務。
+- 完成本回合後：若 VOICE BANK 有內容，請把「合併後最終版本」寫回封包 VOICE CONTEXT。
+"""
+
+def state_output_rules(packet_scope: str = PACKET_SCOPE_FULL) -> str:
+    if packet_scope == PACKET_SCOPE_STEP:
+        return """【狀態更新輸出規則（只針對 Project Packet｜節選模式）】
+- 請在「主要產出」完成後，再輸出一個獨立的 Markdown code block。
+- 本回合只提供封包節選；該 code block 只能包含「本回合有更新的區塊」，每個區塊保留完整的 === [區塊] === / === [/區塊] === 標記。
+- 若更新的是文章卡：CONTENT QUEUE 區塊內只放 [Article Cards] 與該張文章卡。
+- 禁止把正文/表格/清單塞進 code block。
+"""
+    return """【狀態更新輸出規則（只針對 Project Packet）】
+- 請在「主要產出」完成後，再輸出一個獨立的 Markdown code block。
+- 該 code block 只能包含「完整最新版 PROJECT PACKET v1 | LIGHT」。
+- 禁止把正文/表格/清單塞進 code block。
+"""
+
+def overlap_warning_block(overlaps: str, scope: str, instruction: str) -> str:
+    # Empty unless the local keyword index found overlaps, so prompts without any stay unchanged.
+    if not (overlaps or "").strip():
+        return ""
+    return f"""
+【關鍵字重疊警示（本地檢查：{scope}）】
+{overlaps.strip()}
+{instruction}
+"""
+
+def related_links_block(related: str, instruction: str) -> str:
+    # Same convention: nothing at all when there are no candidates.
+    if not (related or "").strip():
+        return ""
+    return f"""
+【站內相關文章（本地相似度計算，內鏈候選）】
+{related.strip()}
+{instruction}
+"""
+
+def serp_capture_block(serp: str) -> str:
+    # Same convention: only present when the analyst supplied saved SERP/competitor pages.
+    if not (serp or "").strip():
+        return ""
+    return f"""
+【本地 SERP/競品擷取摘要（分析師離線存檔，已在本地解析壓縮）】
+{serp.strip()}
+請以此作為「SERP 真實戰況」的主要依據；搜尋只用來補足上表沒有的關鍵字或變化，不要重複整理上表已有的內容。
+"""
+
+def no_codeblock_main_output_rules() -> str:
+    return """【主要產出輸出規則】
+- 主要產出請直接輸出（不要包在任何 code block）。
+- 可以使用一般 Markdown 標題/段落/表格，但不要用 ``` 包起來。
+"""
+
+# ==========================================
+# 3. Step-scoped packet embedding
+# ==========================================
+ARTICLE_CARD = "ARTICLE CARD"  # CONTENT QUEUE reduced to the current article card
+
+# Sections each step reads or writes, keyed by STEPS index.
+STEP_PACKET_SECTIONS = {
+    0: ("SOURCE NOTE", "PROJECT LOG"),
+    1: ("PROJECT LOG", "VOICE CONTEXT"),
+    2: ("PROJECT LOG", "VOICE CONTEXT"),
+    3: ("PROJECT LOG", "STRATEGY LOG"),
+    4: ("PROJECT LOG", "STRATEGY LOG"),
+    5: ("PROJECT LOG", "VOICE CONTEXT", "STRATEGY LOG"),
+    6: ("PROJECT LOG", "VOICE CONTEXT", "STRATEGY LOG", "CONTENT QUEUE"),
+    7: ("VOICE CONTEXT", "STRATEGY LOG", ARTICLE_CARD),
+    8: ("VOICE CONTEXT", "STRATEGY LOG", ARTICLE_CARD),
+    9: ("VOICE CONTEXT", "REVISION LOG", ARTICLE_CARD),
+}
+
+def scoped_packet(packet, step_index: int, article_id: str = "") -> str:
+    index = packet if isinstance(packet, ProjectPacket) else ProjectPacket(packet or "")
+    if not index.sections:
+        return index.text
+    blocks = ["【PROJECT PACKET v1 | LIGHT｜本步驟節選】"]
+    for name in STEP_PACKET_SECTIONS.get(step_index, tuple(index.sections)):
+        if name == ARTICLE_CARD:
+            blocks.append(article_card_block(index, article_id))
+            continue
+        block = index.section_block(name)
+        if block is not None:
+            blocks.append(block.rstrip("\n"))
+    return "\n\n".join(blocks) + "\n"
+
+def packet_digest(packet) -> str:
+    return packet.digest if isinstance(packet, ProjectPacket) else content_hash(packet or "")
+
+def resolve_packet(packet, step_index: int, packet_scope: str, article_id: str = "") -> str:
+    if packet_scope != PACKET_SCOPE_STEP:
+        return packet.text if isinstance(packet, ProjectPacket) else packet
+    key = content_hash("scoped_packet", packet_digest(packet), step_index, article_id or "")
+    scoped = BLOCK_CACHE.get(key)
+    if scoped is None:
+        scoped = BLOCK_CACHE.put(key, scoped_packet(packet, step_index, article_id))
+    return scoped
+
+def article_card_block(index: ProjectPacket, article_id: str) -> str:
+    aid = (article_id or "").strip() or "A01"
+    card = index.card(aid)
+    if card is None:
+        card = f"- 文章ID：{aid}\n  -（封包中尚無此文章卡，請依模板新建）\n"
+    return f"=== [CONTENT QUEUE | EDITABLE] ===\n[Article Cards]\n{card.rstrip()}\n=== [/CONTENT QUEUE] ==="
+
+# ==========================================
+# 4. Step renderers
+# ==========================================
+
+# ------------------------------------------
+# Step 1
+# ------------------------------------------
+def render_step1(
+    packet: str,
+    voice_bank: str,
+    source: str = "",
+    packet_scope: str = PACKET_SCOPE_FULL,
+) -> str:
+    packet_val = get_value(packet, "尚未建立封包")
+    source_val = get_value(source, "內容貼在這裡")
+
+    return f"""【本次主要產出】
+請先輸出「條列式解析結果」（不是封包、不是 code block）。
+
+{no_codeblock_main_output_rules()}
+
+【解析輸出格式】
+1. 一句話總結（What is it）
+2. 目標客群（Target User）
+3. 核心價值主張（Value Proposition）
+4. 使用者痛點（Pain Points）
+5. 目前內容缺口（Information Gaps）
+6. 推薦的 SEO 任務目標（若 Step2 會填，可先給建議版本）
+7. 品牌語氣/禁忌/限制條件（若未知寫「未指定」）
+
+────────────────────
+
+{state_reference_block(packet_val)}
+
+{voice_bank_block(voice_bank)}
+
+────────────────────
+
+【本回合原始資料（僅本回合參考，不要復誦原文，不要塞進封包）】
+{source_val}
+
+────────────────────
+
+【狀態更新任務】
+請把上述解析收斂後，更新封包 PROJECT LOG 對應欄位（只更新/補齊必要欄位）。
+
+{state_output_rules(packet_scope)}
+"""
+
+# ------------------------------------------
+# Step 1.5
+# ------------------------------------------
+def render_step15(
+    packet: str,
+    voice_bank: str,
+    samples: str = "",
+    pasted: str = "",
+    notes: str = "",
+    packet_scope: str = PACKET_SCOPE_FULL,
+) -> str:
+    packet_val = get_value(packet, "尚未建立封包")
+    samples_val = get_value(samples, "（未上傳）")
+    paste_val = get_value(pasted, "（未貼）")
+    notes_val = get_value(notes, "（未填）")
+
+    return f"""【本次主要產出】
+請先輸出「Persona Brief（可讀）」與「Voice Spec（可執行）」。（不是封包、不是 code block）
+
+{no_codeblock_main_output_rules()}
+
+【資料分層規則】
+- 「樣本文本」= 證據層，只能從這裡歸納語感特徵與慣用句法。
+- 「我的筆記」= 補充語境層，可校準 Persona；若與樣本衝突需指出並提出兩版。
+- 禁止把樣本文本原文塞進封包。
+
+{voice_priority_rules(voice_bank)}
+
+【主要產出格式】
+A) Persona Brief
+1. 作者世界觀一句話
+2. 對讀者的定位（上對下/並肩/挑釁/對話）
+3. 核心信念/價值觀（3–7條，句型化）
+4. 動機邊界（他為什麼寫、他不做什麼）
+5. 允許的模糊與留白
+6. 禁語/禁套路（含理由）
+
+B) Voice Spec（務必可操作）
+- tone_mix（%）：冷靜__ / 犀利__ / 幽默__ / 溫度__
+- sentence_rhythm：短句比例__%；每段__–__行；轉折頻率__
+- stance_rules：如何下結論/如何留白/如何反問
+- lexical_rules：常用詞/避免詞/禁詞
+- structure_rules：常用推理順序
+- do_not：絕對禁止事項
+- sample_lines：<=5句，每句<=25字（模仿用，非引用原文）
+
+────────────────────
+
+{state_reference_block(packet_val)}
+
+{voice_bank_block(voice_bank)}
+
+【樣本文本（證據層）｜上傳】
+{samples_val}
+
+【樣本文本（證據層）｜直接貼上】
+{paste_val}
+
+【我的筆記（補充語境層）】
+{notes_val}
+
+────────────────────
+
+【狀態更新任務】
+請把合併後的 PERSONA LOG + VOICE SPEC 寫回封包 VOICE CONTEXT。
+其他區塊不得更動。
+
+{state_output_rules(packet_scope)}
+"""
+
+# ------------------------------------------
+# Step 2
+# ------------------------------------------
+def render_step2(
+    packet: str,
+    voice_bank: str,
+    goal: str = "",
+    packet_scope: str = PACKET_SCOPE_FULL,
+) -> str:
+    packet_val = get_value(packet, "尚未建立封包")
+    goal_val = get_value(goal, "任務目標")
+
+    return f"""【本次主要產出】
+請先輸出「Topic Clusters 表格」（不是封包、不是 code block）。
+
+{no_codeblock_main_output_rules()}
+
+【表格格式】
+| 主題方向 | 關鍵字類型 | 搜尋意圖類型 | 註解 |
+
+{voice_priority_rules(voice_bank)}
+
+────────────────────
+
+{state_reference_block(packet_val)}
+
+{voice_bank_block(voice_bank)}
+
+────────────────────
+
+【任務】
+1) 以上述封包 PROJECT LOG +（依語感優先規則採用的）VOICE CONTEXT 為前提，根據我提供的 SEO 任務目標產出 10–20 個 Topic Clusters（用表格）。
+2) 把「SEO 任務目標」寫回封包 PROJECT LOG 對應欄位。
+3) 若 VOICE BANK 有內容，請把合併後 VOICE CONTEXT 寫回封包。
+
+SEO 任務目標：{goal_val}
+
+{state_output_rules(packet_scope)}
+"""
+
+# ------------------------------------------
+# Step 3
+# ------------------------------------------
+def render_step3(
+    packet: str,
+    voice_bank: str,
+    topics: str = "",
+    packet_scope: str = PACKET_SCOPE_FULL,
+) -> str:
+    packet_val = get_value(packet, "尚未建立封包")
+    topics_val = get_value(topics, "主題清單")
+
+    return f"""【本次主要產出】
+請直接輸出「GKP 專用關鍵字清單」。（不要 code block）
+
+{no_codeblock_main_output_rules()}
+
+【GKP 專用輸出格式（嚴格）】
+1) 純文字清單，關鍵字之間用英文逗號 (,) 分隔
+2) 不要編號、不要項目符號
+3) 每 10 個關鍵字一組，組與組之間空一行
+4) 務必包含 Seed Keywords + 長尾詞
+
+────────────────────
+
+{state_reference_block(packet_val)}
+
+{voice_bank_block(voice_bank)}
+
+主題清單：
+{topics_val}
+"""
+
+# ------------------------------------------
+# Step 4
+# ------------------------------------------
+def render_step4(
+    packet: str,
+    voice_bank: str,
+    gkp: str = "",
+    packet_scope: str = PACKET_SCOPE_FULL,
+) -> str:
+    packet_val = get_value(packet, "尚未建立封包")
+    gkp_val = get_value(gkp, "GKP 輸出資料")
+
+    return f"""【本次主要產出】
+請先輸出「關鍵字策略決策分析」（不是封包、不是 code block）。
+
+{no_codeblock_main_output_rules()}
+
+【主要產出內容】
+1) 核心關鍵字 (Primary) - 含數據與理由
+2) 次要關鍵字 (Secondary) - 含用途
+3) 補充關鍵字 (Supporting)
+4) 策略邏輯說明（流量 vs 競爭度取捨）
+5) 後續 SERP 分析建議
+
+────────────────────
+
+{state_reference_block(packet_val)}
+
+{voice_bank_block(voice_bank)}
+
+GKP 數據：
+{gkp_val}
+
+────────────────────
+
+【狀態更新任務】
+把上述決策寫回封包 STRATEGY LOG 對應欄位。
+
+{state_output_rules(packet_scope)}
+"""
+
+# ------------------------------------------
+# Step 5
+# ------------------------------------------
+def render_step5(
+    packet: str,
+    voice_bank: str,
+    keywords: str = "",
+    serp: str = "",
+    packet_scope: str = PACKET_SCOPE_FULL,
+) -> str:
+    packet_val = get_value(packet, "尚未建立封包")
+    kw_val = get_value(keywords, "核心關鍵字")
+    serp_block = serp_capture_block(serp)
+
+    return f"""【本次主要產出】
+請先輸出「SERP/Intent 洞察報告」（不是封包、不是 code block）。
+
+{no_codeblock_main_output_rules()}
+
+【重要指令：必須使用瀏覽/搜索工具】
+- 需實際搜索 SERP 前 10–20 名，基於真實結果做觀察。
+- 不要憑空模擬。
+
+{voice_priority_rules(voice_bank)}
+
+【主要產出區塊】
+A) SERP 真實戰況（Explicit Intent）
+B) 隱性意圖（Implicit Intent）
+C) 情境化意圖（Contextual Intent）
+D) Deep Research 洞察（缺口/風險/降維打擊角度）
+E) Demand-Gen Intent（教育市場的新觀點）
+F) Intent Panorama（5–7 主軸 + Winning Angle）
+
+────────────────────
+
+{state_reference_block(packet_val)}
+
+{voice_bank_block(voice_bank)}
+
+關鍵字：
+{kw_val}
+{serp_block}
+────────────────────
+
+【狀態更新任務】
+請將你的結論「收斂」寫回封包 STRATEGY LOG：
+- SERP/Intent 洞察摘要（Winning Angle）
+- 差異化切入點（降維打擊角度）
+- 排除與不做（Avoid List）
+- 若 VOICE BANK 有內容：請把合併後 VOICE CONTEXT 寫回封包。
+
+{state_output_rules(packet_scope)}
+"""
+
+# ------------------------------------------
+# Step 6
+# ------------------------------------------
+def render_step6(
+    packet: str,
+    voice_bank: str,
+    hint: str = "",
+    overlaps: str = "",
+    packet_scope: str = PACKET_SCOPE_FULL,
+) -> str:
+    packet_val = get_value(packet, "尚未建立封包")
+    hint_val = get_value(hint, "（無）")
+    overlap_block = overlap_warning_block(
+        overlaps,
+        "現有文章卡之間",
+        "新標題與新文章卡請避開上列關鍵字作為 Primary；若仍要寫，請明確區隔搜尋意圖，或改為既有文章的 supporting 段落。",
+    )
+
+    return f"""【本次主要產出】
+請先輸出「標題清單 + 分群 + 寫作順序建議」（不是封包、不是 code block）。
+
+{no_codeblock_main_output_rules()}
+
+{voice_priority_rules(voice_bank)}
+
+【主要產出要求】
+1) 產出 15–25 個標題，分為：資訊型 / 比較型 / 行動導向型
+2) 將標題分成 3–5 個 Cluster
+3) 提供建議寫作順序（先 pillar 後 supporting）
+4) 建議每篇對應的 Primary/Secondary/Supporting（可粗分）
+
+────────────────────
+
+{state_reference_block(packet_val)}
+
+{voice_bank_block(voice_bank)}
+
+補充偏好（可選）：{hint_val}
+{overlap_block}
+────────────────────
+
+【狀態更新任務】
+- 把全部標題寫回封包 CONTENT QUEUE -> [Backlog Titles]（每行一個）
+- 在封包 [Article Cards] 中至少建立 3 張文章卡（A01/A02/A03 或延續編號），每張先填：
+  - 文章ID
+  - 標題
+  - Primary/Secondary/Supporting
+  - Winning Angle（從 STRATEGY LOG 套用到各卡）
+- 若 VOICE BANK 有內容：請把合併後 VOICE CONTEXT 寫回封包。
+
+{state_output_rules(packet_scope)}
+"""
+
+# ------------------------------------------
+# Step 7
+# ------------------------------------------
+def render_step7(
+    packet: str,
+    voice_bank: str,
+    article_id: str = "",
+    title: str = "",
+    source: str = "",
+    overlaps: str = "",
+    related: str = "",
+    packet_scope: str = PACKET_SCOPE_FULL,
+) -> str:
+    packet_val = get_value(packet, "尚未建立封包")
+    aid_val = get_value(article_id, "A01")
+    title_val = get_value(title, "（若封包該卡已有標題可留空）")
+    s7_source_val = get_value(source, "（無）")
+    overlap_block = overlap_warning_block(
+        overlaps,
+        f"文章ID：{aid_val} 與其他文章卡",
+        "大綱的 H2 請與上列文章區隔搜尋意圖，重疊主題改為內鏈指向對方；若判斷應合併，請寫在產出備註。",
+    )
+    related_block = related_links_block(related, "可在相關 H2 預留內鏈位置，並在產出備註列出預計連結的文章ID。")
+
+    return f"""【本次主要產出】
+請先輸出「文章大綱」。（不是封包、不是 code block）
+
+{no_codeblock_main_output_rules()}
+
+{voice_priority_rules(voice_bank)}
+
+【大綱要求】
+- 文章ID：{aid_val}
+- 若我提供標題：{title_val}，以此為準；若未提供，請使用封包該文章卡的標題。
+- 結構：H1/H2/H3
+- 每個 H2 必須對應明確使用者問題（對齊 STRATEGY LOG 的意圖洞察）
+- 另外輸出一小段「大綱邏輯解說」（約 5–8 行）
+
+────────────────────
+
+{state_reference_block(packet_val)}
+
+{voice_bank_block(voice_bank)}
+
+【本回合補充原始資料/要點（可選，僅本回合參考，不要復誦原文，不要塞進封包）】
+{s7_source_val}
+{overlap_block}{related_block}
+────────────────────
+
+【狀態更新任務】
+請在主要產出後，只更新封包中「文章ID：{aid_val}」那張文章卡：
+- 大綱（H1/H2/H3）
+- 產出備註/連結（放入大綱邏輯解說摘要）
+- 若 VOICE BANK 有內容：請把合併後 VOICE CONTEXT 寫回封包（其他區塊不動）。
+
+其他文章卡不得更動。
+
+{state_output_rules(packet_scope)}
+"""
+
+# ------------------------------------------
+# Step 8
+# ------------------------------------------
+def render_step8(
+    packet: str,
+    voice_bank: str,
+    article_id: str = "",
+    word: str = "",
+    cta: str = "",
+    extra: str = "",
+    source: str = "",
+    related: str = "",
+    packet_scope: str = PACKET_SCOPE_FULL,
+) -> str:
+    packet_val = get_value(packet, "尚未建立封包")
+    aid_val = get_value(article_id, "A01")
+    word_val = get_value(word, "1500字")
+    cta_val = get_value(cta, "CTA")
+    extra_val = get_value(extra, "（無）")
+    p8_source_val = get_value(source, "（無）")
+    related_block = related_links_block(related, "內鏈建議請優先從上列文章挑選（寫出 anchor 與文章ID），不要虛構不存在的文章。")
+
+    return f"""【本次主要產出】
+請先輸出「完整文章正文」+「Meta Title/Meta Description」+「Schema 建議」+「技術SEO檢查清單」。
+注意：正文是主要產出，不是封包內容。
+
+{no_codeblock_main_output_rules()}
+
+{voice_priority_rules(voice_bank)}
+
+【寫作任務】
+- 文章ID：{aid_val}
+- 字數：{word_val}
+- CTA：{cta_val}
+- 補充指示：{extra_val}
+
+【主要產出要求】
+1) 完整文章正文（可用 # ## ### 作標題）
+2) Meta Title（<60字元）
+3) Meta Description（<160字元）
+4) Schema Markup 建議（條列）
+5) 技術 SEO 檢查清單（條列：內鏈建議、段落結構、FAQ、表格/清單使用點）
+
+────────────────────
+
+{state_reference_block(packet_val)}
+
+{voice_bank_block(voice_bank)}
+
+【本回合原始資料/事實要點（可選，僅本回合參考，不要復誦原文，不要塞進封包）】
+{p8_source_val}
+{related_block}
+────────────────────
+
+【狀態更新任務（極重要：正文禁止寫入封包）】
+請在主要產出後，只更新封包中「文章ID：{aid_val}」那張文章卡，填入：
+- 字數：{word_val}
+- CTA：{cta_val}
+- Meta Title/Meta Desc/Schema：請把你剛剛產出的內容「精簡貼回」
+- 產出備註/連結：只存「可續寫摘要」與「後續行動」，例如：
+  - 本文核心結論 3 點（短句）
+  - FAQ 題目列表（只存題目）
+  - 內鏈建議（只存 anchor/指向的文章ID或主題）
+  - 下一篇文章建議（引用 Backlog/Article Cards）
+
+【硬性禁止條款】
+- 你不得把任何「正文段落」寫入 Project Packet。
+- 若你誤把正文寫入封包，視為不合格輸出。
+
+- 若 VOICE BANK 有內容：請把合併後 VOICE CONTEXT 寫回封包（其他區塊不動）。
+
+其他文章卡不得更動。
+
+{state_output_rules(packet_scope)}
+"""
+
+# ------------------------------------------
+# Step 9
+# ------------------------------------------
+def render_step9(
+    packet: str,
+    voice_bank: str,
+    article_id: str = "",
+    original: str = "",
+    client: str = "",
+    editor: str = "",
+    constraints: str = "",
+    packet_scope: str = PACKET_SCOPE_FULL,
+) -> str:
+    packet_val = get_value(packet, "尚未建立封包")
+    aid_val = get_value(article_id, "A01")
+    original_val = get_value(original, "原文貼在這裡")
+    client_val = get_value(client, "（無）")
+    editor_val = get_value(editor, "（無）")
+    constraints_val = get_value(constraints, "（無）")
+
+    return f"""【本次主要產出】
+請輸出「改後文章全文（v2）」+「變更摘要（Diff Summary）」+「未採納清單（含理由）」。（不是封包、不是 code block）
+
+{no_codeblock_main_output_rules()}
+
+{voice_priority_rules(voice_bank)}
+
+【改稿任務】
+- 文章ID：{aid_val}
+
+【你要輸出的結構】
+1) 改後全文（v2）
+2) Diff Summary（條列，分 Must / Should / Could）
+3) 未採納清單（條列：原因=與 Persona/Voice 衝突 / 不利於 SEO 目標 / 缺乏證據 / 風險等）
+4) 若你判斷需要更新 VOICE CONTEXT：請提出「更新條款草案」（只列規則，不要寫長文）
+
+────────────────────
+
+{state_reference_block(packet_val)}
+
+{voice_bank_block(voice_bank)}
+
+【原文（v1｜本回合輸入，不要復誦原文，不要塞進封包）】
+{original_val}
+
+【客戶回饋（本回合輸入）】
+{client_val}
+
+【總編輯指令（本回合輸入）】
+{editor_val}
+
+【額外限制（可選）】
+{constraints_val}
+
+────────────────────
+
+【狀態更新任務（極重要：不得把全文寫入封包）】
+請只更新封包的：
+=== [REVISION LOG | EDITABLE] ===
+
+填入：
+- 本次改稿文章ID：{aid_val}
+- 客戶回饋摘要（1–5點）
+- 修改清單 Must / Should / Could
+- 已採納（含理由摘要）
+- 未採納（含理由摘要）
+- 版本紀錄（v1→v2 差異一句話）
+- 需要同步更新 VOICE CONTEXT 嗎？（是/否；若是，列出更新條款）
+
+【硬性禁止條款】
+- 你不得把任何「改後全文段落」寫入 Project Packet。
+
+- 若 VOICE BANK 有內容：請把合併後 VOICE CONTEXT 寫回封包（其他區塊不動）。
+
+{state_output_rules(packet_scope)}
+"""
+
+# ==========================================
+# 5. Dispatch
+# ==========================================
+# Keyed by STEPS index; every renderer takes (packet, voice_bank, **step_inputs).
+RENDERERS = {
+    0: render_step1,
+    1: render_step15,
+    2: render_step2,
+    3: render_step3,
+    4: render_step4,
+    5: render_step5,
+    6: render_step6,
+    7: render_step7,
+    8: render_step8,
+    9: render_step9,
+}
+
+def render_step(
+    step_index: int,
+    packet,
+    voice_bank: str,
+    packet_scope: str = PACKET_SCOPE_FULL,
+    layout: str = PROMPT_LAYOUT_STEP,
+    **inputs,
+) -> str:
+    packet = resolve_packet(packet, step_index, packet_scope, inputs.get("article_id", ""))
+    return render_resolved_step(step_index, packet, voice_bank, packet_scope, layout, **inputs)
+
+def render_resolved_step(
+    step_index: int,
+    packet_text: str,
+    voice_bank: str,
+    packet_scope: str = PACKET_SCOPE_FULL,
+    layout: str = PROMPT_LAYOUT_STEP,
+    **inputs,
+) -> str:
+    """``render_step`` for packet text already cut to ``packet_scope`` (see ``resolve_packet``)."""
+    prompt = RENDERERS[step_index](packet_text, voice_bank, packet_scope=packet_scope, **inputs)
+    return canonical_layout(prompt, packet_text, voice_bank) if layout == PROMPT_LAYOUT_PREFIX else prompt
+
+# ==========================================
+# 6. Prefix-stable layout
+# ==========================================
+# Provider-side prompt caches only reuse an exact leading prefix. Every step
+# embeds the same large blocks (main-output rules, voice bank, packet) at a
+# different offset, so the canonical layout lifts them out of the rendered
+# step prompt into one prefix that is byte-identical across steps as long as
+# the voice bank and the embedded packet are unchanged (full packet scope;
+# step scope embeds a different excerpt per step).
+SHARED_PREFIX_POINTER = "【狀態參考 / VOICE BANK】見本 Prompt 開頭的共用參考資料（此處不重複附上）。"
+
+def shared_prefix(packet: str, voice_bank: str) -> str:
+    return f"""【共用參考資料（各步驟相同；本回合任務在分隔線之後）】
+
+{no_codeblock_main_output_rules()}
+{voice_bank_block(voice_bank)}
+
+{state_reference_block(get_value(packet, "尚未建立封包"))}
+════════════════════
+【本步驟任務】
+
+"""
+
+def canonical_layout(prompt: str, packet: str, voice_bank: str) -> str:
+    """Rewrite a rendered step prompt as shared prefix + step-specific tail."""
+    reference = f"{state_reference_block(get_value(packet, '尚未建立封包'))}\n\n{voice_bank_block(voice_bank)}"
+    if reference not in prompt:
+        return prompt
+    tail = prompt.replace(reference, SHARED_PREFIX_POINTER, 1)
+    tail = tail.replace(no_codeblock_main_output_rules() + "\n\n", "", 1)
+    return shared_prefix(packet, voice_bank) + tail
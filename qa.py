@@ -0,0 +1,392 @@
+import argparse
+import json
+import os
+import re
+import sys
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+
+from chunked import STITCH_SEO_MARK, parse_word_target
+from overlap import KEYWORD_FIELD, ROLE_PRIMARY, ROLE_SECONDARY, parse_card_keywords
+from packet import ProjectPacket, card_fields
+
+# ==========================================
+# Local SEO/QA checks for Step 8 drafts
+# ==========================================
+# What the Step 8 prompt asks the LLM to self-check, done locally instead:
+# length against the word target, keyword presence/density, heading
+# structure, meta title/description length and JSON-LD validity. Checks are
+# plain text scans, so a directory of drafts is spread over a process pool
+# and 100 articles take seconds rather than 100 LLM calls.
+#
+# Length follows the usual Chinese 字數 convention: every CJK character
+# counts as one, every run of Latin letters/digits as one word. Meta limits
+# are in display width (CJK = 2), so "<60" also means "≤30 全形字".
+WORD_TOLERANCE = 0.2
+DENSITY_LOW = 0.005
+DENSITY_HIGH = 0.03
+META_TITLE_MAX = 60
+META_DESC_MAX = 160
+MIN_H2 = 2
+DRAFT_SUFFIXES = (".md", ".markdown", ".txt")
+
+CJK_RE = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]")
+LATIN_WORD_RE = re.compile(r"[A-Za-z0-9]+(?:['’.-][A-Za-z0-9]+)*")
+FENCE_RE = re.compile(r"^[ \t]{0,3}(`{3,}|~{3,})[ \t]*([^`\n]*)$", re.M)
+HEADING_RE = re.compile(r"^[ \t]{0,3}(#{1,6})(?:[ \t]+(.*?))?[ \t#]*$")
+LINK_RE = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+URL_RE = re.compile(r"https?://\S+")
+MARKUP_RE = re.compile(r"[*_`>|~]+")
+# First line of the SEO part that follows the article body: a label line ("Meta Title：", "**Schema**",
+# "3) Schema Markup 建議（條列）", the stitch mark) or a fenced JSON-LD block. Headings never count, so a
+# body section such as "## Schema 標記的影響" stays in the body.
+SEO_LABEL = r"(?:Meta[ \t]*(?:Title|Desc(?:ription)?)|Schema(?:[ \t]*Markup)?(?:[ \t]*建議)?|技術[ \t]*SEO(?:[ \t]*檢查清單)?)"
+SEO_START_RE = re.compile(
+    r"^[ \t>*\-]*(?:\d+[.)、）][ \t]*)?(?:\*\*)?[ \t]*" + SEO_LABEL + r"(?:[ \t]*[/／、&＆][ \t]*" + SEO_LABEL + r")*"
+    r"[ \t]*(?:[（(][^）)\n]*[）)])?[ \t]*(?:\*\*)?[ \t]*(?:[：:]|$)"
+    r"|^[ \t>*\-]*" + re.escape(STITCH_SEO_MARK) +
+    r"|^[ \t]{0,3}(?:`{3,}|~{3,})[ \t]*(?:json(?:-?ld)?|ld\+json)?[ \t]*\n[ \t]*[\[{][^`~]*?\"@(?:context|type)\""
+    r"|^[ \t]*<script[^>\n]*application/ld\+json",
+    re.I | re.M,
+)
+META_TITLE_RE = re.compile(r"^[ \t>#*\-\d.)、]*(?:\*\*)?[ \t]*Meta[ \t]*Title\b(.*)$", re.I | re.M)
+META_DESC_RE = re.compile(r"^[ \t>#*\-\d.)、]*(?:\*\*)?[ \t]*Meta[ \t]*Desc(?:ription)?\b(.*)$", re.I | re.M)
+LABEL_TAIL_RE = re.compile(r"^(?:\*\*)?[ \t]*(?:[（(][^）)]*[）)])?[ \t]*(?:\*\*)?[ \t]*[：:]?[ \t]*")
+JSON_LD_SCRIPT_RE = re.compile(r"<script[^>]*application/ld\+json[^>]*>(.*?)</script>", re.I | re.S)
+ARTICLE_ID_RE = re.compile(r"^(?:step\d+_)?(.+?)(?:\.response)?$", re.I)
+
+# Properties a schema type needs before rich results consider it.
+SCHEMA_REQUIRED = {
+    "Article": ("headline",),
+    "BlogPosting": ("headline",),
+    "NewsArticle": ("headline",),
+    "FAQPage": ("mainEntity",),
+    "HowTo": ("name", "step"),
+    "BreadcrumbList": ("itemListElement",),
+    "Product": ("name",),
+}
+HEADLINE_MAX = 110
+
+@dataclass
+class KeywordStat:
+    keyword: str
+    role: str
+    count: int = 0
+    density: float = 0.0
+
+@dataclass
+class DraftReport:
+    article_id: str = ""
+    path: str = ""
+    length: int = 0          # CJK characters + Latin words
+    target: int = 0
+    headings: list = field(default_factory=list)   # [(level, title), ...]
+    keywords: list = field(default_factory=list)   # [KeywordStat, ...]
+    meta_title: str = ""
+    meta_description: str = ""
+    schemas: list = field(default_factory=list)    # @type of every valid JSON-LD node
+    errors: list = field(default_factory=list)
+    warnings: list = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def to_record(self) -> dict:
+        record = asdict(self)
+        record["ok"] = self.ok
+        return record
+
+# ------------------------------------------
+# Text helpers
+# ------------------------------------------
+def text_length(text: str) -> int:
+    """字數: CJK characters plus Latin words/numbers."""
+    text = unicodedata.normalize("NFKC", text or "")
+    return len(CJK_RE.findall(text)) + len(LATIN_WORD_RE.findall(CJK_RE.sub(" ", text)))
+
+def display_width(text: str) -> int:
+    return sum(2 if unicodedata.east_asian_width(ch) in "WF" else 1 for ch in text or "")
+
+def _squash(text: str) -> str:
+    return re.sub(r"\s+", "", unicodedata.normalize("NFKC", text or "").lower())
+
+def _code_blocks(text: str) -> list:
+    """``[(language, body, start, end), ...]`` for every closed fenced code block."""
+    blocks, opened = [], None
+    for m in FENCE_RE.finditer(text):
+        if opened is None:
+            opened = m
+        elif m.group(1)[0] == opened.group(1)[0] and len(m.group(1)) >= len(opened.group(1)) and not m.group(2).strip():
+            blocks.append((opened.group(2).strip().lower(), text[opened.end() + 1:m.start()], opened.start(), m.end()))
+            opened = None
+    return blocks
+
+def split_draft(text: str) -> tuple:
+    """``(article body, SEO part)``: the body stops at the first Meta/Schema/技術 SEO label or JSON-LD block."""
+    text = text or ""
+    m = SEO_START_RE.search(text)
+    return (text, "") if m is None else (text[:m.start()], text[m.start():])
+
+def plain_text(body: str) -> str:
+    """Body text without code blocks, heading marks, link targets or emphasis."""
+    for _, _, start, end in reversed(_code_blocks(body)):
+        body = body[:start] + body[end:]
+    body = LINK_RE.sub(r"\1", body)
+    body = URL_RE.sub(" ", body)
+    body = re.sub(r"^[ \t]{0,3}#{1,6}[ \t]*", "", body, flags=re.M)
+    return MARKUP_RE.sub(" ", body)
+
+def parse_headings(body: str) -> list:
+    """``[(level, title), ...]`` of the ATX headings outside code blocks."""
+    headings, fence = [], None
+    for line in body.splitlines():
+        m = FENCE_RE.match(line)
+        if m:
+            fence = None if fence and m.group(1)[0] == fence else (fence or m.group(1)[0])
+            continue
+        if fence:
+            continue
+        m = HEADING_RE.match(line)
+        if m:
+            headings.append((len(m.group(1)), (m.group(2) or "").strip()))
+    return headings
+
+def meta_value(text: str, label_re: re.Pattern) -> str:
+    """Value after a ``Meta Title``-style label, on the same line or the next non-empty one."""
+    text = text or ""
+    for m in label_re.finditer(text):
+        value = LABEL_TAIL_RE.sub("", m.group(1), count=1)
+        if value.startswith(("/", "／", "&", "、")):
+            continue  # a combined "Meta Title/Meta Description" heading
+        if not value.strip():
+            line = next((line for line in text[m.end():].splitlines() if line.strip()), "")
+            if META_TITLE_RE.match(line) or META_DESC_RE.match(line):
+                continue
+            value = re.sub(r"^[ \t>*\-]+", "", line)
+        return value.strip().strip("*").strip().strip("「」『』\"“”").strip()
+    return ""
+
+# ------------------------------------------
+# Checks
+# ------------------------------------------
+def check_length(report: DraftReport, body: str):
+    report.length = text_length(plain_text(body))
+    if not report.target:
+        return
+    low, high = report.target * (1 - WORD_TOLERANCE), report.target * (1 + WORD_TOLERANCE)
+    if not low <= report.length <= high:
+        report.warnings.append(f"字數 {report.length} 不在目標 {report.target} ±{WORD_TOLERANCE:.0%} 內")
+
+def check_headings(report: DraftReport, body: str):
+    report.headings = parse_headings(body)
+    h1 = [title for level, title in report.headings if level == 1]
+    if not h1:
+        report.errors.append("缺少 H1")
+    elif len(h1) > 1:
+        report.warnings.append(f"有 {len(h1)} 個 H1（建議只有一個）")
+    h2 = sum(level == 2 for level, _ in report.headings)
+    if h2 < MIN_H2:
+        report.warnings.append(f"只有 {h2} 個 H2（建議至少 {MIN_H2} 個）")
+    previous = 0
+    for level, title in report.headings:
+        if not title:
+            report.warnings.append(f"空白的 H{level}")
+        if previous and level > previous + 1:
+            report.warnings.append(f"標題層級跳階：H{previous} 後直接 H{level}（{title or '空白'}）")
+        previous = level
+
+def check_keywords(report: DraftReport, body: str, card_text: str):
+    keywords = parse_card_keywords(card_fields(card_text or "").get(KEYWORD_FIELD, ""))
+    if not keywords:
+        return
+    plain = _squash(plain_text(body))
+    length = max(report.length, 1)
+    h1 = _squash(next((title for level, title in report.headings if level == 1), ""))
+    for keyword, role in keywords:
+        key = _squash(keyword)
+        count = plain.count(key) if key else 0
+        stat = KeywordStat(keyword, role, count, count * text_length(keyword) / length)
+        report.keywords.append(stat)
+        if role == ROLE_PRIMARY:
+            if not count:
+                report.errors.append(f"正文未出現主關鍵字「{keyword}」")
+                continue
+            if stat.density < DENSITY_LOW:
+                report.warnings.append(f"主關鍵字「{keyword}」密度 {stat.density:.1%} 偏低（建議 ≥{DENSITY_LOW:.1%}）")
+            if h1 and key not in h1:
+                report.warnings.append(f"H1 未包含主關鍵字「{keyword}」")
+            if report.meta_title and key not in _squash(report.meta_title):
+                report.warnings.append(f"Meta Title 未包含主關鍵字「{keyword}」")
+        elif role == ROLE_SECONDARY and not count:
+            report.warnings.append(f"正文未出現次關鍵字「{keyword}」")
+        if stat.density > DENSITY_HIGH:
+            report.warnings.append(f"「{keyword}」密度 {stat.density:.1%} 過高（>{DENSITY_HIGH:.0%}，可能堆砌）")
+
+def check_meta(report: DraftReport, seo: str):
+    report.meta_title = meta_value(seo, META_TITLE_RE)
+    report.meta_description = meta_value(seo, META_DESC_RE)
+    for label, value, limit in (
+        ("Meta Title", report.meta_title, META_TITLE_MAX),
+        ("Meta Description", report.meta_description, META_DESC_MAX),
+    ):
+        if not value:
+            report.warnings.append(f"找不到 {label}")
+        elif display_width(value) > limit:
+            report.warnings.append(f"{label} 長度 {display_width(value)} 超過 {limit}（全形字算 2）")
+
+def json_ld_blocks(text: str) -> list:
+    """Raw JSON-LD candidates: json code blocks and ld+json script tags."""
+    blocks = [body for lang, body, _, _ in _code_blocks(text) if lang in ("json", "json-ld", "jsonld", "ld+json")]
+    # Script tags are found wherever they are, including inside a json block.
+    return [b for b in blocks if not JSON_LD_SCRIPT_RE.search(b)] + [m.group(1) for m in JSON_LD_SCRIPT_RE.finditer(text)]
+
+def _schema_nodes(data) -> list:
+    items = data if isinstance(data, list) else [data]
+    nodes = []
+    for item in items:
+        if isinstance(item, dict) and isinstance(item.get("@graph"), list):
+            nodes += [n for n in item["@graph"] if isinstance(n, dict)]
+        elif isinstance(item, dict):
+            nodes.append(item)
+    return nodes
+
+def check_schema_node(node: dict) -> list:
+    """Problems with one JSON-LD node (beyond being valid JSON)."""
+    types = node.get("@type")
+    types = types if isinstance(types, list) else [types]
+    if not any(isinstance(t, str) and t for t in types):
+        return ["缺少 @type"]
+    problems = []
+    for t in types:
+        for prop in SCHEMA_REQUIRED.get(t, ()):
+            if not node.get(prop):
+                problems.append(f"{t} 缺少 {prop}")
+    if isinstance(node.get("headline"), str) and len(node["headline"]) > HEADLINE_MAX:
+        problems.append(f"headline 超過 {HEADLINE_MAX} 字元")
+    if "FAQPage" in types and isinstance(node.get("mainEntity"), list):
+        for i, question in enumerate(node["mainEntity"], 1):
+            answer = question.get("acceptedAnswer") if isinstance(question, dict) else None
+            if not isinstance(question, dict) or not question.get("name"):
+                problems.append(f"FAQ 第 {i} 題缺少 name")
+            elif not isinstance(answer, dict) or not answer.get("text"):
+                problems.append(f"FAQ 第 {i} 題缺少 acceptedAnswer.text")
+    return problems
+
+def check_schema(report: DraftReport, text: str):
+    blocks = json_ld_blocks(text)
+    if not blocks:
+        report.warnings.append("沒有 JSON-LD（只有條列 Schema 建議時可忽略）")
+        return
+    for n, raw in enumerate(blocks, 1):
+        try:
+            data = json.loads(raw)
+        except ValueError as e:
+            report.errors.append(f"JSON-LD 第 {n} 段不是合法 JSON：{e}")
+            continue
+        if not any("schema.org" in str(item.get("@context", "")) for item in (data if isinstance(data, list) else [data]) if isinstance(item, dict)):
+            report.warnings.append(f"JSON-LD 第 {n} 段的 @context 不是 schema.org")
+        for node in _schema_nodes(data):
+            problems = check_schema_node(node)
+            if problems:
+                report.errors.append(f"JSON-LD 第 {n} 段：{'；'.join(problems)}")
+            else:
+                types = node["@type"]
+                report.schemas += types if isinstance(types, list) else [types]
+
+def check_draft(text: str, card_text: str = "", word: str = "", article_id: str = "", path: str = "") -> DraftReport:
+    """Run every check on one Step 8 draft (article body plus its Meta/Schema part)."""
+    fields = card_fields(card_text or "")
+    report = DraftReport(article_id=article_id, path=path, target=parse_word_target(fields.get("字數") or word))
+    body, seo = split_draft(text)
+    if not plain_text(body).strip():
+        report.errors.append("沒有正文")
+    check_length(report, body)
+    check_headings(report, body)
+    check_meta(report, seo)
+    check_keywords(report, body, card_text)
+    check_schema(report, text)
+    return report
+
+# ------------------------------------------
+# Batch over a directory of drafts
+# ------------------------------------------
+def draft_article_id(path: str) -> str:
+    """``step8_A01.response.md`` (batch --out *.zip naming) or ``A01.md`` -> ``A01``."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return ARTICLE_ID_RE.match(stem).group(1)
+
+def draft_paths(paths: list) -> list:
+    """Draft files under ``paths`` (files as given, directories scanned for .md/.txt), sorted."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                found += [os.path.join(root, n) for n in names if n.lower().endswith(DRAFT_SUFFIXES)]
+        else:
+            found.append(path)
+    return sorted(found)
+
+def _check_file(job: tuple) -> DraftReport:
+    path, article_id, card_text, word = job
+    try:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+    except (OSError, UnicodeDecodeError) as e:
+        return DraftReport(article_id=article_id, path=path, errors=[f"無法讀取：{e}"])
+    return check_draft(text, card_text, word, article_id, path)
+
+def check_drafts(paths: list, packet=None, word: str = "", workers: int = 0) -> list:
+    """Check every draft in ``paths`` against its article card; reports in path order.
+
+    The card is matched by file name (see ``draft_article_id``). ``workers``
+    defaults to the CPU count; 1 checks in-process.
+    """
+    index = packet if isinstance(packet, ProjectPacket) else ProjectPacket(packet or "")
+    jobs = []
+    for path in draft_paths(paths):
+        aid = draft_article_id(path)
+        jobs.append((path, aid, index.card(aid) or "", word))
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(jobs) < 2:
+        return [_check_file(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        return list(pool.map(_check_file, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+
+def format_report(report: DraftReport) -> str:
+    target = f" / 目標 {report.target}" if report.target else ""
+    lines = [f"{'✅' if report.ok else '❌'} {report.article_id or report.path}｜字數 {report.length}{target}"]
+    lines += [f"  - ❌ {e}" for e in report.errors]
+    lines += [f"  - ⚠️ {w}" for w in report.warnings]
+    return "\n".join(lines)
+
+# ==========================================
+# CLI
+# ==========================================
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check Step 8 drafts locally: length, keywords, headings, meta, JSON-LD.")
+    parser.add_argument("drafts", nargs="+", help="draft files or directories (*.md, *.txt)")
+    parser.add_argument("--packet", help="PROJECT PACKET text file (card keywords and 字數)")
+    parser.add_argument("--word", default="", help="word target for cards without 字數, e.g. '1500 字'")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (default: CPU count)")
+    parser.add_argument("--out", default="", help="also write one JSON report per line to this path")
+    args = parser.parse_args(argv)
+
+    packet = ""
+    if args.packet:
+        with open(args.packet, encoding="utf-8") as f:
+            packet = f.read()
+    reports = check_drafts(args.drafts, packet, args.word, args.workers)
+    for report in reports:
+        print(format_report(report))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fp:
+            for report in reports:
+                fp.write(json.dumps(report.to_record(), ensure_ascii=False) + "\n")
+    failed = sum(not r.ok for r in reports)
+    print(f"{len(reports)} drafts checked, {failed} with errors", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
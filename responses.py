@@ -0,0 +1,113 @@
+import os
+import sqlite3
+import threading
+import time
+
+from cache import content_hash
+
+# ==========================================
+# On-disk prompt -> LLM response cache
+# ==========================================
+# Responses are keyed by a hash of the fully rendered prompt plus everything
+# that changes the answer (endpoint, model, temperature, max_tokens), so a
+# step re-run with the same packet and inputs is served from disk instead of
+# the endpoint. Entries are evicted least-recently-used once the stored text
+# exceeds max_size characters.
+DEFAULT_CACHE_PATH = os.environ.get("LLM_CACHE_DB", "llm_responses.db")
+DEFAULT_MAX_SIZE = 64_000_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+"""
+
+def response_key(prompt: str, base_url: str, model: str, temperature: float, max_tokens: int = 0) -> str:
+    return content_hash("response", base_url, model, float(temperature), int(max_tokens or 0), prompt)
+
+class ResponseCache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_size: int = DEFAULT_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        # Shared by Streamlit script threads and the LLM event loop thread.
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self.size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self._db as conn:
+                conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def put(self, key: str, response: str, model: str = ""):
+        size = len(response)
+        if size > self.max_size:
+            return response
+        now = time.time()
+        with self._lock, self._db as conn:
+            old = conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now),
+            )
+            self.size += size - (old[0] if old else 0)
+            if self.size > self.max_size:
+                self._evict(conn, self.size - self.max_size)
+        return response
+
+    def _evict(self, conn, excess: int):
+        freed = 0
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self.size -= freed
+
+    def clear(self):
+        with self._lock, self._db as conn:
+            conn.execute("DELETE FROM responses")
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+            self.bypassed = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+            "size": self.size,
+            "max_size": self.max_size,
+        }
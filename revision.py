@@ -0,0 +1,335 @@
+import re
+from bisect import bisect_left
+from dataclasses import dataclass, field
+
+from packet import ProjectPacket
+
+# ==========================================
+# Local v1 -> v2 revision diff (Step 9)
+# ==========================================
+# Articles are aligned paragraph by paragraph (one non-empty line each) with
+# patience diff: paragraphs unique to both versions anchor the alignment, and
+# the stretches between anchors fall back to linear-space Myers. Paragraphs
+# that changed are aligned again sentence by sentence (split after 。！？!?),
+# and whole paragraphs that only changed place are reported as moves.
+# Elements are interned to ints first so every comparison is an int compare.
+# Myers costs O((n + m) * D), so a stretch that is mostly rewritten (judged
+# from a linear multiset count before searching) is reported as one
+# replacement instead of being aligned element by element.
+CHANGE_INSERT = "insert"
+CHANGE_DELETE = "delete"
+CHANGE_REPLACE = "replace"
+CHANGE_MOVE = "move"
+
+REVISION_LOG = "REVISION LOG"
+ARTICLE_ID_FIELD = "本次改稿文章ID"
+VERSION_FIELD = "版本紀錄（v1→v2 差異一句話）"
+
+# A stretch is replaced whole when more than this share of it differs, or
+# when (n + m) * (elements that differ) would exceed MAX_DIFF_WORK.
+REPLACE_SHARE = 0.6
+MAX_DIFF_WORK = 2_000_000
+MIN_CUTOFF_SIZE = 16  # short stretches are always aligned exactly
+
+SENTENCE_RE = re.compile(r".+?(?:(?:[。！？!?]+|\.(?=\s|$))[」』”’）)\"']*\s*|$)")
+
+def split_paragraphs(text: str) -> list:
+    return [line.strip() for line in (text or "").splitlines() if line.strip()]
+
+def split_sentences(paragraph: str) -> list:
+    return [s.strip() for s in SENTENCE_RE.findall(paragraph) if s.strip()]
+
+def _intern(*sequences) -> list:
+    ids = {}
+    return [[ids.setdefault(x, len(ids)) for x in seq] for seq in sequences]
+
+# ---------- sequence alignment ----------
+def _unique_anchors(a, b, alo, ahi, blo, bhi) -> list:
+    # Elements occurring exactly once on both sides, kept in the longest
+    # order-preserving chain (patience sorting).
+    seen_a = {}
+    for i in range(alo, ahi):
+        seen_a[a[i]] = -1 if a[i] in seen_a else i
+    seen_b = {}
+    for j in range(blo, bhi):
+        seen_b[b[j]] = -1 if b[j] in seen_b else j
+    pairs = [(i, seen_b[x]) for x, i in seen_a.items() if i >= 0 and seen_b.get(x, -1) >= 0]
+    pairs.sort()
+    tails, tail_js, prev = [], [], [-1] * len(pairs)
+    for k, (_, j) in enumerate(pairs):
+        pos = bisect_left(tail_js, j)
+        if pos:
+            prev[k] = tails[pos - 1]
+        if pos == len(tails):
+            tails.append(k)
+            tail_js.append(j)
+        else:
+            tails[pos] = k
+            tail_js[pos] = j
+    chain = []
+    k = tails[-1] if tails else -1
+    while k >= 0:
+        chain.append(pairs[k])
+        k = prev[k]
+    return chain[::-1]
+
+def _middle_snake(a, alo, ahi, b, blo, bhi) -> tuple:
+    # Myers' linear-space search: run the forward and backward D-paths until
+    # they overlap and return the snake where they meet as (x0, y0, x1, y1),
+    # or None once the search would cost more than MAX_DIFF_WORK.
+    n, m = ahi - alo, bhi - blo
+    delta = n - m
+    odd = delta & 1
+    limit = (n + m + 1) // 2
+    off = limit + 1
+    max_d = limit if n + m < MIN_CUTOFF_SIZE else min(limit, MAX_DIFF_WORK // (n + m))
+    vf = [0] * (2 * limit + 3)
+    vb = [0] * (2 * limit + 3)
+    for d in range(max_d + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vf[off + k - 1] < vf[off + k + 1]):
+                x = vf[off + k + 1]
+            else:
+                x = vf[off + k - 1] + 1
+            y = x - k
+            sx, sy = x, y
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            vf[off + k] = x
+            c = delta - k
+            if odd and -(d - 1) <= c <= d - 1 and x + vb[off + c] >= n:
+                return alo + sx, blo + sy, alo + x, blo + y
+        for c in range(-d, d + 1, 2):
+            if c == -d or (c != d and vb[off + c - 1] < vb[off + c + 1]):
+                u = vb[off + c + 1]
+            else:
+                u = vb[off + c - 1] + 1
+            v = u - c
+            su, sv = u, v
+            while u < n and v < m and a[ahi - 1 - u] == b[bhi - 1 - v]:
+                u += 1
+                v += 1
+            vb[off + c] = u
+            k = delta - c
+            if not odd and -d <= k <= d and vf[off + k] + u >= n:
+                return ahi - u, bhi - v, ahi - su, bhi - sv
+    if max_d < limit:
+        return None
+    raise AssertionError("middle snake not found")
+
+def _trimmed(a, b, alo, ahi, blo, bhi, out, inner):
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        out.append((alo, blo))
+        alo += 1
+        blo += 1
+    tail = []
+    while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+        ahi -= 1
+        bhi -= 1
+        tail.append((ahi, bhi))
+    if alo < ahi and blo < bhi:
+        inner(a, b, alo, ahi, blo, bhi, out)
+    out.extend(reversed(tail))
+
+def _mostly_rewritten(a, b, alo, ahi, blo, bhi) -> bool:
+    size = (ahi - alo) + (bhi - blo)
+    if size < MIN_CUTOFF_SIZE:
+        return False
+    counts = {}
+    for i in range(alo, ahi):
+        counts[a[i]] = counts.get(a[i], 0) + 1
+    common = 0
+    for j in range(blo, bhi):
+        if counts.get(b[j], 0) > 0:
+            counts[b[j]] -= 1
+            common += 1
+    # Lower bound on the edit distance D: elements with no counterpart at all.
+    differ = size - 2 * common
+    return differ > REPLACE_SHARE * size or size * differ > MAX_DIFF_WORK
+
+def _myers(a, b, alo, ahi, blo, bhi, out):
+    snake = None if _mostly_rewritten(a, b, alo, ahi, blo, bhi) else _middle_snake(a, alo, ahi, b, blo, bhi)
+    if snake is None:
+        return  # no matches: the whole stretch becomes one replacement
+    x0, y0, x1, y1 = snake
+    _trimmed(a, b, alo, x0, blo, y0, out, _myers)
+    out.extend(zip(range(x0, x1), range(y0, y1)))
+    _trimmed(a, b, x1, ahi, y1, bhi, out, _myers)
+
+def _patience(a, b, alo, ahi, blo, bhi, out):
+    anchors = _unique_anchors(a, b, alo, ahi, blo, bhi)
+    if not anchors:
+        _myers(a, b, alo, ahi, blo, bhi, out)
+        return
+    for i, j in anchors:
+        _trimmed(a, b, alo, i, blo, j, out, _patience)
+        out.append((i, j))
+        alo, blo = i + 1, j + 1
+    _trimmed(a, b, alo, ahi, blo, bhi, out, _patience)
+
+def opcodes(a: list, b: list) -> list:
+    """``(tag, i1, i2, j1, j2)`` like difflib's get_opcodes, tags "equal"/insert/delete/replace."""
+    a, b = _intern(a, b)
+    matches = []
+    _trimmed(a, b, 0, len(a), 0, len(b), matches, _patience)
+    ops = []
+    i = j = 0
+    for mi, mj in matches + [(len(a), len(b))]:
+        if i < mi or j < mj:
+            tag = CHANGE_REPLACE if i < mi and j < mj else CHANGE_DELETE if i < mi else CHANGE_INSERT
+            ops.append((tag, i, mi, j, mj))
+        if mi < len(a):
+            if ops and ops[-1][0] == "equal":
+                ops[-1] = ("equal", ops[-1][1], mi + 1, ops[-1][3], mj + 1)
+            else:
+                ops.append(("equal", mi, mi + 1, mj, mj + 1))
+        i, j = mi + 1, mj + 1
+    return ops
+
+# ---------- structured change list ----------
+@dataclass
+class SentenceEdit:
+    tag: str
+    old: list
+    new: list
+
+@dataclass
+class ParagraphChange:
+    tag: str
+    old_index: tuple  # 0-based v1 paragraph numbers
+    new_index: tuple  # 0-based v2 paragraph numbers
+    old: list
+    new: list
+    sentences: list = field(default_factory=list)  # SentenceEdit, for replacements
+
+@dataclass
+class RevisionDiff:
+    changes: list
+    old_paragraphs: int
+    new_paragraphs: int
+    sentences_added: int = 0
+    sentences_removed: int = 0
+    changed_chars: int = 0
+    total_chars: int = 0
+
+    @property
+    def changed_ratio(self) -> float:
+        return self.changed_chars / self.total_chars if self.total_chars else 0.0
+
+    def count(self, tag: str) -> int:
+        return sum(1 for c in self.changes if c.tag == tag)
+
+def sentence_edits(old: list, new: list) -> list:
+    a = [s for p in old for s in split_sentences(p)]
+    b = [s for p in new for s in split_sentences(p)]
+    return [SentenceEdit(tag, a[i1:i2], b[j1:j2]) for tag, i1, i2, j1, j2 in opcodes(a, b) if tag != "equal"]
+
+def diff_revision(v1: str, v2: str) -> RevisionDiff:
+    old, new = split_paragraphs(v1), split_paragraphs(v2)
+    hunks = [[i1, i2, j1, j2] for tag, i1, i2, j1, j2 in opcodes(old, new) if tag != "equal"]
+    # A paragraph deleted in one place and inserted verbatim in another is a move.
+    inserted = {}
+    for _, _, j1, j2 in hunks:
+        for j in range(j1, j2):
+            inserted.setdefault(new[j], []).append(j)
+    moves, moved_old, moved_new = [], set(), set()
+    for i1, i2, j1, _ in hunks:
+        for i in range(i1, i2):
+            targets = inserted.get(old[i])
+            if targets:
+                # Same place within a stretch replaced whole: unchanged, not moved.
+                stay = j1 + i - i1
+                j = stay if stay in targets else targets[0]
+                targets.remove(j)
+                if j != stay:
+                    moves.append(ParagraphChange(CHANGE_MOVE, (i,), (j,), [old[i]], [new[j]]))
+                moved_old.add(i)
+                moved_new.add(j)
+    result = RevisionDiff([], len(old), len(new))
+    # Reported in v2 reading order; a deletion sits where it was removed.
+    changes = [(c.new_index[0], c) for c in moves]
+    for i1, i2, j1, j2 in hunks:
+        oi = tuple(i for i in range(i1, i2) if i not in moved_old)
+        ni = tuple(j for j in range(j1, j2) if j not in moved_new)
+        if not oi and not ni:
+            continue
+        change = ParagraphChange(
+            CHANGE_REPLACE if oi and ni else CHANGE_DELETE if oi else CHANGE_INSERT,
+            oi, ni, [old[i] for i in oi], [new[j] for j in ni],
+        )
+        if change.tag == CHANGE_REPLACE:
+            change.sentences = sentence_edits(change.old, change.new)
+            removed = [s for e in change.sentences for s in e.old]
+            added = [s for e in change.sentences for s in e.new]
+        else:
+            removed = [s for p in change.old for s in split_sentences(p)]
+            added = [s for p in change.new for s in split_sentences(p)]
+        result.sentences_removed += len(removed)
+        result.sentences_added += len(added)
+        result.changed_chars += sum(map(len, removed)) + sum(map(len, added))
+        changes.append((ni[0] if ni else j1, change))
+    result.changes = [c for _, c in sorted(changes, key=lambda pc: pc[0])]
+    result.total_chars = sum(map(len, old)) + sum(map(len, new))
+    return result
+
+# ---------- summaries ----------
+def _span(indices: tuple, prefix: str = "") -> str:
+    first, last = indices[0] + 1, indices[-1] + 1
+    return f"{prefix}¶{first}" if first == last else f"{prefix}¶{first}–{last}"
+
+def change_label(change: ParagraphChange) -> str:
+    if change.tag == CHANGE_INSERT:
+        return f"新增 {_span(change.new_index)}"
+    if change.tag == CHANGE_DELETE:
+        return f"刪除 {_span(change.old_index, 'v1')}"
+    if change.tag == CHANGE_MOVE:
+        return f"移動 {_span(change.old_index, 'v1')}→{_span(change.new_index)}"
+    return f"修改 {_span(change.new_index)}（{len(change.sentences)} 處句子）"
+
+def summarize(diff: RevisionDiff) -> str:
+    if not diff.changes:
+        return "v1→v2 內容相同"
+    return (
+        f"段落 {diff.old_paragraphs}→{diff.new_paragraphs}："
+        f"修改 {diff.count(CHANGE_REPLACE)}、新增 {diff.count(CHANGE_INSERT)}、"
+        f"刪除 {diff.count(CHANGE_DELETE)}、移動 {diff.count(CHANGE_MOVE)}；"
+        f"句子 +{diff.sentences_added} / -{diff.sentences_removed}；變動約 {diff.changed_ratio:.1%}"
+    )
+
+def diff_text(diff: RevisionDiff, limit: int = 200) -> str:
+    """Unified-diff-like rendering: one ``@@`` header per change, sentences as -/+ lines."""
+    lines = []
+    for change in diff.changes[:limit]:
+        lines.append(f"@@ {change_label(change)}")
+        if change.tag == CHANGE_REPLACE:
+            for edit in change.sentences:
+                lines += [f"- {s}" for s in edit.old] + [f"+ {s}" for s in edit.new]
+        elif change.tag != CHANGE_MOVE:
+            lines += [f"- {p}" for p in change.old] + [f"+ {p}" for p in change.new]
+    if len(diff.changes) > limit:
+        lines.append(f"@@ …另有 {len(diff.changes) - limit} 處變更未列出")
+    return "\n".join(lines)
+
+def update_revision_log(packet, article_id: str, diff: RevisionDiff, max_locations: int = 12) -> str:
+    """Fill REVISION LOG's article ID and v1→v2 fields with the local diff (positions only, no article text)."""
+    index = packet if isinstance(packet, ProjectPacket) else ProjectPacket(packet or "")
+    section = index.sections.get(REVISION_LOG)
+    if section is None:
+        return index.text
+    locations = "、".join(change_label(c) for c in diff.changes[:max_locations])
+    if len(diff.changes) > max_locations:
+        locations += f" 等 {len(diff.changes)} 處"
+    values = {
+        ARTICLE_ID_FIELD: (article_id or "").strip(),
+        VERSION_FIELD: summarize(diff) + (f"（{locations}）" if locations else ""),
+    }
+    body = index.text[section.body_start:section.body_end]
+    for label, value in values.items():
+        line = f"- {label}：{value}"
+        pattern = re.compile(rf"^- {re.escape(label)}[：:].*$", re.M)
+        if pattern.search(body):
+            body = pattern.sub(lambda m: line, body, count=1)
+        else:
+            body = body + ("" if not body or body.endswith("\n") else "\n") + line + "\n"
+    return index.text[:section.body_start] + body + index.text[section.body_end:]
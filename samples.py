@@ -0,0 +1,161 @@
+import codecs
+import hashlib
+import re
+
+from cache import SAMPLE_CACHE
+
+# ==========================================
+# Step 1.5 sample ingestion
+# ==========================================
+# Uploaded files are hashed and decoded in fixed-size chunks, capped per file,
+# and cached by content hash so later reruns never decode the same bytes again.
+CHUNK_SIZE = 64 * 1024
+MAX_FILE_CHARS = 200_000
+DEFAULT_SAMPLE_BUDGET = 12_000
+
+SAMPLE_MODE_FULL = "full"
+SAMPLE_MODE_REPRESENTATIVE = "representative"
+
+# Tried in order when there is no BOM; the first that decodes the head cleanly wins.
+CANDIDATE_ENCODINGS = ("utf-8", "cp950", "gb18030")
+BOMS = (
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+PARAGRAPH_SPLIT_RE = re.compile(r"\n\s*\n|\r\n\s*\r\n")
+SENTENCE_END_RE = re.compile(r"[。！？!?；;…]+[」』”\"）)]*|\.(?=\s)|\n")
+MIN_PARAGRAPH_CHARS = 20
+
+def detect_encoding(head: bytes) -> str:
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+    for encoding in CANDIDATE_ENCODINGS:
+        try:
+            # final=False: a multibyte char cut at the chunk edge is not an error.
+            codecs.getincrementaldecoder(encoding)().decode(head, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return "utf-8"
+
+def _file_digest(f) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    f.seek(0)
+    for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+        h.update(chunk)
+    f.seek(0)
+    return h.hexdigest()
+
+def decode_stream(f, max_chars: int = MAX_FILE_CHARS) -> str:
+    f.seek(0)
+    head = f.read(CHUNK_SIZE)
+    decoder = codecs.getincrementaldecoder(detect_encoding(head))(errors="replace")
+    parts = []
+    size = 0
+    chunk = head
+    while chunk and size < max_chars:
+        text = decoder.decode(chunk)
+        parts.append(text)
+        size += len(text)
+        chunk = f.read(CHUNK_SIZE)
+    if size < max_chars:
+        parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)[:max_chars]
+
+def read_upload(f, max_chars: int = MAX_FILE_CHARS) -> str:
+    key = (_file_digest(f), max_chars)
+    text = SAMPLE_CACHE.get(key)
+    if text is None:
+        text = SAMPLE_CACHE.put(key, decode_stream(f, max_chars).strip())
+    return text
+
+# ==========================================
+# Representative sampling
+# ==========================================
+def split_paragraphs(text: str) -> list:
+    paragraphs = []
+    seen = set()
+    for p in PARAGRAPH_SPLIT_RE.split(text or ""):
+        p = p.strip()
+        if len(p) < MIN_PARAGRAPH_CHARS or p in seen:
+            continue
+        seen.add(p)
+        paragraphs.append(p)
+    return paragraphs
+
+def _spread(items: list, budget: int) -> list:
+    # Take evenly spaced items (beginning, middle, end first, then fill in)
+    # until the budget is used, then restore document order.
+    if not items or budget <= 0:
+        return []
+    n = len(items)
+    order = [0, n - 1] if n > 1 else [0]
+    seen = set(order)
+    step = n // 2
+    while step >= 1 and len(seen) < n:
+        for i in range(step, n, step):
+            if i not in seen:
+                seen.add(i)
+                order.append(i)
+        step //= 2
+    picked = {}
+    used = 0
+    for i in order:
+        text = items[i]
+        if len(text) > budget:
+            # Could never fit whole: cut it down to what is left instead of skipping it.
+            text = trim_paragraph(text, budget - used)
+        if not text or used + len(text) > budget:
+            continue
+        picked[i] = text
+        used += len(text)
+    return [picked[i] for i in sorted(picked)]
+
+def trim_paragraph(text: str, limit: int) -> str:
+    """``text`` cut to at most ``limit`` chars, at the last sentence end if there is one; "" if too short to keep."""
+    if len(text) <= limit:
+        return text
+    if limit < MIN_PARAGRAPH_CHARS:
+        return ""
+    ends = [m.end() for m in SENTENCE_END_RE.finditer(text, 0, limit)]
+    cut = ends[-1] if ends and ends[-1] >= MIN_PARAGRAPH_CHARS else limit
+    return text[:cut].rstrip()
+
+def sample_corpus(docs: list, budget_chars: int = DEFAULT_SAMPLE_BUDGET) -> list:
+    """Pick paragraphs across ``[(name, text), ...]`` so the total stays within ``budget_chars``.
+
+    Every document gets an equal share of the budget. Documents are filled
+    smallest first, so whatever share a short document leaves unused goes to
+    the longer ones; the result keeps the input order.
+    """
+    docs = [(name, split_paragraphs(text)) for name, text in docs]
+    docs = [(name, paras) for name, paras in docs if paras]
+    picked = {}
+    remaining = budget_chars
+    by_size = sorted(range(len(docs)), key=lambda i: sum(len(p) for p in docs[i][1]))
+    for k, i in enumerate(by_size):
+        share = remaining // (len(docs) - k)
+        picked[i] = _spread(docs[i][1], share)
+        remaining -= sum(len(p) for p in picked[i])
+    return [(docs[i][0], "\n\n".join(picked[i])) for i in range(len(docs)) if picked[i]]
+
+def build_samples(
+    files,
+    mode: str = SAMPLE_MODE_FULL,
+    budget_chars: int = DEFAULT_SAMPLE_BUDGET,
+    max_file_chars: int = MAX_FILE_CHARS,
+) -> str:
+    docs = []
+    for f in files or []:
+        try:
+            text = read_upload(f, max_file_chars)
+        except Exception:
+            text = ""
+        if text:
+            docs.append((f.name, text))
+    if mode == SAMPLE_MODE_REPRESENTATIVE:
+        docs = sample_corpus(docs, budget_chars)
+    return "\n\n".join(f"=== [FILE: {name}] ===\n{text}\n=== [/FILE] ===" for name, text in docs)
@@ -0,0 +1,412 @@
+import argparse
+import codecs
+import hashlib
+import io
+import json
+import os
+import re
+import statistics
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from urllib.parse import parse_qs, urlparse
+
+from cache import CAPTURE_CACHE
+from keywords import canonical
+from links import tokens
+from qa import text_length
+from samples import CHUNK_SIZE, detect_encoding
+
+# ==========================================
+# Offline SERP/competitor capture ingestion (Step 5)
+# ==========================================
+# Analysts save Google result pages and competitor articles as HTML (or
+# plain text/Markdown). Each file is decoded and parsed in CHUNK_SIZE pieces
+# by a streaming HTML parser that keeps only titles, headings, a visible-text
+# length and question-like lines (FAQ), never the page text itself. Files are
+# parsed on a process pool, parsed pages are cached by file content hash, and
+# only a compact per-keyword competitor table is embedded in prompt5.
+KIND_SERP = "serp"
+KIND_PAGE = "page"
+CAPTURE_SUFFIXES = (".html", ".htm", ".txt", ".md", ".markdown")
+UNASSIGNED = "（未對應關鍵字）"
+# Share of a keyword's tokens the page title/H1 must contain to be matched to it.
+MATCH_THRESHOLD = 0.5
+# Below this many uncached files, parsing in-process beats starting a pool.
+MIN_PARALLEL_FILES = 8
+
+MAX_PAGES = 10           # competitor pages per keyword
+MAX_RESULTS = 10         # SERP results per keyword
+MAX_H2 = 6               # H2s listed per page
+MAX_QUESTIONS = 8        # questions per keyword
+MAX_CELL_CHARS = 28
+
+SKIP_TAGS = {"script", "style", "noscript", "svg", "template", "iframe"}
+CHROME_TAGS = {"nav", "header", "footer", "aside", "form"}  # parsed, but not counted as article text
+CAPTURE_TAGS = {"title", "h1", "h2", "h3", "h4", "summary", "dt"}
+QUESTION_RE = re.compile(r"(?:[?？]\s*$|^\s*Q\d*\s*[.:：、])", re.I)
+SERP_TITLE_RE = re.compile(r"^(.*?)\s*[-–|]\s*Google\s*(?:搜尋|搜索|Search)\s*$", re.I)
+MD_HEADING_RE = re.compile(r"^[ \t]{0,3}(#{1,4})[ \t]+(.+?)[ \t#]*$")
+TEXT_URL_RE = re.compile(r"^(?:URL|網址|来源|來源|Source)[ \t]*[:：][ \t]*(\S+)", re.I)
+WHITESPACE_RE = re.compile(r"\s+")
+
+@dataclass
+class PageCapture:
+    name: str
+    kind: str = KIND_PAGE
+    url: str = ""
+    title: str = ""
+    description: str = ""
+    query: str = ""                                  # search query of a SERP capture
+    headings: list = field(default_factory=list)     # [(level, text), ...]
+    length: int = 0                                  # visible 字數 (see qa.text_length)
+    questions: list = field(default_factory=list)
+    results: list = field(default_factory=list)      # SERP: [(title, url), ...] in rank order
+    keyword: str = ""                                # set by assign_keywords
+
+    @property
+    def domain(self) -> str:
+        return urlparse(self.url).netloc.lower().removeprefix("www.")
+
+    def h(self, level: int) -> list:
+        return [text for lv, text in self.headings if lv == level]
+
+def _clean(text: str) -> str:
+    return WHITESPACE_RE.sub(" ", text or "").strip()
+
+def _result_url(href: str) -> str:
+    # Google wraps organic links as /url?q=<target>&...
+    parsed = urlparse(href or "")
+    if parsed.path == "/url":
+        href = (parse_qs(parsed.query).get("q") or parse_qs(parsed.query).get("url") or [""])[0]
+        parsed = urlparse(href)
+    if parsed.scheme not in ("http", "https") or "google." in parsed.netloc:
+        return ""
+    return href
+
+def _faq_questions(data) -> list:
+    items = data if isinstance(data, list) else [data]
+    nodes = []
+    for item in items:
+        if isinstance(item, dict):
+            nodes += item["@graph"] if isinstance(item.get("@graph"), list) else [item]
+    found = []
+    for node in nodes:
+        types = node.get("@type") if isinstance(node, dict) else None
+        if "FAQPage" in (types if isinstance(types, list) else [types]):
+            entities = node.get("mainEntity")
+            for q in entities if isinstance(entities, list) else [entities]:
+                if isinstance(q, dict) and q.get("name"):
+                    found.append(_clean(str(q["name"])))
+    return found
+
+# ------------------------------------------
+# Streaming parsers
+# ------------------------------------------
+class CaptureParser(HTMLParser):
+    def __init__(self, capture: PageCapture):
+        super().__init__(convert_charrefs=True)
+        self.capture = capture
+        self._skip = 0          # depth inside script/style/...
+        self._chrome = 0        # depth inside nav/header/footer/...
+        self._tag = None        # CAPTURE_TAGS element being read
+        self._text = []
+        self._href = None       # enclosing <a href>, for SERP results
+        self._json = None       # ld+json script being read
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "meta":
+            name = (attrs.get("name") or attrs.get("property") or "").lower()
+            content = _clean(attrs.get("content") or "")
+            if name in ("description", "og:description") and not self.capture.description:
+                self.capture.description = content
+            elif name == "og:url" and not self.capture.url:
+                self.capture.url = content
+            elif name == "og:title" and not self.capture.title:
+                self.capture.title = content
+        elif tag == "link" and "canonical" in (attrs.get("rel") or "").lower():
+            self.capture.url = self.capture.url or (attrs.get("href") or "")
+        elif tag == "script" and "ld+json" in (attrs.get("type") or "").lower():
+            self._json = []
+            self._skip += 1
+        elif tag in SKIP_TAGS:
+            self._skip += 1
+        elif tag in CHROME_TAGS:
+            self._chrome += 1
+        elif tag == "a":
+            self._href = attrs.get("href")
+        if tag in CAPTURE_TAGS and self._tag is None:
+            self._tag, self._text = tag, []
+
+    def handle_endtag(self, tag):
+        if tag == "script" and self._json is not None:
+            try:
+                self.capture.questions += _faq_questions(json.loads("".join(self._json)))
+            except ValueError:
+                pass
+            self._json = None
+            self._skip = max(self._skip - 1, 0)
+        elif tag in SKIP_TAGS:
+            self._skip = max(self._skip - 1, 0)
+        elif tag in CHROME_TAGS:
+            self._chrome = max(self._chrome - 1, 0)
+        elif tag == "a":
+            self._href = None
+        if tag == self._tag:
+            self._finish(tag, _clean("".join(self._text)))
+            self._tag = None
+
+    def _finish(self, tag: str, text: str):
+        if not text:
+            return
+        if tag == "title":
+            self.capture.title = text
+            return
+        if tag in ("h1", "h2", "h3", "h4") and not self._chrome:
+            self.capture.headings.append((int(tag[1]), text))
+        if tag == "h3" and self._href:
+            url = _result_url(self._href)
+            if url:
+                self.capture.results.append((text, url))
+        if QUESTION_RE.search(text):
+            self.capture.questions.append(text)
+
+    def handle_data(self, data):
+        if self._json is not None:
+            self._json.append(data)
+            return
+        if self._skip:
+            return
+        if self._tag is not None:
+            self._text.append(data)
+        if not self._chrome and self._tag != "title":
+            self.capture.length += text_length(data)
+
+def _parse_text(chunks, capture: PageCapture):
+    partial = ""
+    for chunk in chunks:
+        lines = (partial + chunk).split("\n")
+        partial = lines.pop()
+        _text_lines(lines, capture)
+    _text_lines([partial], capture)
+
+def _text_lines(lines: list, capture: PageCapture):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        m = TEXT_URL_RE.match(line)
+        if m and not capture.url:
+            capture.url = m.group(1)
+            continue
+        m = MD_HEADING_RE.match(line)
+        if m:
+            capture.headings.append((len(m.group(1)), _clean(m.group(2))))
+            if len(m.group(1)) == 1 and not capture.title:
+                capture.title = _clean(m.group(2))
+        elif not capture.title:
+            capture.title = line[:80]
+        if QUESTION_RE.search(line) and len(line) <= 80:
+            capture.questions.append(line.lstrip("#-*• ").strip())
+        capture.length += text_length(line.lstrip("#").strip())
+
+def _decoded_chunks(f):
+    head = f.read(CHUNK_SIZE)
+    decoder = codecs.getincrementaldecoder(detect_encoding(head))(errors="replace")
+    chunk = head
+    while chunk:
+        yield decoder.decode(chunk)
+        chunk = f.read(CHUNK_SIZE)
+    yield decoder.decode(b"", final=True)
+
+def parse_capture(f, name: str) -> PageCapture:
+    """Parse one saved page from a binary stream, CHUNK_SIZE bytes at a time."""
+    capture = PageCapture(name=name)
+    if name.lower().endswith((".html", ".htm")):
+        parser = CaptureParser(capture)
+        for text in _decoded_chunks(f):
+            parser.feed(text)
+        parser.close()
+    else:
+        _parse_text(_decoded_chunks(f), capture)
+    m = SERP_TITLE_RE.match(capture.title)
+    query = parse_qs(urlparse(capture.url).query).get("q", [""])[0] if "google." in capture.url else ""
+    if m or query or (capture.results and not capture.h(1)):
+        capture.kind = KIND_SERP
+        capture.query = _clean(query or (m.group(1) if m else ""))
+    seen = set()
+    capture.questions = [q for q in capture.questions if not (canonical(q) in seen or seen.add(canonical(q)))]
+    return capture
+
+def _parse_job(job: tuple) -> PageCapture:
+    name, source = job
+    if isinstance(source, bytes):
+        return parse_capture(io.BytesIO(source), name)
+    try:
+        with open(source, "rb") as f:
+            return parse_capture(f, name)
+    except OSError:
+        return PageCapture(name=name)
+
+def _digest(f) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+        h.update(chunk)
+    return h.hexdigest()
+
+def parse_captures(jobs: list, workers: int = 0) -> list:
+    """Parse ``[(name, path or bytes, digest), ...]``; cached pages are reused, the rest run on a process pool."""
+    captures = [CAPTURE_CACHE.get(digest) for _, _, digest in jobs]
+    missing = [i for i, capture in enumerate(captures) if capture is None]
+    work = [(jobs[i][0], jobs[i][1]) for i in missing]
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(work) < MIN_PARALLEL_FILES:
+        parsed = [_parse_job(job) for job in work]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(work))) as pool:
+            parsed = list(pool.map(_parse_job, work, chunksize=max(1, len(work) // (workers * 4))))
+    for i, capture in zip(missing, parsed):
+        captures[i] = CAPTURE_CACHE.put(jobs[i][2], capture)
+    # Cached objects are shared: hand out copies so keyword assignment never leaks between calls.
+    return [PageCapture(**{**vars(c), "keyword": ""}) for c in captures]
+
+def capture_files(paths: list, workers: int = 0) -> list:
+    """Parse saved pages under ``paths``; a file in a sub-directory is tagged with that directory's name as keyword."""
+    jobs, hints = [], []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in sorted(os.walk(path)):
+                for n in sorted(names):
+                    if n.lower().endswith(CAPTURE_SUFFIXES):
+                        jobs.append(os.path.join(root, n))
+                        hints.append("" if os.path.samefile(root, path) else os.path.relpath(root, path).split(os.sep)[0])
+        else:
+            jobs.append(path)
+            hints.append("")
+    digests = []
+    for path in jobs:
+        try:
+            with open(path, "rb") as f:
+                digests.append(_digest(f))
+        except OSError:
+            digests.append(path)
+    captures = parse_captures([(p, p, d) for p, d in zip(jobs, digests)], workers)
+    for capture, hint in zip(captures, hints):
+        capture.keyword = hint
+    return captures
+
+def capture_uploads(files: list, workers: int = 0) -> list:
+    """Parse uploaded files (anything with ``.name`` and ``.getvalue()``)."""
+    jobs = []
+    for f in files:
+        data = f.getvalue()
+        jobs.append((f.name, data, _digest(io.BytesIO(data))))
+    return parse_captures(jobs, workers)
+
+# ------------------------------------------
+# Keyword assignment + compression
+# ------------------------------------------
+def match_keyword(capture: PageCapture, keywords: list) -> str:
+    """The keyword whose tokens best appear in the query/title/H1; UNASSIGNED below MATCH_THRESHOLD."""
+    if capture.query:
+        for kw in keywords:
+            if canonical(kw) == canonical(capture.query):
+                return kw
+    seen = set(tokens(" ".join([capture.query, capture.title, *capture.h(1)])))
+    best, best_score = UNASSIGNED, 0.0
+    for kw in keywords:
+        kw_tokens = set(tokens(kw))
+        score = len(kw_tokens & seen) / len(kw_tokens) if kw_tokens else 0.0
+        if score > best_score:
+            best, best_score = kw, score
+    if best_score >= MATCH_THRESHOLD:
+        return best
+    return capture.query or UNASSIGNED
+
+def assign_keywords(captures: list, keywords: list) -> dict:
+    """``{keyword: [capture, ...]}`` in keyword order; directory hints win over title matching."""
+    keywords = [k.strip() for k in keywords if k.strip()]
+    grouped = {kw: [] for kw in keywords}
+    by_key = {canonical(kw): kw for kw in keywords}
+    for capture in captures:
+        hint = capture.keyword
+        capture.keyword = by_key.get(canonical(hint), hint) if hint else match_keyword(capture, keywords)
+        grouped.setdefault(capture.keyword, []).append(capture)
+    return {kw: pages for kw, pages in grouped.items() if pages}
+
+def _cell(text: str, limit: int = MAX_CELL_CHARS) -> str:
+    text = _clean(text).replace("|", "／")
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+def _page_key(url: str) -> str:
+    parsed = urlparse(url or "")
+    return parsed.netloc.lower().removeprefix("www.") + parsed.path.rstrip("/")
+
+def keyword_summary(keyword: str, captures: list) -> str:
+    serps = [c for c in captures if c.kind == KIND_SERP]
+    results, rank = [], {}
+    for serp in serps:
+        for title, url in serp.results:
+            if _page_key(url) not in rank:
+                rank[_page_key(url)] = len(results)
+                results.append((title, urlparse(url).netloc.lower().removeprefix("www.")))
+    # Competitor pages in SERP order where the capture says where they rank; the same URL only once.
+    pages, seen = [], set()
+    for page in sorted((c for c in captures if c.kind == KIND_PAGE), key=lambda c: rank.get(_page_key(c.url), len(rank))):
+        key = _page_key(page.url) or page.name
+        if key not in seen:
+            seen.add(key)
+            pages.append(page)
+    pages = pages[:MAX_PAGES]
+    lines = [f"### {keyword}（競品 {len(pages)} 頁" + (f"、SERP {len(serps)} 份）" if serps else "）")]
+    if results:
+        lines.append("SERP 前排：" + "｜".join(f"{i}. {_cell(t, 24)}（{d}）" for i, (t, d) in enumerate(results[:MAX_RESULTS], 1)))
+    if pages:
+        lines += ["| 來源 | 標題 | 字數 | H2 數 | 主要 H2 |", "| --- | --- | --- | --- | --- |"]
+        for page in pages:
+            h2 = page.h(2)
+            lines.append(
+                f"| {_cell(page.domain or os.path.basename(page.name), 24)} | {_cell(page.title or next(iter(page.h(1)), ''))} "
+                f"| {page.length} | {len(h2)} | {'；'.join(_cell(h, 18) for h in h2[:MAX_H2])} |"
+            )
+        lengths = [p.length for p in pages if p.length]
+        if lengths:
+            lines.append(f"字數：中位數 {int(statistics.median(lengths))}（{min(lengths)}–{max(lengths)}）")
+    questions, seen = [], set()
+    for capture in captures:
+        for q in capture.questions:
+            if canonical(q) not in seen:
+                seen.add(canonical(q))
+                questions.append(q)
+    if questions:
+        lines.append("常見問題：" + "｜".join(_cell(q, 40) for q in questions[:MAX_QUESTIONS]))
+    return "\n".join(lines)
+
+def competitor_table(captures: list, keywords: list) -> str:
+    """Per-keyword competitor summary for prompt5; empty when there are no captures."""
+    grouped = assign_keywords(captures, keywords)
+    return "\n\n".join(keyword_summary(kw, pages) for kw, pages in grouped.items())
+
+# ==========================================
+# CLI
+# ==========================================
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Summarize saved SERP/competitor pages per keyword for the Step 5 prompt.")
+    parser.add_argument("captures", nargs="+", help="saved pages or directories (one sub-directory per keyword is optional)")
+    parser.add_argument("--keywords", help="keyword file, one per line (the Step 5 core keywords)")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    keywords = []
+    if args.keywords:
+        with open(args.keywords, encoding="utf-8") as f:
+            keywords = f.read().splitlines()
+    captures = capture_files(args.captures, args.workers)
+    print(competitor_table(captures, keywords))
+    print(f"{len(captures)} captures parsed", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
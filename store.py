@@ -0,0 +1,195 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from history import Blob, PacketHistory, Version
+
+# ==========================================
+# Persistent multi-project store (SQLite, WAL)
+# ==========================================
+# One ProjectStore is shared by every session in the process. Projects are
+# loaded lazily on first access and kept in memory, so sessions editing the
+# same project share one copy of its packet, voice bank, inputs and history;
+# writes go through to SQLite and only touch rows that changed.
+DEFAULT_DB_PATH = os.environ.get("SEO_PROJECTS_DB", "seo_projects.db")
+DEFAULT_PROJECT = "default"
+
+DOC_PACKET = "packet"
+DOC_VOICE_BANK = "voice_bank"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    project_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    text TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (project_id, kind)
+);
+CREATE TABLE IF NOT EXISTS inputs (
+    project_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (project_id, key)
+);
+CREATE TABLE IF NOT EXISTS history_blobs (
+    project_id TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    base TEXT NOT NULL,
+    depth INTEGER NOT NULL,
+    payload BLOB NOT NULL,
+    PRIMARY KEY (project_id, hash)
+);
+CREATE TABLE IF NOT EXISTS history_versions (
+    project_id TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    segments TEXT NOT NULL,
+    note TEXT NOT NULL,
+    created REAL NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (project_id, number)
+);
+"""
+
+class ProjectStore:
+    def __init__(self, path: str = DEFAULT_DB_PATH):
+        self.path = path
+        # Streamlit runs every script rerun in a fresh thread, so one shared
+        # connection is serialized by a lock instead of opening one per thread.
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._documents = {}  # (project_id, kind) -> text
+        self._inputs = {}     # project_id -> {key: value}
+        self._histories = {}  # project_id -> (PacketHistory, versions already written)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _touch(self, conn, project_id: str):
+        conn.execute("UPDATE projects SET updated = ? WHERE id = ?", (time.time(), project_id))
+
+    # ---------- projects ----------
+    def projects(self) -> list:
+        with self._lock:
+            rows = self._db.execute("SELECT id FROM projects ORDER BY updated DESC").fetchall()
+        return [r[0] for r in rows]
+
+    def ensure_project(self, project_id: str) -> str:
+        project_id = (project_id or "").strip()
+        if not project_id:
+            raise ValueError("project ID must not be empty")
+        now = time.time()
+        with self._lock, self._db as conn:
+            conn.execute("INSERT OR IGNORE INTO projects (id, created, updated) VALUES (?, ?, ?)", (project_id, now, now))
+        return project_id
+
+    # ---------- packet / voice bank ----------
+    def document(self, project_id: str, kind: str):
+        key = (project_id, kind)
+        with self._lock:
+            if key not in self._documents:
+                row = self._db.execute(
+                    "SELECT text FROM documents WHERE project_id = ? AND kind = ?", key
+                ).fetchone()
+                self._documents[key] = None if row is None else row[0]
+            return self._documents[key]
+
+    def save_document(self, project_id: str, kind: str, text: str) -> bool:
+        text = text or ""
+        with self._lock:
+            if self.document(project_id, kind) == text:
+                return False
+            with self._db as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO documents (project_id, kind, text, updated) VALUES (?, ?, ?, ?)",
+                    (project_id, kind, text, time.time()),
+                )
+                self._touch(conn, project_id)
+            self._documents[(project_id, kind)] = text
+            return True
+
+    # ---------- step inputs ----------
+    def inputs(self, project_id: str) -> dict:
+        with self._lock:
+            if project_id not in self._inputs:
+                rows = self._db.execute(
+                    "SELECT key, value FROM inputs WHERE project_id = ?", (project_id,)
+                ).fetchall()
+                self._inputs[project_id] = {k: json.loads(v) for k, v in rows}
+            return dict(self._inputs[project_id])
+
+    def save_inputs(self, project_id: str, values: dict) -> int:
+        """Write the values that differ from the stored ones; returns how many changed."""
+        with self._lock:
+            self.inputs(project_id)
+            stored = self._inputs[project_id]
+            changed = {k: v for k, v in values.items() if k not in stored or stored[k] != v}
+            if not changed:
+                return 0
+            with self._db as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO inputs (project_id, key, value) VALUES (?, ?, ?)",
+                    [(project_id, k, json.dumps(v, ensure_ascii=False)) for k, v in changed.items()],
+                )
+                self._touch(conn, project_id)
+            stored.update(changed)
+            return len(changed)
+
+    # ---------- packet history ----------
+    def history(self, project_id: str) -> PacketHistory:
+        with self._lock:
+            if project_id not in self._histories:
+                history = self._load_history(project_id)
+                self._histories[project_id] = (history, len(history))
+            return self._histories[project_id][0]
+
+    def _load_history(self, project_id: str) -> PacketHistory:
+        history = PacketHistory()
+        conn = self._db
+        for h, base, depth, payload in conn.execute(
+            "SELECT hash, base, depth, payload FROM history_blobs WHERE project_id = ?", (project_id,)
+        ):
+            history.blobs[h] = Blob(base, depth, payload)
+        for number, digest, segments, note, created, size in conn.execute(
+            "SELECT number, digest, segments, note, created, size FROM history_versions"
+            " WHERE project_id = ? ORDER BY number",
+            (project_id,),
+        ):
+            history.versions.append(Version(number, digest, tuple(map(tuple, json.loads(segments))), note, created, size))
+        return history
+
+    def save_history(self, project_id: str) -> int:
+        """Write versions committed since the last save, with the blobs they introduced."""
+        with self._lock:
+            history = self.history(project_id)
+            saved = self._histories[project_id][1]
+            new_versions = history.versions[saved:]
+            if not new_versions:
+                return 0
+            hashes = {h for v in new_versions for _, h in v.segments}
+            with self._db as conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO history_blobs (project_id, hash, base, depth, payload) VALUES (?, ?, ?, ?, ?)",
+                    [(project_id, h, history.blobs[h].base, history.blobs[h].depth, history.blobs[h].payload) for h in hashes],
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO history_versions (project_id, number, digest, segments, note, created, size)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (project_id, v.number, v.digest, json.dumps(v.segments, ensure_ascii=False), v.note, v.created, v.size)
+                        for v in new_versions
+                    ],
+                )
+            self._histories[project_id] = (history, saved + len(new_versions))
+            return len(new_versions)
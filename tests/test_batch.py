@@ -0,0 +1,61 @@
+import io
+import json
+import zipfile
+
+import pytest
+
+from batch import iter_batch_prompts, main, select_card_ids, write_jsonl, write_zip
+from packet import ProjectPacket
+from prompts import PROJECT_PACKET_TEMPLATE
+
+CARD = "- 文章ID：{id}\n  - 標題：{title}\n  - 字數：{words}\n  - CTA：{cta}\n"
+CARDS = (("A01", "咖啡豆挑選指南", "1500 字", "訂閱電子報"), ("A02", "手沖咖啡入門", "2000 字", ""),
+         ("A10", "拿鐵拉花教學", "", ""), ("B01", "冷萃咖啡做法", "", ""))
+TEMPLATE_CARDS = slice(PROJECT_PACKET_TEMPLATE.index("- 文章ID：A01"), PROJECT_PACKET_TEMPLATE.index("=== [/CONTENT QUEUE]"))
+PACKET = PROJECT_PACKET_TEMPLATE.replace(
+    PROJECT_PACKET_TEMPLATE[TEMPLATE_CARDS],
+    "".join(CARD.format(id=i, title=t, words=w, cta=c) for i, t, w, c in CARDS),
+)
+
+def test_select_card_ids():
+    index = ProjectPacket(PACKET)
+    assert select_card_ids(index) == ["A01", "A02", "A10", "B01"]
+    assert select_card_ids(index, "A01-A02") == ["A01", "A02"]
+    assert select_card_ids(index, "A1*, B01") == ["A10", "B01"]
+    assert select_card_ids(index, "C*") == []
+
+def test_step7_prompts_use_each_cards_own_title():
+    records = list(iter_batch_prompts(7, PACKET, "", ["A01", "A02"]))
+    assert [r["article_id"] for r in records] == ["A01", "A02"]
+    assert "咖啡豆挑選指南" in records[0]["prompt"] and "手沖咖啡入門" in records[1]["prompt"]
+    assert all(r["step"] == 7 and r["tokens"] > 0 for r in records)
+
+def test_step8_card_fields_override_shared_inputs():
+    records = {r["article_id"]: r["prompt"] for r in iter_batch_prompts(8, PACKET, "", word="999 字")}
+    assert "字數：1500 字" in records["A01"] and "CTA：訂閱電子報" in records["A01"]
+    assert "字數：999 字" in records["A10"]
+
+def test_only_steps_7_and_8():
+    with pytest.raises(ValueError):
+        next(iter_batch_prompts(3, PACKET, ""))
+
+def test_writers_round_trip():
+    records = [
+        {"article_id": "A01", "step": 8, "prompt": "p1", "response": "r1"},
+        {"article_id": "A02", "step": 8, "prompt": "p2"},
+    ]
+    text = io.StringIO()
+    assert write_jsonl(records, text) == 2
+    assert [json.loads(line) for line in text.getvalue().splitlines()] == records
+    data = io.BytesIO()
+    assert write_zip(records, data) == 2
+    with zipfile.ZipFile(data) as zf:
+        assert sorted(zf.namelist()) == ["step8_A01.md", "step8_A01.response.md", "step8_A02.md"]
+        assert zf.read("step8_A01.response.md") == b"r1"
+
+def test_cli_writes_jsonl(tmp_path):
+    packet = tmp_path / "packet.txt"
+    packet.write_text(PACKET, encoding="utf-8")
+    out = tmp_path / "out.jsonl"
+    assert main([str(packet), "--step", "7", "--cards", "A0*", "--out", str(out)]) == 0
+    assert [json.loads(line)["article_id"] for line in out.read_text(encoding="utf-8").splitlines()] == ["A01", "A02"]
@@ -0,0 +1,37 @@
+from cache import LRUCache, content_hash, memoize
+
+def test_content_hash_separates_parts():
+    assert content_hash("ab", "c") != content_hash("a", "bc")
+    assert content_hash("a", 1) == content_hash("a", 1) != content_hash("a", "1 ")
+
+def test_lru_evicts_least_recently_used_by_size():
+    cache = LRUCache(max_size=10)
+    cache.put("a", "xxxx")
+    cache.put("b", "yyyy")
+    assert cache.get("a") == "xxxx"  # "a" is now the most recent
+    cache.put("c", "zzzz")
+    assert cache.get("b") is None and cache.get("a") == "xxxx" and cache.get("c") == "zzzz"
+    assert cache.size == 8 and len(cache) == 2
+
+def test_oversize_values_are_returned_but_not_stored():
+    cache = LRUCache(max_size=3)
+    assert cache.put("k", "too long") == "too long"
+    assert len(cache) == 0 and cache.size == 0
+
+def test_replacing_a_key_keeps_the_size_right():
+    cache = LRUCache(max_size=100)
+    cache.put("k", "12345")
+    cache.put("k", "12")
+    assert cache.size == 2 and cache.get("k") == "12"
+
+def test_memoize_reuses_results_by_content():
+    cache, calls = LRUCache(max_size=100), []
+
+    @memoize(cache)
+    def shout(text):
+        calls.append(text)
+        return text.upper()
+
+    assert shout("hi") == shout("hi") == "HI"
+    assert calls == ["hi"]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
@@ -0,0 +1,15 @@
+from chunked import parse_word_target
+
+def test_word_target_ignores_other_numbers():
+    assert parse_word_target("2000 字，含 5 個 FAQ") == 2000
+    assert parse_word_target("FAQ 3-5 題，共 2000 字") == 2000
+
+def test_word_target_averages_only_ranges():
+    assert parse_word_target("3000–5000字") == 4000
+    assert parse_word_target("3000 字至 5000 字") == 4000
+    assert parse_word_target("3,000~5,000") == 4000
+    assert parse_word_target("含 5 個 FAQ，2000-3000 字") == 2500
+
+def test_word_target_plain_number():
+    assert parse_word_target("約 2500") == 2500
+    assert parse_word_target("") == 0
@@ -0,0 +1,42 @@
+import math
+
+from gkp import compact_gkp, gkp_clusters, parse_gkp, parse_range, score_keywords
+
+EXPORT = """Keyword Stats 2024-06-01
+Keyword\tAvg. monthly searches\tCompetition\tCompetition (indexed value)\tTop of page bid (low range)\tTop of page bid (high range)
+益生菌 推薦\t10K – 100K\tHigh\t90\t5.1\t20.4
+益生菌推薦\t1K – 10K\tHigh\t85\t4.0\t15.0
+iphone 15\t100K – 1M\tMedium\t\t10\t30
+iphone 16\t100K – 1M\tMedium\t\t12\t35
+魚油 功效\t1,300\tLow\t\t\t
+"""
+
+def test_parse_range():
+    assert parse_range("1K – 10K") == (1000, 10000)
+    assert parse_range("1,300") == (1300, 1300)
+    assert parse_range("1萬") == (10000, 10000)
+    assert all(math.isnan(v) for v in parse_range(""))
+
+def test_parse_export_with_a_preamble_line():
+    table = parse_gkp(EXPORT)
+    assert list(table.keywords) == ["益生菌 推薦", "益生菌推薦", "iphone 15", "iphone 16", "魚油 功效"]
+    # The indexed value wins; otherwise the Low/Medium/High level is mapped.
+    assert list(table.competition) == [90, 85, 50, 50, 20]
+    assert table.volume_low[0] == 10_000 and table.volume_high[0] == 100_000
+    assert parse_gkp("just some text") is None
+
+def test_scores_rank_demand_over_competition():
+    scores = score_keywords(parse_gkp(EXPORT))
+    assert scores[2] > scores[0] > scores[1]
+
+def test_compact_table_merges_variants_but_keeps_distinct_keywords():
+    assert [c.members for c in gkp_clusters(EXPORT)] == [["益生菌 推薦", "益生菌推薦"]]
+    compact = compact_gkp(EXPORT)
+    rows = [line for line in compact.splitlines() if line.startswith("| ") and line[2].isdigit()]
+    assert [row.split(" | ")[1] for row in rows] == ["iphone 16", "iphone 15", "益生菌 推薦", "魚油 功效"]
+    assert "| 益生菌 推薦 | 1 |" in compact
+    assert compact_gkp("not a table") == "not a table"
+
+def test_compact_without_dedupe_ranks_every_row():
+    compact = compact_gkp(EXPORT, 60, False)
+    assert sum(line.startswith("| ") and line[2].isdigit() for line in compact.splitlines()) == 5
@@ -0,0 +1,54 @@
+import random
+
+from cache import HISTORY_CACHE
+from history import SECTION_ADDED, SECTION_CHANGED, PacketHistory, split_segments
+from packet import CONTENT_QUEUE, ProjectPacket
+from prompts import PROJECT_PACKET_TEMPLATE
+
+def _edits(n: int, seed: int = 3) -> list:
+    """``n`` successive packets, each with a line added to or changed in one section."""
+    rng, text, texts = random.Random(seed), PROJECT_PACKET_TEMPLATE, []
+    for i in range(n):
+        lines = text.splitlines(keepends=True)
+        k = rng.randrange(1, len(lines))
+        if lines[k].startswith("==="):
+            lines.insert(k, f"- 第 {i} 次修改\n")
+        else:
+            lines[k] = lines[k].rstrip("\n") + f" v{i}\n"
+        text = "".join(lines)
+        texts.append(text)
+    return texts
+
+def test_segments_concatenate_back_to_the_packet():
+    segments = split_segments(PROJECT_PACKET_TEMPLATE)
+    assert "".join(text for _, text in segments) == PROJECT_PACKET_TEMPLATE
+    assert CONTENT_QUEUE in dict(segments)
+
+def test_every_version_checks_out_exactly_across_keyframes():
+    history, texts = PacketHistory(keyframe_every=4), _edits(20)
+    for i, text in enumerate(texts):
+        assert history.commit(ProjectPacket(text), f"edit {i}").number == i + 1
+    HISTORY_CACHE.clear()  # force decoding from keyframes and deltas
+    assert [history.checkout(i + 1) for i in range(len(texts))] == texts
+    assert any(blob.base for blob in history.blobs.values())
+    assert history.stats()["stored_bytes"] < history.stats()["raw_chars"]
+
+def test_rollback_round_trip():
+    history, texts = PacketHistory(), _edits(5)
+    for text in texts:
+        history.commit(text)
+    assert history.commit(texts[-1]) is None  # unchanged packets add no version
+    rolled_back = history.checkout(2)
+    version = history.commit(rolled_back, "回復至 v2")
+    assert version.number == 6 and history.checkout(6) == texts[1]
+    assert history.diff(2, 6) == []
+
+def test_diff_reports_changed_and_added_sections():
+    history = PacketHistory()
+    history.commit(PROJECT_PACKET_TEMPLATE)
+    added = "=== [NEW | EDITABLE] ===\nx\n=== [/NEW] ===\n"
+    history.commit(PROJECT_PACKET_TEMPLATE.replace("- 文章ID：A01", "- 文章ID：A09") + added)
+    diffs = {d.name: d for d in history.diff(1, 2)}
+    assert diffs[CONTENT_QUEUE].status == SECTION_CHANGED and "+- 文章ID：A09" in diffs[CONTENT_QUEUE].diff
+    assert diffs["NEW"].status == SECTION_ADDED
+    assert set(diffs) == {CONTENT_QUEUE, "NEW"}
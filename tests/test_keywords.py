@@ -0,0 +1,30 @@
+from keywords import canonical, cluster_keywords, dedupe_lines, reorder_key
+
+def _members(keywords):
+    return [c.members for c in cluster_keywords(keywords)]
+
+def test_digit_and_latin_variants_are_not_merged():
+    assert _members(["iphone 15", "iphone 16"]) == [["iphone 15"], ["iphone 16"]]
+    assert _members(["維他命c", "維他命d"]) == [["維他命c"], ["維他命d"]]
+    assert _members(["python 3.10", "python 3.11"]) == [["python 3.10"], ["python 3.11"]]
+
+def test_spacing_script_and_word_order_variants_merge():
+    assert _members(["益生菌 推薦", "益生菌推薦", "益生菌 推荐", "推薦 益生菌"]) == [
+        ["益生菌 推薦", "益生菌推薦", "益生菌 推荐", "推薦 益生菌"]
+    ]
+    assert _members(["iPhone 15 價格", "iphone15價格"]) == [["iPhone 15 價格", "iphone15價格"]]
+
+def test_keys():
+    assert canonical("維他命 C") == canonical("維他命c")
+    assert reorder_key("推薦 益生菌") == reorder_key("益生菌 推薦")
+    assert reorder_key("益生菌") == ""
+
+def test_representative_follows_weights():
+    (cluster,) = cluster_keywords(["益生菌推薦", "益生菌 推薦"], weights=[10, 500])
+    assert cluster.representative == "益生菌 推薦"
+
+def test_table_rows_dedupe_on_keyword_cell_only():
+    text = "| 益生菌 推薦 | 資訊型 | 高 |\n| 益生菌推薦 | 商業型 | 中 |\n| 魚油 推薦 | 資訊型 | 高 |"
+    compact, clusters = dedupe_lines(text)
+    assert len(clusters) == 1
+    assert compact.splitlines()[:2] == ["| 益生菌 推薦 | 資訊型 | 高 |", "| 魚油 推薦 | 資訊型 | 高 |"]
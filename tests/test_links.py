@@ -0,0 +1,62 @@
+import numpy as np
+
+from links import LinkIndex, tokens
+from prompts import PROJECT_PACKET_TEMPLATE
+
+CARD = "- 文章ID：{id}\n  - 標題：{title}\n  - Primary/Secondary/Supporting：{keywords}\n"
+SPAN = PROJECT_PACKET_TEMPLATE[
+    PROJECT_PACKET_TEMPLATE.index("- 文章ID：A01"):PROJECT_PACKET_TEMPLATE.index("=== [/CONTENT QUEUE]")
+]
+TOPICS = [
+    ("維他命C功效與副作用", "維他命C功效 / 維他命C副作用 / 保健"),
+    ("維他命C什麼時候吃", "維他命C 吃法 / 維他命C功效 / 保健"),
+    ("魚油推薦與挑選", "魚油推薦 / Omega-3 / 保健"),
+    ("魚油的副作用", "魚油 副作用 / Omega-3 / 保健"),
+    ("膝蓋痛怎麼辦", "膝蓋痛 / 關節保養 / 葡萄糖胺"),
+    ("葡萄糖胺有效嗎", "葡萄糖胺 / 關節保養 / 膝蓋痛"),
+    ("防曬乳怎麼選", "防曬乳推薦 / SPF / 防曬"),
+    ("SPF 與 PA 的差別", "SPF PA 差別 / 防曬乳推薦 / 防曬"),
+]
+
+def _packet(cards: list) -> str:
+    body = "".join(CARD.format(id=aid, title=title, keywords=kw) for aid, (title, kw) in cards)
+    return PROJECT_PACKET_TEMPLATE.replace(SPAN, body)
+
+CARDS = [(f"A{i + 1:02d}", topic) for i, topic in enumerate(TOPICS)]
+
+def test_tokens_use_cjk_bigrams_and_latin_words():
+    assert tokens("維他命C 功效 SPF50") == ["維他", "他命", "c", "功效", "spf50"]
+    assert tokens("") == []
+
+def test_related_cards_share_the_topic():
+    index = LinkIndex()
+    index.sync(_packet(CARDS))
+    for i in range(0, len(CARDS), 2):
+        first, second = CARDS[i][0], CARDS[i + 1][0]
+        assert index.related(first, k=1)[0][0] == second
+        assert index.related(second, k=1)[0][0] == first
+    assert index.related("Z99") == [] and index.related("A01", k=0) == []
+    assert "A02｜維他命C什麼時候吃" in index.format_related(index.related("A01", k=1))
+
+def test_related_all_matches_per_card_lookups():
+    index = LinkIndex()
+    index.sync(_packet(CARDS))
+    everything = index.related_all(k=3)
+    for aid, _ in CARDS:
+        assert [a for a, _ in everything[aid]] == [a for a, _ in index.related(aid, k=3)]
+
+def test_incremental_sync_keeps_similarity_consistent():
+    index = LinkIndex()
+    index.sync(_packet(CARDS))
+    assert index.sync(_packet(CARDS)) == set()
+    edited = list(CARDS)
+    edited[6] = ("A07", ("魚油怎麼吃", "魚油 吃法 / Omega-3 / 保健"))
+    assert index.sync(_packet(edited)) == {"A07"}
+    assert index.changes == 1
+    assert np.allclose(index.similarity, index.vectors @ index.vectors.T, atol=1e-5)
+    assert "A07" in [a for a, _ in index.related("A03", k=3)]
+    assert np.array_equal(index.df, np.count_nonzero(index.tf, axis=0))
+
+    assert index.sync(_packet(edited[:-1])) == {"A08"}
+    assert index.changes == 0 and index.ids == [aid for aid, _ in edited[:-1]]
+    assert index.related("A07", k=len(edited)) and "A08" not in index.rows
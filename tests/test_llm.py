@@ -0,0 +1,130 @@
+import asyncio
+import json
+
+from llm import AsyncLLMClient, LLMConfig, LLMError
+from responses import ResponseCache
+
+def _event(text: str) -> bytes:
+    return b"data: " + json.dumps({"choices": [{"delta": {"content": text}}]}).encode() + b"\n\n"
+
+async def _serve(bodies: list):
+    """One-shot HTTP server answering each request with the next SSE body (closes the connection)."""
+    async def handle(reader, writer):
+        while (await reader.readline()).strip():
+            pass
+        body = bodies.pop(0) if bodies else _event("ok") + b"data: [DONE]\n\n"
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nConnection: close\r\n"
+                     + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+        await writer.drain()
+        writer.close()
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+def _client(port: int, max_retries: int, cache: ResponseCache = None) -> AsyncLLMClient:
+    config = LLMConfig(base_url=f"http://127.0.0.1:{port}/v1", max_retries=max_retries, backoff=0.01)
+    return AsyncLLMClient(config, cache)
+
+def test_corrupt_event_fails_one_prompt_not_the_batch():
+    async def run():
+        server, port = await _serve([b"data: {not json\n\n", _event("fine") + b"data: [DONE]\n\n"])
+        async with server:
+            client = _client(port, max_retries=0)
+            try:
+                client.config.concurrency = 1  # keep the two bodies in request order
+                return await client.complete_many(["a", "b"])
+            finally:
+                client.close()
+    first, second = asyncio.run(run())
+    assert isinstance(first, LLMError) and "malformed stream event" in str(first)
+    assert second == "fine"
+
+def test_corrupt_event_before_output_is_retried():
+    async def run():
+        server, port = await _serve([b"data: [1, 2]\n\n"])
+        async with server:
+            client = _client(port, max_retries=1)
+            try:
+                return await client.complete("a"), client.retries
+            finally:
+                client.close()
+    assert asyncio.run(run()) == ("ok", 1)
+
+def test_malformed_status_line_is_an_llm_error():
+    async def run():
+        async def handle(reader, writer):
+            await reader.readline()
+            writer.write(b"garbage\r\n\r\n")
+            await writer.drain()
+            writer.close()
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        async with server:
+            client = _client(server.sockets[0].getsockname()[1], max_retries=0)
+            try:
+                return await client.complete_many(["a"])
+            finally:
+                client.close()
+    (result,) = asyncio.run(run())
+    assert isinstance(result, LLMError) and "malformed status line" in str(result)
+
+def _cached_run(bodies: list, tmp_path, max_retries: int = 0):
+    async def run():
+        server, port = await _serve(bodies)
+        async with server:
+            cache = ResponseCache(str(tmp_path / "responses.db"))
+            client = _client(port, max_retries, cache)
+            try:
+                (result,) = await client.complete_many(["a"])
+                return result, cache.get(client.cache_key("a", {}))
+            finally:
+                client.close()
+                cache.close()
+    return asyncio.run(run())
+
+def test_stream_without_done_is_an_error_and_not_cached(tmp_path):
+    result, cached = _cached_run([_event("half an ans")], tmp_path)
+    assert isinstance(result, LLMError) and result.retryable and "[DONE]" in str(result)
+    assert cached is None
+
+def test_empty_stream_without_done_is_retried(tmp_path):
+    result, cached = _cached_run([b""], tmp_path, max_retries=1)
+    assert result == cached == "ok"
+
+def test_length_cut_answer_is_returned_but_not_cached(tmp_path):
+    cut = b"data: " + json.dumps({"choices": [{"delta": {"content": "cut"}, "finish_reason": "length"}]}).encode()
+    result, cached = _cached_run([cut + b"\n\ndata: [DONE]\n\n"], tmp_path)
+    assert result == "cut" and cached is None
+
+def test_complete_answer_is_cached(tmp_path):
+    result, cached = _cached_run([_event("whole") + b"data: [DONE]\n\n"], tmp_path)
+    assert result == cached == "whole"
+
+def test_host_header_keeps_a_non_default_port():
+    def host(url):
+        return AsyncLLMClient(LLMConfig(base_url=url))._host_header
+    assert host("http://proxy.local:8080/v1") == "proxy.local:8080"
+    assert host("http://proxy.local/v1") == "proxy.local"
+    assert host("https://api.example.com:443/v1") == "api.example.com"
+    assert host("https://api.example.com:8443/v1") == "api.example.com:8443"
+    assert host("http://[::1]:8080/v1") == "[::1]:8080"
+
+def test_request_sends_host_with_port():
+    async def run():
+        seen = []
+        async def handle(reader, writer):
+            while (line := (await reader.readline()).strip()):
+                seen.append(line.decode())
+            body = _event("ok") + b"data: [DONE]\n\n"
+            writer.write(b"HTTP/1.1 200 OK\r\nConnection: close\r\n" + f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+            writer.close()
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            client = _client(port, max_retries=0)
+            try:
+                await client.complete("a")
+            finally:
+                client.close()
+        return port, seen
+    port, seen = asyncio.run(run())
+    assert f"Host: 127.0.0.1:{port}" in seen
@@ -0,0 +1,66 @@
+from overlap import (
+    ROLE_PRIMARY,
+    ROLE_SECONDARY,
+    ROLE_SUPPORTING,
+    SEVERITY_HIGH,
+    SEVERITY_LOW,
+    SEVERITY_MEDIUM,
+    KeywordIndex,
+    format_overlaps,
+    parse_card_keywords,
+)
+from prompts import PROJECT_PACKET_TEMPLATE
+
+CARD = "- 文章ID：{id}\n  - 標題：title {id}\n  - Primary/Secondary/Supporting：{keywords}\n"
+SPAN = PROJECT_PACKET_TEMPLATE[
+    PROJECT_PACKET_TEMPLATE.index("- 文章ID：A01"):PROJECT_PACKET_TEMPLATE.index("=== [/CONTENT QUEUE]")
+]
+
+def _packet(cards: dict) -> str:
+    return PROJECT_PACKET_TEMPLATE.replace(SPAN, "".join(CARD.format(id=aid, keywords=kw) for aid, kw in cards.items()))
+
+CARDS = {
+    "A01": "維他命C功效 / 維他命C 副作用、美白 / 保健",
+    "A02": "維他命c功效 / 膠原蛋白 / 保健",
+    "A03": "美白 / 防曬 / 無",
+    "A04": "魚油推薦 / - / -",
+}
+
+def test_parse_plain_and_labelled_values():
+    assert parse_card_keywords("p / s1、s2 / 無") == [
+        ("p", ROLE_PRIMARY), ("s1", ROLE_SECONDARY), ("s2", ROLE_SECONDARY),
+    ]
+    assert parse_card_keywords("Primary：p；Secondary：s1, s2；Supporting Keywords：t") == [
+        ("p", ROLE_PRIMARY), ("s1", ROLE_SECONDARY), ("s2", ROLE_SECONDARY), ("t", ROLE_SUPPORTING),
+    ]
+    assert parse_card_keywords("") == []
+
+def test_conflicts_are_ranked_by_severity():
+    index = KeywordIndex()
+    assert index.sync(_packet(CARDS)) == set(CARDS)
+    conflicts = {o.keyword: o for o in index.conflicts()}
+    assert conflicts["維他命C功效"].severity == SEVERITY_HIGH
+    assert conflicts["美白"].severity == SEVERITY_MEDIUM
+    assert conflicts["保健"].severity == SEVERITY_LOW
+    assert [o.severity for o in index.conflicts()] == [SEVERITY_HIGH, SEVERITY_MEDIUM, SEVERITY_LOW]
+    assert index.lookup("維他命C功效") == {"A01": ROLE_PRIMARY, "A02": ROLE_PRIMARY}
+    assert [o.keyword for o in index.overlaps("A03")] == ["美白"]
+    assert index.overlaps("A04") == [] and index.overlaps("Z99") == []
+    assert "A03（Primary）、A01（Secondary）" in format_overlaps([conflicts["美白"]])
+
+def test_sync_reindexes_only_changed_cards():
+    index = KeywordIndex()
+    index.sync(_packet(CARDS))
+    assert index.sync(_packet(CARDS)) == set()
+    edited = dict(CARDS, A03="防曬 / 美黑 / 無")
+    assert index.sync(_packet(edited)) == {"A03"}
+    assert "美白" not in {o.keyword for o in index.conflicts()}
+    removed = {aid: kw for aid, kw in edited.items() if aid != "A02"}
+    assert index.sync(_packet(removed)) == {"A02"}
+    assert index.conflicts() == []
+
+def test_check_finds_cards_targeting_new_keywords():
+    index = KeywordIndex()
+    index.sync(_packet(CARDS))
+    found = index.check(["魚油推薦", "葉黃素"])
+    assert [(o.keyword, o.cards) for o in found] == [("魚油推薦", [("A04", ROLE_PRIMARY)])]
@@ -0,0 +1,45 @@
+import random
+
+from packet import CONTENT_QUEUE, ProjectPacket, card_fields
+from prompts import PROJECT_PACKET_TEMPLATE
+
+CARD = "- 文章ID：{id}\n  - 標題：title {id}\n  - 字數：1500\n"
+BASE = PROJECT_PACKET_TEMPLATE.replace(
+    PROJECT_PACKET_TEMPLATE[PROJECT_PACKET_TEMPLATE.index("- 文章ID：A01"):PROJECT_PACKET_TEMPLATE.index("=== [/CONTENT QUEUE]")],
+    "".join(CARD.format(id=f"A{i:02d}") for i in range(1, 8)),
+)
+
+def _snapshot(packet):
+    return (
+        {name: (s.start, s.body_start, s.body_end, s.end) for name, s in packet.sections.items()},
+        [(c.article_id, c.start, c.end) for c in packet.card_list],
+        packet.cards_start,
+    )
+
+def test_sections_and_cards_are_indexed():
+    packet = ProjectPacket(BASE)
+    assert CONTENT_QUEUE in packet.sections and "VOICE CONTEXT" in packet.sections
+    assert packet.section_block("PROJECT LOG").startswith("=== [PROJECT LOG | EDITABLE] ===")
+    assert packet.card_ids() == [f"A{i:02d}" for i in range(1, 8)]
+    assert card_fields(packet.card("A03")) == {"標題": "title A03", "字數": "1500"}
+    assert packet.card("Z99") is None and packet.section("NOPE") is None
+
+def test_edit_inside_a_section_touches_only_that_section():
+    packet = ProjectPacket(BASE)
+    digest = packet.digest
+    edited = BASE.replace("title A02", "新的標題 A02")
+    assert packet.update(edited) == {CONTENT_QUEUE}
+    assert card_fields(packet.card("A02"))["標題"] == "新的標題 A02"
+    assert packet.digest != digest and packet.update(edited) == set()
+
+def test_incremental_updates_match_a_full_parse():
+    pieces = ["x", "\n", "- 文章ID：B9\n", "  - 標題：z\n", "", "=== [", "[Article Cards]\n", "文章ID：", "- "]
+    rng = random.Random(7)
+    for _ in range(300):
+        packet, text = ProjectPacket(BASE), BASE
+        for _ in range(6):
+            a = rng.randrange(len(text) + 1)
+            b = min(len(text), a + rng.choice([0, 0, 1, 2, 5, 20]))
+            text = text[:a] + rng.choice(pieces) + text[b:]
+            packet.update(text)
+            assert _snapshot(packet) == _snapshot(ProjectPacket(text))
@@ -0,0 +1,16 @@
+from qa import split_draft
+
+def test_heading_mentioning_schema_stays_in_the_body():
+    body, seo = split_draft("# 標題\n\n## Schema 標記對健康網站的影響\n\n內容\n\nMeta Title：健康網站\n")
+    assert "## Schema 標記對健康網站的影響" in body
+    assert seo == "Meta Title：健康網站\n"
+
+def test_label_lines_start_the_seo_part():
+    assert split_draft("正文\n\n2) Meta Title（<60字元）\n「x」\n")[1].startswith("2) Meta Title")
+    assert split_draft("正文\n\n**Schema**\n- FAQPage\n")[1].startswith("**Schema**")
+    assert split_draft("正文\nMeta Title/Meta Description\n")[1].startswith("Meta Title/")
+
+def test_json_ld_fence_starts_the_seo_part():
+    text = '正文\n\n```json\n{"@context": "https://schema.org"}\n```\n'
+    assert split_draft(text)[1].startswith("```json")
+    assert split_draft('正文\n\n```json\n{"a": 1}\n```\n')[1] == ""
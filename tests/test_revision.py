@@ -0,0 +1,20 @@
+import time
+
+from revision import CHANGE_REPLACE, diff_revision, opcodes
+
+def test_full_rewrite_is_one_replacement_and_fast():
+    v1 = "\n".join(f"甲段{i}的內容。" for i in range(3000))
+    v2 = "\n".join(f"乙段{i}的內容。" for i in range(3000))
+    start = time.perf_counter()
+    diff = diff_revision(v1, v2)
+    assert time.perf_counter() - start < 1.0
+    assert [c.tag for c in diff.changes] == [CHANGE_REPLACE]
+    assert diff.changed_ratio == 1.0
+
+def test_small_edits_are_still_aligned_exactly():
+    base = [f"段{i}的內容，這裡有一些文字。" for i in range(300)]
+    edited = list(base)
+    edited[10] = "改寫的段落。"
+    diff = diff_revision("\n".join(base), "\n".join(edited))
+    assert [(c.tag, c.old_index, c.new_index) for c in diff.changes] == [(CHANGE_REPLACE, (10,), (10,))]
+    assert opcodes(list("abcxdefg"), list("abcydefg"))[1] == ("replace", 3, 4, 3, 4)
@@ -0,0 +1,15 @@
+from samples import sample_corpus
+
+def test_oversize_paragraph_is_trimmed_not_dropped():
+    (name, text), = sample_corpus([("a", "字" * 15000)], 12000)
+    assert name == "a" and len(text) == 12000
+
+def test_trim_stops_at_a_sentence_end():
+    (_, text), = sample_corpus([("a", "這是一句話。" * 3000)], 1000)
+    assert text.endswith("。") and len(text) <= 1000
+
+def test_unused_share_goes_to_longer_documents():
+    short = "\n\n".join(f"第{i}段的內容很多很多很多很多很多很多字。" for i in range(50))
+    out = dict(sample_corpus([("long", "這是一句話。" * 2500), ("short", short)], 12000))
+    assert list(out) == ["long", "short"]
+    assert len(out["long"]) > 6000
@@ -0,0 +1,48 @@
+import os
+
+from serp import KIND_PAGE, KIND_SERP, assign_keywords, capture_files, competitor_table, parse_capture
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "serp")
+KEYWORDS = ["B群 什麼時候吃", "B群 空腹", "上班族 疲勞 補充品"]
+
+def _parse(name):
+    with open(os.path.join(FIXTURES, name), "rb") as f:
+        return parse_capture(f, name)
+
+def test_parse_serp_capture():
+    capture = _parse(os.path.join("B群 什麼時候吃", "serp.html"))
+    assert capture.kind == KIND_SERP and capture.query == "B群 什麼時候吃"
+    # Google redirect links are unwrapped; links back into Google are not results.
+    assert capture.results == [
+        ("B群什麼時候吃最好？營養師解析", "https://www.health.com/b-group"),
+        ("B群空腹吃可以嗎｜完整指南", "https://vitamin.tw/b"),
+    ]
+
+def test_parse_competitor_page():
+    capture = _parse("competitor.html")
+    assert capture.kind == KIND_PAGE and capture.domain == "health.com"
+    assert capture.description == "B群建議早餐後吃"
+    assert capture.h(2) == ["B群的功效", "B群什麼時候吃最好？", "常見問題"]
+    assert "B群可以空腹吃嗎？" in capture.questions
+    # Navigation, footer, scripts and styles are not counted as article text.
+    assert capture.length == 80
+
+def test_parse_text_capture():
+    capture = _parse("capture.md")
+    assert capture.kind == KIND_PAGE and capture.url == "https://vitamin.tw/b"
+    assert capture.headings == [(1, "B群空腹吃可以嗎"), (2, "空腹吃的風險"), (2, "最佳時間")]
+    assert capture.questions == ["Q：B群可以跟咖啡一起吃嗎？"]
+
+def test_assign_keywords_uses_directory_hint_then_titles():
+    grouped = assign_keywords(capture_files([FIXTURES], workers=1), KEYWORDS)
+    assert list(grouped) == ["B群 什麼時候吃", "B群 空腹"]
+    assert sorted(c.kind for c in grouped["B群 什麼時候吃"]) == [KIND_PAGE, KIND_SERP]
+    assert [os.path.basename(c.name) for c in grouped["B群 空腹"]] == ["capture.md"]
+
+def test_competitor_table():
+    table = competitor_table(capture_files([FIXTURES], workers=1), KEYWORDS)
+    assert table.startswith("### B群 什麼時候吃（競品 1 頁、SERP 1 份）")
+    assert "| health.com | B群什麼時候吃？早上飯後最好 ／ 健康網 | 80 | 3 |" in table
+    assert "### B群 空腹（競品 1 頁）" in table
+    assert "上班族" not in table
+    assert competitor_table([], KEYWORDS) == ""
@@ -0,0 +1,56 @@
+import pytest
+
+from cache import HISTORY_CACHE
+from prompts import PROJECT_PACKET_TEMPLATE
+from store import DOC_PACKET, DOC_VOICE_BANK, ProjectStore
+
+def test_documents_and_inputs_survive_reopen(tmp_path):
+    path = str(tmp_path / "projects.db")
+    store = ProjectStore(path)
+    pid = store.ensure_project(" 客戶A ")
+    assert pid == "客戶A"
+    assert store.document(pid, DOC_PACKET) is None
+    assert store.save_document(pid, DOC_PACKET, PROJECT_PACKET_TEMPLATE)
+    assert not store.save_document(pid, DOC_PACKET, PROJECT_PACKET_TEMPLATE)
+    store.save_document(pid, DOC_VOICE_BANK, "語氣：親切")
+    assert store.save_inputs(pid, {"keyword": "維他命C", "count": 3}) == 2
+    assert store.save_inputs(pid, {"keyword": "維他命C", "count": 4}) == 1
+    store.close()
+
+    reopened = ProjectStore(path)
+    assert reopened.projects() == ["客戶A"]
+    assert reopened.document(pid, DOC_PACKET) == PROJECT_PACKET_TEMPLATE
+    assert reopened.document(pid, DOC_VOICE_BANK) == "語氣：親切"
+    assert reopened.inputs(pid) == {"keyword": "維他命C", "count": 4}
+    reopened.close()
+
+def test_ensure_project_rejects_empty_id(tmp_path):
+    store = ProjectStore(str(tmp_path / "projects.db"))
+    with pytest.raises(ValueError):
+        store.ensure_project("  ")
+    store.close()
+
+def test_history_saves_only_new_versions_and_reloads(tmp_path):
+    path = str(tmp_path / "projects.db")
+    store = ProjectStore(path)
+    pid = store.ensure_project("p1")
+    texts = [PROJECT_PACKET_TEMPLATE + f"\n- 第 {i} 次修改\n" for i in range(5)]
+    history = store.history(pid)
+    for text in texts[:3]:
+        history.commit(text)
+    assert store.save_history(pid) == 3
+    assert store.save_history(pid) == 0
+    for text in texts[3:]:
+        history.commit(text, note="後續")
+    assert store.save_history(pid) == 2
+    store.close()
+
+    HISTORY_CACHE.clear()
+    reopened = ProjectStore(path)
+    loaded = reopened.history(pid)
+    assert [v.number for v in loaded.versions] == [v.number for v in history.versions]
+    assert [v.note for v in loaded.versions] == [v.note for v in history.versions]
+    for version, text in zip(loaded.versions, texts):
+        assert loaded.checkout(version.number) == text
+    assert reopened.history("other").versions == []
+    reopened.close()
@@ -0,0 +1,33 @@
+from prompts import PROJECT_PACKET_TEMPLATE
+from titles import TitleIndex, backlog_titles, compact_titles, near_duplicate_groups, replace_backlog
+
+def test_short_titles_with_a_different_subject_are_kept_apart():
+    assert near_duplicate_groups(["維他命C功效", "維他命D功效"]) == []
+    assert near_duplicate_groups(["咖啡豆推薦", "咖啡機推薦"]) == []
+
+def test_near_duplicates_are_grouped_under_the_first_title():
+    titles = [
+        "2024 咖啡豆挑選指南：新手必看",
+        "手沖咖啡入門：器材與步驟",
+        "2024咖啡豆挑選指南 - 新手必看！",
+        "2025 咖啡豆挑選指南：新手必看",
+        "拿鐵拉花教學",
+    ]
+    groups = near_duplicate_groups(titles)
+    assert groups == [[0, 2, 3]]
+    assert compact_titles(titles, groups) == titles[:2] + titles[4:]
+
+def test_index_sync_follows_the_backlog():
+    index = TitleIndex()
+    index.sync(["維他命C功效", "拿鐵拉花教學"])
+    index.sync(["拿鐵拉花教學"])
+    assert len(index) == 1 and "維他命C功效" not in index
+    assert index.neighbours("拿鐵 拉花教學！") == [("拿鐵拉花教學", 0)]
+
+def test_backlog_round_trip():
+    packet = PROJECT_PACKET_TEMPLATE.replace("- （每行一個標題）\n", "- 拿鐵拉花教學\n- 拿鐵拉花教學！\n")
+    assert backlog_titles(PROJECT_PACKET_TEMPLATE) == []
+    assert backlog_titles(packet) == ["拿鐵拉花教學", "拿鐵拉花教學！"]
+    compact = replace_backlog(packet, ["拿鐵拉花教學"])
+    assert backlog_titles(compact) == ["拿鐵拉花教學"]
+    assert replace_backlog(PROJECT_PACKET_TEMPLATE, []) == PROJECT_PACKET_TEMPLATE
@@ -0,0 +1,51 @@
+from cache import TOKEN_CACHE
+from prompts import (
+    PACKET_SCOPE_FULL,
+    PACKET_SCOPE_STEP,
+    PROMPT_LAYOUT_PREFIX,
+    PROJECT_PACKET_TEMPLATE,
+    no_codeblock_main_output_rules,
+    render_step,
+    state_output_rules,
+    voice_priority_rules,
+)
+from tokens import estimate_tokens, render_within_budget, token_report, truncate_to_tokens
+from voice import compact_voice_bank, voice_context_block
+
+def test_estimate_counts_cjk_latin_and_digits():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("咖啡豆") == 4
+    assert estimate_tokens("coffee") == 2
+    assert estimate_tokens("2024") == 2
+
+def test_truncate_fits_and_does_not_fill_the_cache():
+    # Dense CJK up front, cheap Latin at the end: the proportional cut needs several probes.
+    text = "咖啡豆的挑選其實不難。" * 400 + "a" * 20000
+    TOKEN_CACHE.clear()
+    cut = truncate_to_tokens(text, 500)
+    assert "已截斷" in cut and cut.startswith("咖啡豆")
+    assert len(TOKEN_CACHE) == 1  # the input only; no probe substrings
+    assert estimate_tokens(cut) <= 500
+
+def test_render_within_budget_matches_render_step():
+    for scope in (PACKET_SCOPE_FULL, PACKET_SCOPE_STEP):
+        for layout in ("step", PROMPT_LAYOUT_PREFIX):
+            expected = render_step(3, PROJECT_PACKET_TEMPLATE, "", packet_scope=scope, layout=layout, topics="益生菌")
+            prompt, report = render_within_budget(
+                3, PROJECT_PACKET_TEMPLATE, "", packet_scope=scope, layout=layout, use_cache=False, topics="益生菌"
+            )
+            assert prompt == expected and report["trimmed"] == []
+
+def test_budget_shrinks_the_largest_input_first():
+    topics = "益生菌推薦、魚油功效、維他命C。" * 500
+    prompt, report = render_within_budget(3, PROJECT_PACKET_TEMPLATE, "", budget=3000, use_cache=False, topics=topics)
+    assert report["trimmed"] == ["topics"]
+    assert report["total"] <= 3000 and "已截斷" in prompt
+
+def test_compact_voice_rules_count_as_rules():
+    spec, _ = compact_voice_bank("- 結論要留白\n- 每段三行\n", voice_context_block(PROJECT_PACKET_TEMPLATE))
+    prompt = render_step(2, PROJECT_PACKET_TEMPLATE, spec)
+    blocks = (no_codeblock_main_output_rules(), voice_priority_rules(spec), state_output_rules(PACKET_SCOPE_FULL))
+    assert all(block in prompt for block in blocks)
+    report = token_report(prompt, PROJECT_PACKET_TEMPLATE, spec, {})
+    assert report["rules"] == sum(estimate_tokens(block) for block in blocks)
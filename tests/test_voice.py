@@ -0,0 +1,30 @@
+from prompts import PROJECT_PACKET_TEMPLATE, voice_priority_rules
+from voice import compact_voice_bank, dedupe_rules, voice_context_block
+
+def test_opposite_rules_are_kept_and_reported():
+    for pair in (
+        ["結論要留白", "結論不要留白"],
+        ["可以用反問句收尾", "不可以用反問句收尾"],
+        ["多用數據", "少用數據"],
+        ["每段不超過三行", "每段不超過五行"],
+    ):
+        kept, opposed = dedupe_rules(pair)
+        assert kept == pair
+        assert [(a, b) for a, b, _ in opposed] == [tuple(pair)]
+
+def test_near_duplicates_still_merge():
+    assert dedupe_rules(["段落不要超過四行", "段落不要超過4行"]) == (["段落不要超過四行"], [])
+    assert dedupe_rules(["不使用驚嘆號", "不用驚嘆號"]) == (["不使用驚嘆號"], [])
+
+def test_compact_spec_lists_opposed_rules_and_skips_llm_merge():
+    spec, merge = compact_voice_bank("- 結論要留白\n- 結論不要留白\n", "")
+    assert len(merge.opposed) == 1 and "結論不要留白" in spec
+    assert "先輸出「衝突點" not in voice_priority_rules(spec)
+    assert "先輸出「衝突點" in voice_priority_rules("- 結論要留白")
+
+def test_bank_wins_an_opposed_pair_against_the_packet():
+    packet = PROJECT_PACKET_TEMPLATE.replace("- do_not：絕對禁止事項", "- do_not：結論不要留白")
+    spec, merge = compact_voice_bank("- do_not：結論要留白\n", voice_context_block(packet))
+    assert merge.rules["do_not"] == ["結論要留白"]
+    assert [(c.bank, c.context) for c in merge.conflicts] == [("結論要留白", "結論不要留白")]
+    assert merge.opposed == [] and "相近但相反" not in spec
@@ -0,0 +1,71 @@
+from packet import ARTICLE_CARDS_HEADER, CONTENT_QUEUE, ProjectPacket, card_fields
+from prompts import PROJECT_PACKET_TEMPLATE
+from writeback import check_packet_block, extract_packet_block, merge_packet
+
+CARD = "- 文章ID：{id}\n  - 標題：title {id}\n  - 字數：1500\n"
+BASE = PROJECT_PACKET_TEMPLATE.replace(
+    PROJECT_PACKET_TEMPLATE[PROJECT_PACKET_TEMPLATE.index("- 文章ID：A01"):PROJECT_PACKET_TEMPLATE.index("=== [/CONTENT QUEUE]")],
+    "".join(CARD.format(id=f"A{i:02d}") for i in range(1, 4)),
+)
+
+def _section(text: str, name: str) -> str:
+    return ProjectPacket(text).section_block(name)
+
+def _edited_section(name: str, old: str, new: str) -> str:
+    block = _section(BASE, name)
+    assert old in block
+    return block.replace(old, new, 1)
+
+def test_section_replacement_leaves_other_sections_untouched():
+    strategy = _section(BASE, "STRATEGY LOG")
+    first_line = strategy.splitlines()[1]
+    update = strategy.replace(first_line, first_line + "（已更新）", 1)
+    text, changed = merge_packet(BASE, update)
+    assert changed == ["STRATEGY LOG"]
+    assert _section(text, "STRATEGY LOG").rstrip("\n") == update.rstrip("\n")
+    for name in ProjectPacket(BASE).sections:
+        if name != "STRATEGY LOG":
+            assert _section(text, name) == _section(BASE, name)
+    assert merge_packet(text, update) == (text, [])
+
+def test_card_merge_replaces_and_adds_cards_only():
+    update = (
+        "=== [CONTENT QUEUE | EDITABLE] ===\n" + ARTICLE_CARDS_HEADER + "\n"
+        + CARD.format(id="A02").replace("title A02", "新標題 A02")
+        + CARD.format(id="A09")
+        + "=== [/CONTENT QUEUE] ===\n"
+    )
+    text, changed = merge_packet(BASE, update, card_merge=True)
+    assert changed == [f"{CONTENT_QUEUE}/A02", f"{CONTENT_QUEUE}/A09"]
+    packet = ProjectPacket(text)
+    assert packet.card_ids() == ["A01", "A02", "A03", "A09"]
+    assert card_fields(packet.card("A02"))["標題"] == "新標題 A02"
+    assert card_fields(packet.card("A01"))["標題"] == "title A01"
+
+    replaced, _ = merge_packet(BASE, update)
+    assert ProjectPacket(replaced).card_ids() == ["A02", "A09"]
+
+def test_unknown_section_is_appended():
+    extra = "=== [EXTRA NOTES | EDITABLE] ===\n- x\n=== [/EXTRA NOTES] ===\n"
+    text, changed = merge_packet(BASE, extra)
+    assert changed == ["EXTRA NOTES"]
+    assert text.startswith(BASE.rstrip("\n")) and text.endswith(extra)
+    assert "EXTRA NOTES" in check_packet_block(extra, partial=True).warnings[0]
+
+def test_scanner_keeps_last_packet_block_across_chunks():
+    block = _edited_section("PROJECT LOG", "\n", "\n- 新增\n")
+    response = "前言\n```text\n沒有區塊\n```\n```markdown\n" + block + "```\n結語"
+    chunks = [response[i:i + 7] for i in range(0, len(response), 7)]
+    found, truncated = extract_packet_block(chunks)
+    assert found == block and not truncated
+    assert check_packet_block(found, partial=True).ok
+    assert not check_packet_block(found).ok  # a full packet needs every section
+
+def test_truncated_block_is_reported():
+    block = _section(BASE, "PROJECT LOG")
+    cut = block[: block.index("=== [/")]
+    found, truncated = extract_packet_block("```\n" + cut)
+    assert truncated
+    check = check_packet_block(found, truncated, partial=True)
+    assert not check.ok and any("PROJECT LOG" in e for e in check.errors)
+    assert not check_packet_block(None).ok
@@ -0,0 +1,210 @@
+import hashlib
+import re
+from functools import lru_cache
+
+import numpy as np
+
+from keywords import canonical
+from links import tokens
+from packet import ARTICLE_CARDS_HEADER, CONTENT_QUEUE, ProjectPacket
+
+# ==========================================
+# Near-duplicate backlog titles (SimHash)
+# ==========================================
+# Every title gets a 64-bit SimHash over its tokens (CJK bigrams, Latin
+# words; punctuation and spacing never count). The fingerprint is cut into
+# BANDS bands; titles sharing any band value are candidates and are confirmed
+# by Hamming distance. A lookup touches only the titles in its own buckets,
+# not the whole backlog, so it stays cheap at portfolio scale.
+BITS = 64
+BANDS = 8
+BAND_BITS = BITS // BANDS
+# Titles differing by one word or a year land around 6-10 bits apart.
+MAX_DISTANCE = 10
+# In a short title one changed token is a different subject ("維他命C功效" vs
+# "維他命D功效" are 10 bits apart), so the allowed distance shrinks in
+# proportion below this many tokens (taken from the shorter title).
+FULL_DISTANCE_TOKENS = 6
+
+BACKLOG_HEADER_RE = re.compile(r"^\[Backlog Titles[^\]\n]*\][ \t]*$", re.M)
+BULLET_RE = re.compile(r"^[ \t]*(?:[-*•]|\d+[.)、])[ \t]*")
+PLACEHOLDER_TITLE = "（每行一個標題）"
+
+@lru_cache(maxsize=200_000)
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+_BIT_SHIFTS = np.arange(BITS, dtype=np.uint64)
+
+def _fingerprints(titles: list) -> tuple:
+    """``(simhashes, token counts)`` of the titles, tokenizing each title once."""
+    hashes, owners, sizes = [], [], []
+    for i, title in enumerate(titles):
+        distinct = set(tokens(title))
+        sizes.append(len(distinct))
+        for token in distinct:
+            hashes.append(_token_hash(token))
+            owners.append(i)
+    votes = np.zeros((len(titles), BITS), np.int32)
+    if hashes:
+        bits = (np.array(hashes, np.uint64)[:, None] >> _BIT_SHIFTS) & np.uint64(1)
+        np.add.at(votes, np.array(owners), bits.astype(np.int32) * 2 - 1)
+    weights = (votes > 0).astype(np.uint64) << _BIT_SHIFTS
+    return ([int(v) for v in np.bitwise_or.reduce(weights, axis=1)] if len(titles) else []), sizes
+
+def simhashes(titles: list) -> list:
+    """64-bit SimHash of every title, computed in one NumPy pass over all tokens."""
+    return _fingerprints(titles)[0]
+
+def simhash(title: str) -> int:
+    return simhashes([title])[0]
+
+def allowed_distance(size: int, max_distance: int = MAX_DISTANCE) -> int:
+    """``max_distance`` for titles of FULL_DISTANCE_TOKENS tokens or more, proportionally less below."""
+    return max_distance * min(size, FULL_DISTANCE_TOKENS) // FULL_DISTANCE_TOKENS
+
+def _bands(fingerprint: int) -> list:
+    mask = (1 << BAND_BITS) - 1
+    return [(fingerprint >> (band * BAND_BITS)) & mask for band in range(BANDS)]
+
+class TitleIndex:
+    def __init__(self, max_distance: int = MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.fingerprints = {}  # canonical title -> fingerprint
+        self.sizes = {}         # canonical title -> token count
+        self.titles = {}        # canonical title -> title as first written
+        self.buckets = [{} for _ in range(BANDS)]  # band value -> set of canonical titles
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def __contains__(self, title: str):
+        return canonical(title) in self.fingerprints
+
+    def add(self, title: str, fingerprint: int = None, size: int = None):
+        key = canonical(title)
+        if not key or key in self.fingerprints:
+            return
+        if fingerprint is None:
+            (fingerprint,), (size,) = _fingerprints([title])
+        self.fingerprints[key] = fingerprint
+        self.sizes[key] = size
+        self.titles[key] = title.strip()
+        for band, value in enumerate(_bands(fingerprint)):
+            self.buckets[band].setdefault(value, set()).add(key)
+
+    def remove(self, title: str):
+        key = canonical(title)
+        fingerprint = self.fingerprints.pop(key, None)
+        if fingerprint is None:
+            return
+        self.titles.pop(key, None)
+        self.sizes.pop(key, None)
+        for band, value in enumerate(_bands(fingerprint)):
+            bucket = self.buckets[band].get(value)
+            bucket.discard(key)
+            if not bucket:
+                del self.buckets[band][value]
+
+    def sync(self, titles: list):
+        """Index exactly ``titles``: new ones are added, missing ones removed."""
+        keys = {canonical(t): t for t in titles}
+        for key in [k for k in self.fingerprints if k not in keys]:
+            self.remove(self.titles[key])
+        new = [title for key, title in keys.items() if key and key not in self.fingerprints]
+        for title, fingerprint, size in zip(new, *_fingerprints(new)):
+            self.add(title, fingerprint, size)
+
+    def neighbours(self, title: str) -> list:
+        """``[(indexed title, distance), ...]`` near ``title``, closest first; exact repeats are distance 0."""
+        key = canonical(title)
+        if not key:
+            return []
+        if key in self.fingerprints:
+            fingerprint, size = self.fingerprints[key], self.sizes[key]
+        else:
+            (fingerprint,), (size,) = _fingerprints([title])
+        candidates = set()
+        for band, value in enumerate(_bands(fingerprint)):
+            candidates |= self.buckets[band].get(value, set())
+        candidates.discard(key)
+        found = []
+        for other in candidates:
+            distance = (fingerprint ^ self.fingerprints[other]).bit_count()
+            if distance <= allowed_distance(min(size, self.sizes[other]), self.max_distance):
+                found.append((self.titles[other], distance))
+        found.sort(key=lambda item: item[1])
+        if key in self.fingerprints and self.titles[key] != title.strip():
+            found.insert(0, (self.titles[key], 0))
+        return found
+
+def near_duplicate_groups(titles: list, index: TitleIndex = None) -> list:
+    """Groups of positions in ``titles`` that are near-duplicates, each in list order.
+
+    A title joins the group of the first earlier title it is close to, so
+    every group is led by the title that was written first. Exact repeats
+    (after normalization) count as duplicates too. Only groups with more than
+    one title are returned.
+    """
+    if index is None:
+        index = TitleIndex()
+    index.sync(titles)
+    group_of = {}  # canonical title -> group number
+    groups = []
+    for i, title in enumerate(titles):
+        key = canonical(title)
+        if not key:
+            continue
+        g = group_of.get(key)
+        if g is None:
+            g = next((group_of[k] for k in (canonical(o) for o, _ in index.neighbours(title)) if k in group_of), None)
+        if g is None:
+            g = len(groups)
+            groups.append([])
+        group_of.setdefault(key, g)
+        groups[g].append(i)
+    return [g for g in groups if len(g) > 1]
+
+def compact_titles(titles: list, groups: list) -> list:
+    """``titles`` with only the first title of each near-duplicate group kept."""
+    dropped = {i for g in groups for i in g[1:]}
+    return [t for i, t in enumerate(titles) if i not in dropped]
+
+# ------------------------------------------
+# Backlog inside the packet
+# ------------------------------------------
+def _backlog_span(index: ProjectPacket):
+    queue = index.sections.get(CONTENT_QUEUE)
+    if queue is None:
+        return None
+    m = BACKLOG_HEADER_RE.search(index.text, queue.body_start, queue.body_end)
+    if m is None:
+        return None
+    start = index.text.find("\n", m.end(), queue.body_end)
+    start = queue.body_end if start < 0 else start + 1
+    end = index.text.find(ARTICLE_CARDS_HEADER, start, queue.body_end)
+    return start, (queue.body_end if end < 0 else end)
+
+def backlog_titles(packet) -> list:
+    index = packet if isinstance(packet, ProjectPacket) else ProjectPacket(packet or "")
+    span = _backlog_span(index)
+    if span is None:
+        return []
+    titles = []
+    for line in index.text[span[0]:span[1]].splitlines():
+        title = BULLET_RE.sub("", line).strip()
+        if title and title != PLACEHOLDER_TITLE:
+            titles.append(title)
+    return titles
+
+def replace_backlog(packet, titles: list) -> str:
+    """Packet text with the backlog lines replaced by ``titles``; unchanged if there is no backlog."""
+    index = packet if isinstance(packet, ProjectPacket) else ProjectPacket(packet or "")
+    span = _backlog_span(index)
+    if span is None:
+        return index.text
+    lines = "".join(f"- {t}\n" for t in titles) or f"- {PLACEHOLDER_TITLE}\n"
+    # Keep the blank line before [Article Cards], if there was one.
+    gap = index.text[span[0]:span[1]]
+    trailing = gap[len(gap.rstrip("\n")) + 1:] if gap.endswith("\n\n") else ""
+    return index.text[:span[0]] + lines + trailing + index.text[span[1]:]
@@ -0,0 +1,238 @@
+import re
+
+from cache import PROMPT_CACHE, TOKEN_CACHE, content_hash
+from prompts import (
+    PACKET_SCOPE_FULL,
+    PACKET_SCOPE_STEP,
+    PROMPT_LAYOUT_STEP,
+    no_codeblock_main_output_rules,
+    packet_digest,
+    render_resolved_step,
+    resolve_packet,
+    state_output_rules,
+    state_reference_block,
+    voice_bank_block,
+    voice_priority_rules,
+)
+
+# ==========================================
+# Offline token estimation
+# ==========================================
+# A tokenizer-free approximation of BPE tokenizers on mixed CJK/Latin text:
+#   - CJK ideographs / kana / hangul / full-width punctuation: ~1.2 tokens per char
+#   - Latin words: ~1 token per 4 letters (at least 1 per word)
+#   - digit runs: ~1 token per 3 digits
+#   - any other non-space symbol: 1 token
+#   - each line break: 1 token
+# Good enough to keep prompts under a context budget without network access.
+CJK_TOKENS_PER_CHAR = 1.2
+
+CJK_RANGES = "　-ヿ㐀-䶿一-鿿가-힯豈-﫿＀-￯"
+LATIN_LETTERS = "A-Za-zÀ-ɏ"
+CJK_RE = re.compile(f"[{CJK_RANGES}]")
+WORD_RE = re.compile(f"[{LATIN_LETTERS}]+")
+DIGITS_RE = re.compile(r"[0-9]+")
+SYMBOL_RE = re.compile(f"[^\\s0-9{LATIN_LETTERS}{CJK_RANGES}]")
+
+def _count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    cjk = CJK_RE.subn("", text)[1]
+    stripped, words = WORD_RE.subn("", text)
+    letters = len(text) - len(stripped)
+    stripped, digit_runs = DIGITS_RE.subn("", text)
+    digits = len(text) - len(stripped)
+    symbols = SYMBOL_RE.subn("", text)[1]
+    newlines = text.count("\n")
+    return (
+        round(cjk * CJK_TOKENS_PER_CHAR)
+        + max(words, (letters + 3 * words) // 4)
+        + max(digit_runs, (digits + 2 * digit_runs) // 3)
+        + symbols
+        + newlines
+    )
+
+def estimate_tokens(text: str) -> int:
+    key = content_hash(text or "")
+    n = TOKEN_CACHE.get(key)
+    if n is None:
+        n = TOKEN_CACHE.put(key, _count_tokens(text))
+    return n
+
+# ==========================================
+# Per-block report
+# ==========================================
+def token_report(prompt: str, packet_text: str, voice_bank: str, inputs: dict) -> dict:
+    rules = sum(
+        estimate_tokens(block)
+        for block in (
+            no_codeblock_main_output_rules(),
+            voice_priority_rules(voice_bank),
+            state_output_rules(PACKET_SCOPE_FULL),
+            state_output_rules(PACKET_SCOPE_STEP),
+        )
+        if block in prompt
+    )
+    report = {
+        "rules": rules,
+        "packet": estimate_tokens(state_reference_block(packet_text)),
+        "voice_bank": estimate_tokens(voice_bank_block(voice_bank)),
+        "inputs": sum(estimate_tokens(str(v)) for v in inputs.values() if v),
+    }
+    report["template"] = max(estimate_tokens(prompt) - sum(report.values()), 0)
+    report["total"] = estimate_tokens(prompt)
+    return report
+
+def format_token_report(report: dict, budget: int = 0) -> str:
+    line = (
+        f"≈ {report['total']:,} tokens ｜ 規則 {report['rules']:,} ｜ 封包 {report['packet']:,}"
+        f" ｜ Voice Bank {report['voice_bank']:,} ｜ 輸入 {report['inputs']:,} ｜ 模板 {report['template']:,}"
+    )
+    if budget:
+        line += f" ｜ 預算 {budget:,}"
+    if report.get("trimmed"):
+        line += f" ｜ 已壓縮：{', '.join(report['trimmed'])}"
+    return line
+
+# ==========================================
+# Budget enforcement
+# ==========================================
+BUDGET_TRUNCATE = "truncate"
+BUDGET_PLACEHOLDER = "placeholder"
+MIN_BLOCK_TOKENS = 64
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    total = estimate_tokens(text)
+    if total <= max_tokens:
+        return text
+    max_tokens = max(max_tokens, 0)
+    marker = f"\n…【已截斷：省略約 {total - max_tokens:,} tokens】…\n"
+    # The marker is part of the result, so it comes out of the budget too.
+    room = max(max_tokens - _count_tokens(marker), 0)
+    keep = max(int(len(text) * room / total), 0)
+    # Proportional cut, then tighten until the estimate fits (deterministic).
+    # Probes are counted directly: caching every candidate cut would flood TOKEN_CACHE.
+    while keep > 0 and _count_tokens(text[: keep * 2 // 3] + text[len(text) - keep // 3:]) > room:
+        keep = keep * 9 // 10
+    if keep <= 0:
+        return marker.strip()
+    return text[: keep * 2 // 3] + marker + text[len(text) - keep // 3:]
+
+def placeholder_for(label: str, text: str) -> str:
+    return f"【{label}：超出 token 預算已省略（約 {estimate_tokens(text):,} tokens）。如需此內容，請在對話中另行提供或先請求摘要。】"
+
+def _shrink(label: str, text: str, target: int, strategy: str) -> str:
+    if strategy == BUDGET_PLACEHOLDER:
+        return placeholder_for(label, text)
+    return truncate_to_tokens(text, target)
+
+def render_within_budget(
+    step_index: int,
+    packet,
+    voice_bank: str,
+    budget: int = 0,
+    strategy: str = BUDGET_TRUNCATE,
+    packet_scope: str = PACKET_SCOPE_FULL,
+    layout: str = PROMPT_LAYOUT_STEP,
+    use_cache: bool = True,
+    **inputs,
+):
+    """Render a step prompt and shrink its largest blocks until it fits ``budget`` tokens.
+
+    Inputs are shrunk first (largest first), then the voice bank, then the packet.
+    Returns ``(prompt, report)``; results are memoized in PROMPT_CACHE so a rerun
+    that changed nothing relevant reuses the previous prompt string. Batch callers
+    pass ``use_cache=False`` so one-off prompts do not evict interactive ones.
+    """
+    if not use_cache:
+        return _render_within_budget(step_index, packet, voice_bank, budget, strategy, packet_scope, layout, inputs)
+    key = content_hash(
+        "render_within_budget",
+        step_index,
+        packet_digest(packet),
+        voice_bank or "",
+        budget,
+        strategy,
+        packet_scope,
+        layout,
+        sorted(inputs.items()),
+    )
+    cached = PROMPT_CACHE.get(key)
+    if cached is not None:
+        return cached[0], dict(cached[1])
+    prompt, report = _render_within_budget(step_index, packet, voice_bank, budget, strategy, packet_scope, layout, inputs)
+    PROMPT_CACHE.put(key, (prompt, report))
+    return prompt, dict(report)
+
+def _render_within_budget(step_index, packet, voice_bank, budget, strategy, packet_scope, layout, inputs):
+    packet_text = resolve_packet(packet, step_index, packet_scope, inputs.get("article_id", ""))
+    trimmed = []
+
+    def build():
+        prompt = render_resolved_step(step_index, packet_text, voice_bank, packet_scope, layout, **inputs)
+        return prompt, token_report(prompt, packet_text, voice_bank, inputs)
+
+    prompt, report = build()
+    if budget <= 0 or report["total"] <= budget:
+        report["trimmed"] = trimmed
+        return prompt, report
+
+    elastic = sorted(
+        (k for k, v in inputs.items() if k != "article_id" and isinstance(v, str) and v.strip()),
+        key=lambda k: -estimate_tokens(inputs[k]),
+    )
+    candidates = [("input", k) for k in elastic] + [("voice_bank", None), ("packet", None)]
+    for kind, key in candidates:
+        over = report["total"] - budget
+        if over <= 0:
+            break
+        if kind == "input":
+            text = inputs[key]
+        elif kind == "voice_bank":
+            text = voice_bank or ""
+        else:
+            text = packet_text or ""
+        size = estimate_tokens(text)
+        if size <= MIN_BLOCK_TOKENS:
+            continue
+        label = key or kind
+        shrunk = _shrink(label, text, max(size - over, MIN_BLOCK_TOKENS), strategy)
+        if kind == "input":
+            inputs = {**inputs, key: shrunk}
+        elif kind == "voice_bank":
+            voice_bank = shrunk
+        else:
+            packet_text = shrunk
+        trimmed.append(label)
+        prompt, report = build()
+
+    report["trimmed"] = trimmed
+    return prompt, report
+
+# ==========================================
+# Prefix stability
+# ==========================================
+# Provider prompt caches match whole leading token blocks, so what matters
+# between two consecutive prompts is how long their common prefix is.
+def common_prefix_length(a: str, b: str) -> int:
+    # Binary search over slice comparisons: C-speed memcmp instead of a per-char loop.
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def prefix_stability(previous: str, current: str) -> dict:
+    """How much of ``current`` a provider-side prefix cache could reuse from ``previous``."""
+    n = common_prefix_length(previous or "", current or "")
+    shared = estimate_tokens(current[:n]) if n else 0
+    total = estimate_tokens(current or "")
+    return {
+        "chars": n,
+        "tokens": shared,
+        "total_tokens": total,
+        "ratio": shared / total if total else 0.0,
+    }
@@ -0,0 +1,339 @@
+import re
+from dataclasses import dataclass, field
+
+from cache import BLOCK_CACHE, memoize
+from keywords import canonical
+from packet import ProjectPacket
+from prompts import MERGED_VOICE_HEADER, PROJECT_PACKET_TEMPLATE
+
+# ==========================================
+# Voice Bank rule normalizer
+# ==========================================
+# The Voice Bank is parsed into rules filed under the VOICE CONTEXT fields
+# (tone_mix, lexical_rules, do_not, ...). Exact and near-duplicate rules are
+# dropped unless they differ in negation, more/less or a number ("不超過三行" vs
+# "不超過五行"). Rules that contradict the packet's VOICE CONTEXT, opposed
+# pairs included, are resolved locally in the Voice Bank's favour; opposed
+# pairs from one source are both kept and listed. The result is one compact
+# merged spec, so each prompt no longer carries the whole bank plus a request
+# to compare it.
+VOICE_CONTEXT = "VOICE CONTEXT"
+OTHER = "other"
+
+# (name, short label of the packet template field, aliases matched against a rule key)
+FIELDS = (
+    ("worldview", "作者世界觀", ("作者世界觀", "世界觀")),
+    ("reader_stance", "對讀者的定位", ("對讀者的定位", "讀者定位")),
+    ("beliefs", "核心信念/價值觀", ("核心信念", "價值觀")),
+    ("motive", "動機邊界", ("動機邊界", "動機")),
+    ("ambiguity", "允許的模糊與留白", ("允許的模糊", "模糊與留白", "留白")),
+    ("banned", "禁語/禁套路", ("禁語", "禁套路", "禁用詞")),
+    ("tone_mix", "tone_mix（%）", ("tone_mix", "語氣比例", "語氣配比")),
+    ("sentence_rhythm", "sentence_rhythm", ("sentence_rhythm", "句長", "句子節奏", "節奏")),
+    ("stance_rules", "stance_rules", ("stance_rules", "立場")),
+    ("lexical_rules", "lexical_rules", ("lexical_rules", "用詞", "詞彙")),
+    ("structure_rules", "structure_rules", ("structure_rules", "結構", "推理順序")),
+    ("do_not", "do_not", ("do_not", "絕對禁止", "禁止事項", "不要做")),
+    ("sample_lines", "sample_lines", ("sample_lines", "範例句", "例句")),
+    (OTHER, "其他規則", ()),
+)
+FIELD_LABELS = {name: label for name, label, _ in FIELDS}
+PERSONA_FIELDS = ("worldview", "reader_stance", "beliefs", "motive", "ambiguity", "banned")
+# One value per field: a differing value in the Voice Bank replaces the packet's.
+SINGLE_FIELDS = ("worldview", "reader_stance", "tone_mix", "sentence_rhythm")
+NEGATIVE_FIELDS = ("banned", "do_not")
+MAX_SAMPLE_LINES = 5
+
+BULLET_RE = re.compile(r"^[ \t]*(?:[-*•]|\d+[.)、])[ \t]*")
+HEADING_RE = re.compile(r"^\s*(?:#+\s*.*|\[[^\]]+\]|【[^】]+】|===.*===)\s*$")
+KEY_VALUE_RE = re.compile(r"^([^：:\n]{1,40})[：:][ \t]*(.*)$")
+RULE_SPLIT_RE = re.compile(r"[；;\n]+")
+TERM_SPLIT_RE = re.compile(r"[、,，/｜|]+")
+QUOTED_RE = re.compile(r"[「『“\"]([^」』”\"]{1,20})[」』”\"]")
+NEGATIVE_RE = re.compile(r"避免|禁|不要|不得|不用|不使用|別|勿|少用|do.?not", re.I)
+POSITIVE_RE = re.compile(r"常用|偏好|多用|要用|必用|使用|愛用|口頭禪")
+PERCENT_RE = re.compile(r"([^\s\d/／：:、,，%]+?)\s*(\d{1,3})\s*%?")
+MAX_TERM_CHARS = 12
+# Rules are few per field, so near-duplicates are found by exact pairwise
+# Jaccard over character bigrams; rules are shorter and vary more than
+# keywords, hence a lower threshold than keyword clustering.
+RULE_THRESHOLD = 0.5
+_DIGITS = str.maketrans("〇一二三四五六七八九", "0123456789")
+# Similar wording is not the same rule when one of these differs: "結論要留白" vs
+# "結論不要留白", "多用數據" vs "少用數據", "每段不超過三行" vs "每段不超過五行".
+NEGATION_RE = re.compile(r"不|別|勿|避免|禁|無|沒|莫|\b(?:don.?t|not|never|avoid)\b", re.I)
+MORE_RE = re.compile(r"多|增加|提高|加強|常|\bmore\b", re.I)
+LESS_RE = re.compile(r"少|減|降低|\b(?:less|fewer)\b", re.I)
+NUMBER_RE = re.compile(r"\d+")
+
+def _field_for(key: str):
+    key = key.strip().lower()
+    for name, _, aliases in FIELDS:
+        if any(alias.lower() in key for alias in aliases):
+            return name
+    return None
+
+def _is_placeholder(value: str) -> bool:
+    return not value.strip() or "__" in value
+
+def parse_rules(text: str) -> dict:
+    """``{field name: [rule, ...]}`` in first-seen order; unfiled lines go under ``OTHER``."""
+    rules = {}
+    current, indent = None, -1
+    for line in (text or "").splitlines():
+        if not line.strip() or HEADING_RE.match(line):
+            if HEADING_RE.match(line):
+                current, indent = None, -1
+            continue
+        depth = len(line.expandtabs()) - len(line.expandtabs().lstrip())
+        body = BULLET_RE.sub("", line).strip()
+        m = KEY_VALUE_RE.match(body)
+        name = _field_for(m.group(1)) if m else None
+        if name is not None and (current is None or depth <= indent or name != current):
+            current, indent = name, depth
+            value = m.group(2)
+        elif current is not None and depth > indent:
+            value = body
+        else:
+            current, indent = None, -1
+            rules.setdefault(OTHER, []).append(body)
+            continue
+        for rule in RULE_SPLIT_RE.split(value):
+            rule = rule.strip(" 。")
+            if not _is_placeholder(rule):
+                rules.setdefault(current, []).append(rule)
+    return rules
+
+def _template_rules() -> dict:
+    index = ProjectPacket(PROJECT_PACKET_TEMPLATE)
+    return parse_rules(index.section(VOICE_CONTEXT) or "")
+
+# Unfilled template text ("如何下結論/如何留白/如何反問") is not a rule.
+TEMPLATE_RULES = {name: {canonical(r) for r in rules} for name, rules in _template_rules().items()}
+
+def context_rules(packet) -> dict:
+    index = packet if isinstance(packet, ProjectPacket) else ProjectPacket(packet or "")
+    rules = parse_rules(index.section(VOICE_CONTEXT) or "")
+    return {
+        name: kept
+        for name, values in rules.items()
+        if (kept := [r for r in values if canonical(r) not in TEMPLATE_RULES.get(name, ())])
+    }
+
+def rule_terms(name: str, rule: str) -> list:
+    """``[(term, +1 | -1), ...]`` a rule asks to use (+1) or to avoid (-1)."""
+    quoted = QUOTED_RE.findall(rule)
+    m = KEY_VALUE_RE.match(rule)
+    head, tail = (m.group(1), m.group(2)) if m else ("", rule)
+    if name in NEGATIVE_FIELDS:
+        polarity = -1
+    elif NEGATIVE_RE.search(head or rule):
+        polarity = -1
+    elif POSITIVE_RE.search(head or rule):
+        polarity = 1
+    else:
+        return []
+    if quoted:
+        terms = quoted
+    elif m or name in NEGATIVE_FIELDS:
+        terms = [t.strip() for t in TERM_SPLIT_RE.split(tail)]
+    else:
+        return []
+    return [(t, polarity) for t in terms if t and len(t) <= MAX_TERM_CHARS]
+
+def _rule_key(rule: str) -> str:
+    return canonical(rule).translate(_DIGITS)
+
+def _bigrams(key: str) -> set:
+    return {key[i:i + 2] for i in range(len(key) - 1)} or {key}
+
+def _rule_marks(key: str) -> tuple:
+    """``(negated, more/less directions, numbers)`` of a rule key."""
+    directions = frozenset(sign for sign, pattern in ((1, MORE_RE), (-1, LESS_RE)) if pattern.search(key))
+    return bool(NEGATION_RE.search(key)), directions, tuple(NUMBER_RE.findall(key))
+
+def _opposition(first: tuple, second: tuple) -> str:
+    """Why two similar rules are not duplicates; "" when their marks agree."""
+    if first[0] != second[0]:
+        return "一條肯定、一條否定"
+    if first[1] != second[1]:
+        return "多寡方向不同"
+    if first[2] != second[2]:
+        return f"數值不同（{'/'.join(first[2]) or '無'} vs {'/'.join(second[2]) or '無'}）"
+    return ""
+
+def dedupe_rules(rules: list, threshold: float = RULE_THRESHOLD) -> tuple:
+    """``(kept, opposed)``: the first of each group of (near-)duplicate rules, in order, and
+    ``[(earlier, later, reason), ...]`` for similar pairs that say opposite things (both kept)."""
+    kept, seen, opposed = [], [], []
+    for rule in rules:
+        key = _rule_key(rule)
+        grams, marks = _bigrams(key), _rule_marks(key)
+        pairs, duplicate = [], False
+        for other, other_grams, other_marks in seen:
+            if len(grams & other_grams) < threshold * len(grams | other_grams):
+                continue
+            reason = _opposition(other_marks, marks)
+            if not reason:
+                duplicate = True
+                break
+            pairs.append((other, rule, reason))
+        if duplicate:
+            continue
+        kept.append(rule)
+        seen.append((rule, grams, marks))
+        opposed += pairs
+    return kept, opposed
+
+def _without_terms(rule: str, terms: set) -> str:
+    """``rule`` minus the listed terms that clash; "" when nothing is left of it."""
+    m = KEY_VALUE_RE.match(rule)
+    if m is None:
+        return ""
+    rest = [t.strip() for t in TERM_SPLIT_RE.split(m.group(2)) if t.strip() and canonical(t) not in terms]
+    return f"{m.group(1)}：{'、'.join(rest)}" if rest else ""
+
+def tone_mix(value: str) -> dict:
+    return {label.strip("（）() "): int(pct) for label, pct in PERCENT_RE.findall(value or "")}
+
+@dataclass
+class VoiceConflict:
+    name: str     # field name
+    bank: str     # Voice Bank rule (kept)
+    context: str  # VOICE CONTEXT rule (dropped, or trimmed to its other terms)
+    reason: str
+
+    def __str__(self):
+        return f"{FIELD_LABELS[self.name]}：VOICE BANK「{self.bank}」vs 封包「{self.context}」→ {self.reason}"
+
+@dataclass
+class OpposedRules:
+    name: str    # field name
+    first: str
+    second: str
+    source: str  # "VOICE BANK" or "封包"; pairs across the two are VoiceConflicts instead
+    reason: str
+
+    def __str__(self):
+        return f"{FIELD_LABELS[self.name]}：{self.source}「{self.first}」vs「{self.second}」→ {self.reason}，兩條都保留"
+
+@dataclass
+class VoiceMerge:
+    rules: dict = field(default_factory=dict)
+    conflicts: list = field(default_factory=list)
+    opposed: list = field(default_factory=list)
+    bank_rules: int = 0
+    context_rules: int = 0
+    duplicates: int = 0
+
+    @property
+    def merged_rules(self) -> int:
+        return sum(len(rules) for rules in self.rules.values())
+
+def _single_conflicts(name: str, bank: list, context: list) -> list:
+    if not (bank and context) or canonical(bank[0]) == canonical(context[0]):
+        return []
+    if name == "tone_mix":
+        ours, theirs = tone_mix(" ".join(bank)), tone_mix(" ".join(context))
+        if ours and theirs and all(theirs.get(k, v) == v for k, v in ours.items()):
+            return []
+    return [VoiceConflict(name, "；".join(bank), "；".join(context), "採用 VOICE BANK")]
+
+def merge_voice(bank_text: str, packet) -> VoiceMerge:
+    bank, context = parse_rules(bank_text), context_rules(packet)
+    merge = VoiceMerge(
+        bank_rules=sum(map(len, bank.values())),
+        context_rules=sum(map(len, context.values())),
+    )
+    polarity = {}
+    for name, rules in bank.items():
+        for rule in rules:
+            for term, sign in rule_terms(name, rule):
+                polarity.setdefault(canonical(term), (sign, name, rule))
+
+    for name, _, _ in FIELDS:
+        ours, theirs = bank.get(name, []), context.get(name, [])
+        if name in SINGLE_FIELDS and ours:
+            merge.conflicts += _single_conflicts(name, ours, theirs)
+            theirs = []
+        kept = []
+        for rule in theirs:
+            clashes = [
+                (key, polarity[key]) for term, sign in rule_terms(name, rule)
+                if (key := canonical(term)) in polarity and polarity[key][0] != sign
+            ]
+            for key, (sign, _, bank_rule) in clashes:
+                reason = "VOICE BANK 要求使用，封包列為避免" if sign > 0 else "VOICE BANK 列為避免，封包要求使用"
+                merge.conflicts.append(VoiceConflict(name, bank_rule, rule, f"{reason}，採用 VOICE BANK"))
+            if clashes:
+                # Keep the rest of a term list; only the clashing terms go.
+                rule = _without_terms(rule, {key for key, _ in clashes})
+            if rule:
+                kept.append(rule)
+        candidates = ours + kept
+        if not candidates:
+            continue
+        # Voice Bank rules come first, so each group keeps the bank's wording
+        # and in an opposed pair across the two sources the bank rule is first.
+        unique, opposed = dedupe_rules(candidates)
+        merge.duplicates += len(candidates) - len(unique)
+        source = {rule: "封包" for rule in kept} | {rule: "VOICE BANK" for rule in ours}
+        overruled = set()
+        for first, second, reason in opposed:
+            if source[first] != source[second]:
+                merge.conflicts.append(VoiceConflict(name, first, second, f"{reason}，採用 VOICE BANK"))
+                overruled.add(second)
+        unique = [rule for rule in unique if rule not in overruled]
+        merge.opposed += [
+            OpposedRules(name, first, second, source[first], reason)
+            for first, second, reason in opposed
+            if source[first] == source[second] and not {first, second} & overruled
+        ]
+        if name == "sample_lines":
+            unique = unique[:MAX_SAMPLE_LINES]
+        merge.rules[name] = unique
+    return merge
+
+def format_voice_spec(merge: VoiceMerge) -> str:
+    lines = [MERGED_VOICE_HEADER]
+    groups = (
+        ("[PERSONA LOG]", PERSONA_FIELDS),
+        ("[VOICE SPEC]", tuple(n for n, _, _ in FIELDS if n not in PERSONA_FIELDS and n != OTHER)),
+        ("[其他規則]", (OTHER,)),
+    )
+    for heading, names in groups:
+        present = [n for n in names if merge.rules.get(n)]
+        if not present:
+            continue
+        lines.append(heading)
+        for name in present:
+            rules = merge.rules[name]
+            if name == OTHER:
+                lines += [f"- {rule}" for rule in rules]
+            elif len(rules) == 1:
+                lines.append(f"- {FIELD_LABELS[name]}：{rules[0]}")
+            else:
+                lines.append(f"- {FIELD_LABELS[name]}：")
+                lines += [f"  - {rule}" for rule in rules]
+    if merge.conflicts:
+        lines.append("[已處理的衝突（以 VOICE BANK 為準）]")
+        lines += [f"- {conflict}" for conflict in merge.conflicts]
+    if merge.opposed:
+        lines.append("[相近但相反的規則（未合併；依段落情境擇一套用）]")
+        lines += [f"- {pair}" for pair in merge.opposed]
+    return "\n".join(lines)
+
+@memoize(BLOCK_CACHE)
+def compact_voice_bank(bank_text: str, voice_context: str) -> tuple:
+    """``(merged spec, merge)`` for a Voice Bank against a packet's VOICE CONTEXT section.
+
+    An empty bank stays empty so prompts fall back to "（未提供）".
+    """
+    if not (bank_text or "").strip():
+        return "", VoiceMerge()
+    merge = merge_voice(bank_text, voice_context)
+    return format_voice_spec(merge), merge
+
+def voice_context_block(packet) -> str:
+    index = packet if isinstance(packet, ProjectPacket) else ProjectPacket(packet or "")
+    return index.section_block(VOICE_CONTEXT) or ""
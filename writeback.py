@@ -0,0 +1,185 @@
+import re
+from dataclasses import dataclass, field
+
+from packet import ARTICLE_CARDS_HEADER, CONTENT_QUEUE, SECTION_OPEN_RE, ProjectPacket
+from prompts import ARTICLE_CARD, PROJECT_PACKET_TEMPLATE, STEP_PACKET_SECTIONS
+
+# ==========================================
+# Packet write-back from an LLM response
+# ==========================================
+# The response is scanned once, line by line, as it arrives: only the code
+# block currently open and the last complete block that contains packet
+# section markers are held, never the whole response. That block is checked
+# against the PROJECT_PACKET_TEMPLATE sections and merged into the stored
+# packet section by section (card by card for single-card steps).
+FENCE_RE = re.compile(r"^[ \t]{0,3}(`{3,}|~{3,})([^`]*)$")
+TEMPLATE_SECTIONS = tuple(ProjectPacket(PROJECT_PACKET_TEMPLATE).sections)
+
+class PacketBlockScanner:
+    def __init__(self):
+        self.block = None       # last complete code block holding packet sections
+        self.truncated = False  # the response ended inside a packet code block
+        self._partial = ""      # incomplete trailing line of the last chunk
+        self._fence = None      # opening fence of the block being read
+        self._lines = []
+        self._has_marker = False
+
+    def feed(self, chunk: str):
+        data = self._partial + (chunk or "")
+        lines = data.split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._line(line)
+
+    def close(self):
+        if self._partial:
+            self._line(self._partial)
+            self._partial = ""
+        if self._fence is not None and self._has_marker:
+            # Keep what arrived so the check can name the unclosed sections.
+            self.block = "\n".join(self._lines) + "\n"
+            self.truncated = True
+        self._fence = None
+        return self.block
+
+    def _line(self, line: str):
+        line = line.rstrip("\r")
+        m = FENCE_RE.match(line)
+        if self._fence is None:
+            if m:
+                self._fence = m.group(1)
+                self._lines = []
+                self._has_marker = False
+            return
+        if m and m.group(1)[0] == self._fence[0] and len(m.group(1)) >= len(self._fence) and not m.group(2).strip():
+            if self._has_marker:
+                self.block = "\n".join(self._lines) + "\n"
+                self.truncated = False
+            self._fence = None
+            self._lines = []
+            return
+        self._lines.append(line)
+        if not self._has_marker and SECTION_OPEN_RE.match(line):
+            self._has_marker = True
+
+def extract_packet_block(chunks):
+    """Return ``(block, truncated)`` for an iterable of response chunks (or a single string)."""
+    scanner = PacketBlockScanner()
+    for chunk in [chunks] if isinstance(chunks, str) else chunks:
+        scanner.feed(chunk)
+    return scanner.close(), scanner.truncated
+
+# ==========================================
+# Validation
+# ==========================================
+@dataclass
+class PacketCheck:
+    sections: list = field(default_factory=list)
+    cards: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+    warnings: list = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+def _expected_sections(step_index) -> set:
+    names = STEP_PACKET_SECTIONS.get(step_index, TEMPLATE_SECTIONS)
+    return {CONTENT_QUEUE if name == ARTICLE_CARD else name for name in names}
+
+def check_packet_block(block, truncated: bool = False, partial: bool = False, step_index=None) -> PacketCheck:
+    """Check a returned packet block against the template.
+
+    ``partial`` accepts a subset of sections (step-scoped prompts); sections
+    outside what ``step_index`` embeds are then flagged as warnings.
+    """
+    check = PacketCheck()
+    if block is None:
+        check.errors.append("回覆中找不到含封包區塊標記（=== [區塊] ===）的 code block。")
+        return check
+    index = ProjectPacket(block)
+    check.sections = list(index.sections)
+    check.cards = [c.article_id for c in index.card_list]
+    if truncated:
+        check.errors.append("封包 code block 沒有結束（回覆可能被截斷）。")
+    opened = []
+    for m in SECTION_OPEN_RE.finditer(block):
+        name = m.group(1).strip()
+        if name not in opened:
+            opened.append(name)
+    unclosed = [name for name in opened if name not in index.sections]
+    if unclosed:
+        check.errors.append(f"區塊未關閉：{'、'.join(unclosed)}")
+    if not index.sections and not unclosed:
+        check.errors.append("code block 內沒有完整的封包區塊。")
+    unknown = [name for name in index.sections if name not in TEMPLATE_SECTIONS]
+    if unknown:
+        check.warnings.append(f"模板外的區塊（會原樣附加）：{'、'.join(unknown)}")
+    if partial:
+        if step_index is not None:
+            extra = [n for n in index.sections if n in TEMPLATE_SECTIONS and n not in _expected_sections(step_index)]
+            if extra:
+                check.warnings.append(f"超出本步驟範圍的區塊：{'、'.join(extra)}")
+    else:
+        missing = [name for name in TEMPLATE_SECTIONS if name not in index.sections and name not in unclosed]
+        if missing:
+            check.errors.append(f"完整封包缺少區塊：{'、'.join(missing)}")
+    duplicates = sorted({aid for aid in check.cards if check.cards.count(aid) > 1})
+    if duplicates:
+        check.warnings.append(f"重複的文章ID：{'、'.join(duplicates)}")
+    return check
+
+# ==========================================
+# Section / card merge
+# ==========================================
+def _block(text: str) -> str:
+    return text if text.endswith("\n") else text + "\n"
+
+def _merge_cards(stored: ProjectPacket, update: ProjectPacket, edits: list) -> list:
+    queue = stored.sections[CONTENT_QUEUE]
+    new_cards = []
+    changed = []
+    for card in update.card_list:
+        text = _block(update.text[card.start:card.end].rstrip("\n"))
+        old = stored.cards.get(card.article_id)
+        if old is None:
+            new_cards.append(text)
+        elif _block(stored.text[old.start:old.end].rstrip("\n")) != text:
+            edits.append((old.start, old.end, text))
+        else:
+            continue
+        changed.append(card.article_id)
+    if new_cards:
+        header = "" if stored.cards_start >= 0 else ARTICLE_CARDS_HEADER + "\n"
+        edits.append((queue.body_end, queue.body_end, header + "".join(new_cards)))
+    return changed
+
+def merge_packet(stored, update, card_merge: bool = False):
+    """Splice the sections of ``update`` into ``stored``.
+
+    Sections missing from ``update`` are left alone; unknown sections are
+    appended. With ``card_merge`` a returned CONTENT QUEUE only replaces or adds
+    the article cards it contains. Returns ``(text, changed_names)``.
+    """
+    stored = stored if isinstance(stored, ProjectPacket) else ProjectPacket(stored or "")
+    update = update if isinstance(update, ProjectPacket) else ProjectPacket(update or "")
+    edits = []
+    appended = []
+    changed = []
+    for name, section in update.sections.items():
+        new_block = _block(update.text[section.start:section.end])
+        old = stored.sections.get(name)
+        if old is None:
+            appended.append(new_block)
+            changed.append(name)
+        elif card_merge and name == CONTENT_QUEUE and update.cards_start >= 0:
+            changed += [f"{CONTENT_QUEUE}/{aid}" for aid in _merge_cards(stored, update, edits)]
+        elif stored.text[old.start:old.end] != new_block:
+            edits.append((old.start, old.end, new_block))
+            changed.append(name)
+    text = stored.text
+    for start, end, replacement in sorted(edits, key=lambda e: (e[0], e[1]), reverse=True):
+        text = text[:start] + replacement + text[end:]
+    if appended:
+        text = _block(text.rstrip("\n")) + "\n" + "\n".join(appended)
+    return text, changed